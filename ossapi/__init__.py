@@ -5,7 +5,7 @@ logging.getLogger("ossapi").addHandler(handler)
 
 from ossapi.ossapi import (Ossapi, ReplayUnavailableException,
     InvalidKeyException, APIException)
-from ossapi.ossapiv2 import OssapiV2, Grant, Scope
+from ossapi.ossapiv2 import OssapiV2, Grant, Scope, NotFoundError
 from ossapi.models import (Beatmap, BeatmapCompact, BeatmapUserScore,
     ForumTopicAndPosts, Search, CommentBundle, Cursor, Score,
     BeatmapsetSearchResult, ModdingHistoryEventsBundle, User, Rankings,
@@ -22,7 +22,25 @@ from ossapi.enums import (GameMode, ScoreType, RankingFilter, RankingType,
 from ossapi.mod import Mod
 from ossapi.replay import Replay
 from ossapi.version import __version__
-from ossapi.encoder import ModelEncoder, serialize_model
+from ossapi.encoder import (ModelEncoder, serialize_model, deserialize_model,
+    write_dump, read_dump)
+from ossapi.binary import pack_model, unpack_model
+from ossapi.circuitbreaker import (CircuitBreaker, CircuitState,
+    CircuitOpenError)
+from ossapi.hedging import HedgingPolicy
+from ossapi.concurrency import AIMDLimiter
+from ossapi.coalescing import RequestCoalescer
+from ossapi.transport import (Transport, SessionTransport, Urllib3Transport,
+    HttpxTransport)
+from ossapi.middleware import Middleware, Request, BandwidthCounter
+from ossapi.cache import ResponseCache, SQLiteCache, CacheMissError
+from ossapi.entities import EntityStore
+from ossapi.indexes import BeatmapIndex, IndexedBeatmap, UsernameIndex
+from ossapi.digests import DigestCache
+from ossapi.invalidation import EventInvalidator
+from ossapi.archive import ResponseArchive, ArchiveMissError
+from ossapi.backends import (CacheBackend, MemoryBackend, SQLiteBackend,
+    RedisBackend)
 
 from oauthlib.oauth2 import AccessDeniedError, TokenExpiredError
 from oauthlib.oauth2.rfc6749.errors import InsufficientScopeError
@@ -51,7 +69,22 @@ __all__ = [
     "BeatmapsetDiscussionVoteSort", "BeatmapsetStatus", "MessageType",
     # OssapiV2 exceptions
     "AccessDeniedError", "TokenExpiredError", "InsufficientScopeError",
+    "CircuitOpenError", "NotFoundError", "ArchiveMissError",
+    "CacheMissError",
+    # OssapiV2 resilience
+    "CircuitBreaker", "CircuitState", "HedgingPolicy", "AIMDLimiter",
+    "RequestCoalescer",
+    # OssapiV2 caching
+    "ResponseCache", "SQLiteCache", "CacheBackend", "MemoryBackend",
+    "SQLiteBackend", "RedisBackend", "EntityStore", "BeatmapIndex",
+    "IndexedBeatmap", "UsernameIndex", "ResponseArchive", "DigestCache",
+    "EventInvalidator",
+    # OssapiV2 transports
+    "Transport", "SessionTransport", "Urllib3Transport", "HttpxTransport",
+    # OssapiV2 middleware
+    "Middleware", "Request", "BandwidthCounter",
     # misc
     "Mod", "Replay", "__version__", "ModelEncoder",
-    "serialize_model"
+    "serialize_model", "deserialize_model", "write_dump", "read_dump",
+    "pack_model", "unpack_model"
 ]
@@ -0,0 +1,406 @@
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import threading
+import logging
+import sqlite3
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi.middleware import Middleware, Request
+from ossapi.transport import Response
+from ossapi.binary import CONTENT_TYPE as PACKED_CONTENT_TYPE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ArchiveMissError(LookupError):
+    """
+    Raised when replaying from a ``ResponseArchive`` a request which wasn't
+    archived at or before the time being replayed.
+    """
+    def __init__(self, request, at):
+        self.request = request
+        self.at = at
+        when = datetime.fromtimestamp(at) if at is not None else "now"
+        super().__init__(f"no response to {request} was archived at or before "
+            f"{when}")
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class ResponseArchive(Middleware):
+    """
+    A long term archive of raw api responses, stored in a SQLite database and
+    compressed with a zstd dictionary trained on earlier responses.
+
+    A single json response compresses poorly on its own, since most of what
+    it has in common with other responses (attribute names, enum values,
+    urls) appears only once in it. A dictionary trained on a sample of
+    responses holds exactly those common parts, and compressing with it
+    shrinks a typical response several times further than plain zstd does.
+    Until ``train_after`` responses have been archived, responses are
+    compressed without a dictionary. A dictionary is then trained on them in
+    the background, with responses still compressed without one until it's
+    ready, and used for every response archived after that. Call ``train`` to
+    train a new dictionary if the api's responses change, and ``recompress``
+    to compress the responses archived before it with it. Every dictionary
+    ever used is kept, so every response can always be read back.
+
+    When passed as ``OssapiV2``'s ``archive`` parameter, every successful
+    ``GET`` response the client receives from the api (but not the responses
+    answered by its cache or entity store) is archived, along with the
+    endpoint, url, and parameters of its request and when it was received.
+    Archived responses can be read back by url and parameters with ``get``
+    and ``history``, or by replaying requests with ``at``:
+
+    .. code-block:: python
+
+        with archive.at(datetime(2022, 1, 1)):
+            # the response which was archived most recently before 2022
+            rankings = api.ranking("osu", RankingType.PERFORMANCE)
+
+    Requires zstandard (``pip install ossapi[compression]``).
+
+    Parameters
+    ----------
+    path: str or Path
+        Where to keep the archive, as a SQLite database. It is created if it
+        doesn't exist.
+    endpoints: set
+        The names of the endpoints (eg ``"ranking"``) whose responses to
+        archive. Defaults to every endpoint.
+    level: int
+        The zstd compression level to compress responses with.
+    train_after: int
+        How many responses to archive before training the first dictionary on
+        them. Pass ``None`` to only train dictionaries by calling ``train``.
+    dictionary_size: int
+        The size in bytes of the dictionaries to train.
+    """
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS dictionaries (
+            id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            url TEXT NOT NULL,
+            query TEXT NOT NULL,
+            archived_at REAL NOT NULL,
+            dictionary INTEGER,
+            size INTEGER NOT NULL,
+            body BLOB NOT NULL
+        )""",
+        """CREATE INDEX IF NOT EXISTS responses_request ON responses (url,
+            query, archived_at)""",
+        """CREATE INDEX IF NOT EXISTS responses_endpoint ON responses
+            (endpoint, archived_at)"""
+    ]
+    # how many of the most recent responses to train dictionaries on
+    TRAINING_SAMPLES = 2000
+
+    def __init__(self, path, *, endpoints=None, level=9, train_after=1000,
+        dictionary_size=112 * 1024):
+        if zstandard is None:
+            raise ImportError("ResponseArchive requires zstandard. Install it "
+                "with `pip install ossapi[compression]`")
+        self.path = Path(path)
+        self.endpoints = set(endpoints) if endpoints is not None else None
+        self.level = level
+        self.train_after = train_after
+        self.dictionary_size = dictionary_size
+
+        self.archived = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.replays = 0
+        self._lock = threading.Lock()
+        # compressors aren't thread safe, so every thread gets its own. This
+        # also holds the time being replayed in this thread, if any.
+        self._local = threading.local()
+        # dictionary id to ``zstandard.ZstdCompressionDict``
+        self._dictionaries = {}
+        self.log = logging.getLogger(__name__)
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+            isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            self._db.execute(statement)
+        rows = self._db.execute("SELECT id, data FROM dictionaries").fetchall()
+        for dictionary_id, data in rows:
+            self._dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(
+                data)
+        # new responses are compressed with the newest dictionary
+        self._dictionary_id = max(self._dictionaries, default=None)
+        # how many responses were archived without a dictionary, for deciding
+        # when to train the first one
+        self._untrained = 0
+        # the thread training the first dictionary, if it was started
+        self._trainer = None
+        if self._dictionary_id is None:
+            self._untrained = len(self)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+
+    def _dictionary(self, dictionary_id):
+        if dictionary_id is None:
+            return None
+        if dictionary_id not in self._dictionaries:
+            # trained by another process sharing this archive
+            with self._lock:
+                (data,) = self._db.execute("SELECT data FROM dictionaries "
+                    "WHERE id = ?", [dictionary_id]).fetchone()
+            self._dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(
+                data)
+        return self._dictionaries[dictionary_id]
+
+    def _compressor(self, dictionary_id):
+        compressors = self._local.__dict__.setdefault("compressors", {})
+        if dictionary_id not in compressors:
+            dictionary = self._dictionary(dictionary_id)
+            compressors[dictionary_id] = zstandard.ZstdCompressor(
+                level=self.level, dict_data=dictionary)
+        return compressors[dictionary_id]
+
+    def _decompressor(self, dictionary_id):
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if dictionary_id not in decompressors:
+            dictionary = self._dictionary(dictionary_id)
+            decompressors[dictionary_id] = zstandard.ZstdDecompressor(
+                dict_data=dictionary)
+        return decompressors[dictionary_id]
+
+    @staticmethod
+    def _query(params):
+        # the same query ``Request.key`` uses, so parameters which don't change
+        # the request (like ``None``) don't change where it's archived either
+        return Request("GET", "", params, {}, None).key[2]
+
+    def add(self, endpoint, url, params, content, archived_at=None):
+        """
+        Archives ``content``, the body of the response to a request to
+        ``url`` (relative to ``OssapiV2.BASE_URL``) with query parameters
+        ``params``, made by ``endpoint``. ``archived_at`` is when the response
+        was received, as a unix timestamp or ``datetime``, and defaults to now.
+        """
+        if archived_at is None:
+            archived_at = time.time()
+        archived_at = _timestamp(archived_at)
+        query = self._query(params)
+        dictionary_id = self._dictionary_id
+        body = self._compressor(dictionary_id).compress(content)
+        with self._lock:
+            self._db.execute("INSERT INTO responses (endpoint, url, query, "
+                "archived_at, dictionary, size, body) VALUES (?, ?, ?, ?, ?, "
+                "?, ?)", [endpoint, url, query, archived_at, dictionary_id,
+                len(content), body])
+            self.archived += 1
+            self.raw_bytes += len(content)
+            self.compressed_bytes += len(body)
+            self._untrained += 1
+            train = (self.train_after is not None and
+                self._dictionary_id is None and self._trainer is None and
+                self._untrained >= self.train_after)
+            if train:
+                # training takes a while, and shouldn't hold up the request
+                # which happened to reach ``train_after``
+                self._trainer = threading.Thread(target=self._train_first,
+                    name="ossapi-archive-train", daemon=True)
+        if train:
+            self._trainer.start()
+
+    def _train_first(self):
+        try:
+            self.train()
+        except zstandard.ZstdError as e:
+            # eg if the responses are too few or too small to train on
+            self.log.warning(f"failed to train a dictionary for the response "
+                f"archive: {e!r}")
+            self.train_after = None
+
+    def train(self, samples=None):
+        """
+        Trains a new dictionary on the ``samples`` (a list of response
+        bodies), or on the ``TRAINING_SAMPLES`` most recently archived
+        responses if not passed, and compresses every response archived from
+        now on with it. Returns the id of the new dictionary.
+        """
+        if samples is None:
+            with self._lock:
+                rows = self._db.execute("SELECT dictionary, body FROM "
+                    "responses ORDER BY id DESC LIMIT ?",
+                    [self.TRAINING_SAMPLES]).fetchall()
+            samples = [self._decompressor(dictionary_id).decompress(body) for
+                dictionary_id, body in rows]
+        dictionary = zstandard.train_dictionary(self.dictionary_size, samples,
+            level=self.level)
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO dictionaries (data, "
+                "created_at) VALUES (?, ?)", [dictionary.as_bytes(),
+                time.time()])
+            dictionary_id = cursor.lastrowid
+            self._dictionaries[dictionary_id] = dictionary
+            self._dictionary_id = dictionary_id
+        return dictionary_id
+
+    def recompress(self, *, batch_size=500):
+        """
+        Compresses every response which wasn't compressed with the newest
+        dictionary with it, and returns how many responses were compressed
+        again.
+        """
+        dictionary_id = self._dictionary_id
+        if dictionary_id is None:
+            return 0
+        count = 0
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute("SELECT id, dictionary, body FROM "
+                    "responses WHERE id > ? AND dictionary IS NOT ? ORDER BY "
+                    "id LIMIT ?", [last_id, dictionary_id, batch_size]
+                    ).fetchall()
+            if not rows:
+                return count
+            updates = []
+            for row_id, old_id, body in rows:
+                content = self._decompressor(old_id).decompress(body)
+                body = self._compressor(dictionary_id).compress(content)
+                updates.append([dictionary_id, body, row_id])
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.executemany("UPDATE responses SET dictionary = ?, "
+                    "body = ? WHERE id = ?", updates)
+                self._db.execute("COMMIT")
+            count += len(rows)
+            last_id = rows[-1][0]
+
+    def _response(self, url, query, archived_at, dictionary_id, body):
+        content = self._decompressor(dictionary_id).decompress(body)
+        headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        return Response(200, headers, content, f"{url}?{query}" if query else
+            url, received_at=archived_at)
+
+    def get(self, url, params={}, *, at=None):
+        """
+        The ``Response`` to a ``GET`` request to ``url`` (relative to
+        ``OssapiV2.BASE_URL``, eg ``"/users/12092800/osu"``) with query
+        parameters ``params`` which was archived most recently at or before
+        ``at`` (a unix timestamp or ``datetime``), or ``None`` if there isn't
+        one. ``at`` defaults to now.
+        """
+        query = self._query(params)
+        at = _timestamp(at)
+        with self._lock:
+            row = self._db.execute("SELECT archived_at, dictionary, body FROM "
+                "responses WHERE url = ? AND query = ? AND archived_at <= ? "
+                "ORDER BY archived_at DESC LIMIT 1", [url, query,
+                at if at is not None else float("inf")]).fetchone()
+        if row is None:
+            return None
+        return self._response(url, query, *row)
+
+    def history(self, url, params={}, *, since=None, until=None):
+        """
+        Every archived ``Response`` to a ``GET`` request to ``url`` with
+        query parameters ``params``, as ``(archived_at, response)`` pairs,
+        oldest first. ``since`` and ``until`` (unix timestamps or
+        ``datetime``) limit which responses are included.
+        """
+        query = self._query(params)
+        since = _timestamp(since)
+        until = _timestamp(until)
+        with self._lock:
+            rows = self._db.execute("SELECT archived_at, dictionary, body FROM "
+                "responses WHERE url = ? AND query = ? AND archived_at >= ? "
+                "AND archived_at <= ? ORDER BY archived_at", [url, query,
+                since if since is not None else float("-inf"),
+                until if until is not None else float("inf")]).fetchall()
+        for archived_at, dictionary_id, body in rows:
+            yield (archived_at, self._response(url, query, archived_at,
+                dictionary_id, body))
+
+    @contextmanager
+    def at(self, when=None):
+        """
+        Replays every request made (in this thread) by the client this archive
+        belongs to inside the ``with`` block from the archive, as of ``when``
+        (a unix timestamp or ``datetime``, defaulting to now). Each request is
+        answered with the response to it which was archived most recently at
+        or before ``when``, and decoded like any other response. Requests which
+        weren't archived by then raise ``ArchiveMissError``.
+
+        Replayed requests don't pass through the client's middleware, so
+        neither its cache nor its entity store answer them with (or keep) data
+        from another time.
+        """
+        previous = getattr(self._local, "at", None)
+        self._local.at = (_timestamp(when),)
+        try:
+            yield
+        finally:
+            self._local.at = previous
+
+    @property
+    def replaying(self):
+        """
+        Whether requests made in this thread should be replayed from the
+        archive (see ``at``).
+        """
+        return getattr(self._local, "at", None) is not None
+
+    def replay(self, request):
+        """
+        The archived response to ``request``, as of the time being replayed in
+        this thread.
+        """
+        (at,) = self._local.at
+        response = self.get(request.url, request.params, at=at)
+        if response is None:
+            raise ArchiveMissError(request, at)
+        with self._lock:
+            self.replays += 1
+        return response
+
+    def archivable(self, request):
+        """
+        Whether responses to ``request`` should be archived.
+        """
+        return request.method == "GET" and (self.endpoints is None or
+            request.endpoint in self.endpoints)
+
+    def __call__(self, request, next_):
+        response = next_(request)
+        if (response.status_code == 200 and self.archivable(request) and
+            response.headers.get("Content-Type") != PACKED_CONTENT_TYPE):
+            self.add(request.endpoint, request.url, request.params,
+                response.content)
+        return response
+
+    def close(self):
+        if self._trainer is not None:
+            self._trainer.join()
+        self._db.close()
+
+    def metrics(self):
+        return {
+            "archive_responses": self.archived,
+            "archive_raw_bytes": self.raw_bytes,
+            "archive_compressed_bytes": self.compressed_bytes,
+            "archive_replays": self.replays
+        }
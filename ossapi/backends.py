@@ -0,0 +1,581 @@
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import logging
+import sqlite3
+import socket
+import time
+
+
+class CacheBackend:
+    """
+    Where a cache (like ``ResponseCache``) keeps its values.
+
+    Keys are strings. Every value is stored with a ttl in seconds, after which
+    the backend may forget it. Backends may also forget values before their ttl
+    is up, eg to stay under a size limit.
+
+    Backends which keep values in this process (like ``MemoryBackend``) can
+    store any object. Every other backend stores ``bytes`` only, and sets
+    ``BYTES_ONLY``.
+    """
+    BYTES_ONLY = True
+    # how many values were forgotten to make room for others
+    evictions = 0
+
+    def get(self, key):
+        """
+        The value stored under ``key``, or ``None`` if there isn't one.
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def get_many(self, keys):
+        """
+        A list of the values stored under each of ``keys``, with ``None`` for
+        keys which have no value.
+        """
+        return [self.get(key) for key in keys]
+
+    def set_many(self, values, ttl):
+        """
+        Stores every value in the dict ``values`` under its key.
+        """
+        for key, value in values.items():
+            self.set(key, value, ttl)
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def keys(self):
+        """
+        Every key with a value stored under it, in no particular order.
+        """
+        raise NotImplementedError()
+
+    @property
+    def size(self):
+        """
+        The total size in bytes of the stored values, or ``None`` if unknown.
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Stores values in memory, evicting the least recently used values once they
+    take up more than ``max_size`` bytes, as measured by ``len(value)``.
+    """
+    BYTES_ONLY = False
+
+    def __init__(self, *, max_size=64 * 1024 * 1024):
+        self.max_size = max_size
+        self.evictions = 0
+        self._size = 0
+        # key to ``(value, size, expires_at)``
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            value, _, expires_at = item
+            if time.time() >= expires_at:
+                self._remove(key)
+                return None
+            self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = len(value)
+        with self._lock:
+            self._remove(key)
+            self._values[key] = (value, size, time.time() + ttl)
+            self._size += size
+            while self._size > self.max_size and self._values:
+                _, (_, evicted_size, _) = self._values.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._size = 0
+
+    def keys(self):
+        now = time.time()
+        with self._lock:
+            return [key for key, (_, _, expires_at) in self._values.items() if
+                now < expires_at]
+
+    def _remove(self, key):
+        item = self._values.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Stores values in a SQLite database on disk, so they survive restarts and
+    can be shared between processes.
+
+    The database is opened in WAL mode, so any number of processes (and
+    threads) on the same host can read from and write to it at once. Reads
+    never take a write lock. The least recently used values are evicted once
+    they take up more than ``max_size`` bytes. When a value was last used is
+    only written to the database every ``TOUCH_BATCH`` reads (or on the next
+    write), so recency is approximate across processes.
+
+    If the database can't be read from or written to (eg the disk is full, or
+    another process held its lock for longer than ``BUSY_TIMEOUT``), the error
+    is logged and the read is treated as a miss, or the write skipped, rather
+    than failing the request.
+
+    Parameters
+    ----------
+    path: str or Path
+        The path to the database file. It is created if it doesn't exist.
+    max_size: int
+        The maximum total size in bytes of the stored values.
+    """
+    # how long in seconds to wait for another process to release its lock on
+    # the database before giving up.
+    BUSY_TIMEOUT = 30
+    # how many reads to remember the time of before writing them to the
+    # database in one transaction
+    TOUCH_BATCH = 100
+    # how many keys to look up in a single query
+    _MAX_VARIABLES = 500
+
+    def __init__(self, path, *, max_size=256 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_size = max_size
+        # only counted for this process
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # key to when it was last read, for reads which haven't been written
+        # to the database yet
+        self._touched = {}
+        self.log = logging.getLogger(__name__)
+
+        with self._transaction() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )""")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_used_at ON cache "
+                "(used_at)")
+            # the total size of the values, kept up to date by triggers so
+            # every process sees the same total without summing the table.
+            db.execute("""CREATE TABLE IF NOT EXISTS cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                size INTEGER NOT NULL
+            )""")
+            db.execute("INSERT OR IGNORE INTO cache_size VALUES (0, (SELECT "
+                "COALESCE(SUM(size), 0) FROM cache))")
+            db.execute("""CREATE TRIGGER IF NOT EXISTS cache_insert
+                AFTER INSERT ON cache BEGIN
+                UPDATE cache_size SET size = size + new.size;
+            END""")
+            db.execute("""CREATE TRIGGER IF NOT EXISTS cache_delete
+                AFTER DELETE ON cache BEGIN
+                UPDATE cache_size SET size = size - old.size;
+            END""")
+            db.execute("""CREATE TRIGGER IF NOT EXISTS cache_update
+                AFTER UPDATE OF size ON cache BEGIN
+                UPDATE cache_size SET size = size - old.size + new.size;
+            END""")
+
+    def _db(self):
+        # sqlite connections can't be shared between threads, so every thread
+        # gets its own.
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT,
+                isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    @staticmethod
+    def _size(db):
+        return db.execute("SELECT size FROM cache_size").fetchone()[0]
+
+    @property
+    def size(self):
+        return self._size(self._db())
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        try:
+            return self._get_many(keys)
+        except (sqlite3.Error, OSError) as e:
+            self.log.warning(f"failed to read from {self.path}, treating it "
+                f"as a miss: {e}")
+            return [None] * len(keys)
+
+    def _get_many(self, keys):
+        now = time.time()
+        values = {}
+        db = self._db()
+        # a single statement reads a consistent snapshot, without a
+        # transaction
+        for i in range(0, len(keys), self._MAX_VARIABLES):
+            batch = keys[i:i + self._MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(batch))
+            rows = db.execute("SELECT key, value FROM cache WHERE key IN "
+                f"({placeholders}) AND expires_at > ?", [*batch, now])
+            values.update(rows)
+
+        if values:
+            with self._lock:
+                self._touched.update(dict.fromkeys(values, now))
+                flush = len(self._touched) >= self.TOUCH_BATCH
+            if flush:
+                with self._transaction() as db:
+                    self._write_touched(db)
+        return [values.get(key) for key in keys]
+
+    def _write_touched(self, db):
+        """
+        Writes when the values read since the last write were last used.
+        """
+        with self._lock:
+            touched = self._touched
+            self._touched = {}
+        db.executemany("UPDATE cache SET used_at = MAX(used_at, ?) WHERE "
+            "key = ?", [[used_at, key] for key, used_at in touched.items()])
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values, ttl):
+        try:
+            self._set_many(values, ttl)
+        except (sqlite3.Error, OSError) as e:
+            self.log.warning(f"failed to write to {self.path}, skipping it: "
+                f"{e}")
+
+    def _set_many(self, values, ttl):
+        now = time.time()
+        rows = [[key, value, len(value), now + ttl, now] for key, value in
+            values.items()]
+        with self._transaction() as db:
+            db.executemany("""INSERT INTO cache VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value,
+                size = excluded.size, expires_at = excluded.expires_at,
+                used_at = excluded.used_at""", rows)
+            # so eviction knows which values were used recently
+            self._write_touched(db)
+            self._evict(db)
+
+    def _evict(self, db):
+        size = self._size(db)
+        if size <= self.max_size:
+            return
+        db.execute("DELETE FROM cache WHERE expires_at <= ?", [time.time()])
+        size = self._size(db)
+        if size <= self.max_size:
+            return
+        # walk the values from least to most recently used, until we've seen
+        # enough of them to get back under ``max_size``.
+        rows = db.execute("SELECT key, size FROM cache ORDER BY used_at")
+        evict = []
+        for key, value_size in rows:
+            if size <= self.max_size:
+                break
+            evict.append([key])
+            size -= value_size
+        db.executemany("DELETE FROM cache WHERE key = ?", evict)
+        with self._lock:
+            self.evictions += len(evict)
+
+    def delete(self, key):
+        with self._lock:
+            self._touched.pop(key, None)
+        try:
+            with self._transaction() as db:
+                db.execute("DELETE FROM cache WHERE key = ?", [key])
+        except (sqlite3.Error, OSError) as e:
+            self.log.warning(f"failed to delete {key} from {self.path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+        with self._transaction() as db:
+            db.execute("DELETE FROM cache")
+
+    def keys(self):
+        rows = self._db().execute("SELECT key FROM cache WHERE expires_at > ?",
+            [time.time()])
+        return [key for (key,) in rows]
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            return
+        with self._transaction() as db:
+            self._write_touched(db)
+        db.close()
+        self._local.db = None
+
+
+class _Transaction:
+    """
+    Runs the statements in a ``with`` block in a single (immediate) sqlite
+    transaction, committing it if the block succeeds and rolling it back if it
+    doesn't. Returns the connection from ``__enter__``.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+
+
+class RedisError(Exception):
+    """
+    Raised when a redis server responds to a command with an error.
+    """
+
+
+class _RedisConnection:
+    """
+    A single connection to a redis server, speaking the redis serialization
+    protocol (RESP) directly.
+    """
+    def __init__(self, host, port, db, password, timeout):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile("rb")
+        if password is not None:
+            self.execute(["AUTH", password])
+        if db:
+            self.execute(["SELECT", db])
+
+    @staticmethod
+    def _encode(command):
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("redis server closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            # the bulk string is followed by a trailing crlf
+            return self.file.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RedisError(f"unexpected reply from redis server: {line!r}")
+
+    def execute_many(self, commands):
+        """
+        Sends every command in ``commands`` at once (pipelined), and returns a
+        list of their replies.
+        """
+        self.socket.sendall(b"".join(self._encode(c) for c in commands))
+        replies = []
+        error = None
+        # read every reply even if one of them is an error, so the connection
+        # is left in a usable state.
+        for _ in commands:
+            try:
+                replies.append(self._read())
+            except RedisError as e:
+                error = error or e
+                replies.append(None)
+        if error is not None:
+            raise error
+        return replies
+
+    def execute(self, command):
+        return self.execute_many([command])[0]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Stores values in a redis server (or anything which speaks the redis
+    protocol, like valkey or dragonfly), so a cache can be shared between any
+    number of processes and hosts.
+
+    Evicting values to stay under a size limit is left to the server (see its
+    ``maxmemory-policy`` setting).
+
+    If the server can't be reached, the error is logged and the read is
+    treated as a miss, or the write skipped, rather than failing the request.
+
+    Parameters
+    ----------
+    host: str
+        The host of the redis server.
+    port: int
+        The port of the redis server.
+    db: int
+        The redis database to use.
+    password: str
+        The password to authenticate with, if the server requires one.
+    prefix: str
+        A prefix for every key we store, so the server can be shared with other
+        applications. ``clear`` only deletes keys with this prefix.
+    timeout: float
+        How long in seconds to wait on the server before giving up.
+    """
+    def __init__(self, host="localhost", port=6379, *,
+        db=0,
+        password=None,
+        prefix="ossapi:",
+        timeout=5
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        # connections can't be shared between threads, since replies would
+        # get mixed up.
+        self._local = threading.local()
+        self.log = logging.getLogger(__name__)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = _RedisConnection(self.host, self.port, self.db,
+                self.password, self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _execute_many(self, commands):
+        try:
+            return self._connection().execute_many(commands)
+        except OSError:
+            # the connection may have gone stale (eg the server restarted), so
+            # don't reuse it.
+            self.close()
+            raise
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        command = ["MGET", *(self._key(key) for key in keys)]
+        try:
+            return self._execute_many([command])[0]
+        except OSError as e:
+            self.log.warning(f"failed to read from redis at {self.host}:"
+                f"{self.port}, treating it as a miss: {e}")
+            return [None] * len(keys)
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values, ttl):
+        if not values:
+            return
+        ttl_ms = max(int(ttl * 1000), 1)
+        try:
+            self._execute_many([["SET", self._key(key), value, "PX", ttl_ms]
+                for key, value in values.items()])
+        except OSError as e:
+            self.log.warning(f"failed to write to redis at {self.host}:"
+                f"{self.port}, skipping it: {e}")
+
+    def delete(self, key):
+        try:
+            self._execute_many([["DEL", self._key(key)]])
+        except OSError as e:
+            self.log.warning(f"failed to delete {key} from redis at "
+                f"{self.host}:{self.port}: {e}")
+
+    def _scan(self):
+        """
+        Every key with our prefix (including the prefix), in batches.
+        """
+        cursor = "0"
+        while True:
+            cursor, keys = self._execute_many([["SCAN", cursor, "MATCH",
+                f"{self.prefix}*", "COUNT", 1000]])[0]
+            cursor = cursor.decode("utf-8")
+            if keys:
+                yield keys
+            if cursor == "0":
+                return
+
+    def clear(self):
+        for keys in self._scan():
+            self._execute_many([["DEL", *keys]])
+
+    def keys(self):
+        # a key found by one ``SCAN`` may be found again by the next
+        keys = set()
+        for batch in self._scan():
+            keys.update(key.decode("utf-8")[len(self.prefix):] for key in
+                batch)
+        return list(keys)
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,317 @@
+"""
+A compact binary format for models, for storing them in caches, passing them
+between processes, and archiving them.
+
+Unlike ``serialize_model``, packing a model is lossless: unpacking it returns
+an equal model, with the same model, enum, ``Mod``, and ``datetime`` types.
+Models are packed as their class and the values of their fields in order,
+without field names, so both sides need the same version of ossapi. Every
+packed value starts with a fingerprint of the models it was packed with, and
+unpacking a value packed with different models raises ``ValueError``.
+"""
+from datetime import datetime, timezone, timedelta
+from dataclasses import fields
+from types import MappingProxyType
+from enum import Enum
+import hashlib
+import struct
+
+from ossapi import models, enums, mod
+from ossapi.utils import Model, BaseModel, freeze
+from ossapi.models import Cursor
+from ossapi.mod import ModCombination
+
+# the content type of responses whose body is a packed model, instead of json
+CONTENT_TYPE = "application/vnd.ossapi.packed"
+
+_MAGIC = b"OSP"
+_VERSION = 2
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_BYTES = 6
+_LIST = 7
+_TUPLE = 8
+_DICT = 9
+_DATETIME = 10
+_ENUM = 11
+_MODEL = 12
+_FROZEN_MODEL = 13
+_VALUE = 14
+_CURSOR = 15
+_FROZEN_DICT = 16
+_FROZEN_CURSOR = 17
+
+_FLOAT_STRUCT = struct.Struct(">d")
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class _Schema:
+    """
+    Every class which can be packed, with the fields of each model class, and
+    a fingerprint of them all.
+    """
+    def __init__(self):
+        classes = []
+        for module in [models, enums, mod]:
+            for value in vars(module).values():
+                if (isinstance(value, type) and
+                    value.__module__ == module.__name__ and
+                    issubclass(value, (Model, BaseModel, Enum))):
+                    classes.append(value)
+        classes.sort(key=lambda cls: (cls.__module__, cls.__qualname__))
+
+        self.classes = classes
+        self.ids = {cls: i for i, cls in enumerate(classes)}
+        # model class to the names of its fields, in order. ``_api`` isn't
+        # packed.
+        self.fields = {}
+        description = []
+        for cls in classes:
+            line = f"{cls.__module__}.{cls.__qualname__}"
+            if issubclass(cls, Model):
+                names = [f.name for f in fields(cls) if f.name != "_api"]
+                self.fields[cls] = names
+                line += ":" + ",".join(names)
+            elif issubclass(cls, Enum):
+                line += ":" + ",".join(repr(m.value) for m in cls)
+            description.append(line)
+        digest = hashlib.sha1("\n".join(description).encode("utf-8"))
+        self.fingerprint = digest.digest()[:4]
+        self.header = _MAGIC + bytes([_VERSION]) + self.fingerprint
+
+_schema = None
+
+def _get_schema():
+    global _schema
+    if _schema is None:
+        _schema = _Schema()
+    return _schema
+
+
+def _write_uint(out, value):
+    # LEB128
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _write_int(out, value):
+    # zigzag, so small negative numbers stay small
+    _write_uint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+def _write_str(out, value):
+    data = value.encode("utf-8", "surrogatepass")
+    _write_uint(out, len(data))
+    out += data
+
+def _pack(out, value, schema):
+    # check the most common types first. ``bool`` is a subclass of ``int``, and
+    # enums may be subclasses of ``int`` or ``str``, so they have to come first
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, Model):
+        cls = type(value)
+        if cls not in schema.ids:
+            raise TypeError(f"can't pack a {cls.__name__}")
+        out.append(_FROZEN_MODEL if value._frozen else _MODEL)
+        _write_uint(out, schema.ids[cls])
+        attributes = value.__dict__
+        for name in schema.fields[cls]:
+            _pack(out, attributes.get(name), schema)
+    elif isinstance(value, Enum):
+        out.append(_ENUM)
+        _write_uint(out, schema.ids[type(value)])
+        _pack(out, value.value, schema)
+    elif type(value) is int:
+        out.append(_INT)
+        _write_int(out, value)
+    elif type(value) is str:
+        out.append(_STR)
+        _write_str(out, value)
+    elif type(value) is float:
+        out.append(_FLOAT)
+        out += _FLOAT_STRUCT.pack(value)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST if isinstance(value, list) else _TUPLE)
+        _write_uint(out, len(value))
+        for item in value:
+            _pack(out, item, schema)
+    elif isinstance(value, datetime):
+        out.append(_DATETIME)
+        offset = value.utcoffset()
+        if offset is None:
+            out.append(0)
+            delta = value - _EPOCH
+        else:
+            out.append(1)
+            _write_int(out, int(offset.total_seconds()))
+            delta = value - _EPOCH_UTC
+        _write_int(out, (delta.days * 86400 + delta.seconds) * 1_000_000 +
+            delta.microseconds)
+    elif isinstance(value, (dict, MappingProxyType)):
+        out.append(_DICT if isinstance(value, dict) else _FROZEN_DICT)
+        _write_uint(out, len(value))
+        for key, item in value.items():
+            _pack(out, key, schema)
+            _pack(out, item, schema)
+    elif isinstance(value, Cursor):
+        out.append(_FROZEN_CURSOR if getattr(value, "_frozen", False) else
+            _CURSOR)
+        _pack(out, value.__dict__, schema)
+    elif isinstance(value, ModCombination):
+        out.append(_VALUE)
+        _write_uint(out, schema.ids[type(value)])
+        _pack(out, value.value, schema)
+    elif isinstance(value, bytes):
+        out.append(_BYTES)
+        _write_uint(out, len(value))
+        out += value
+    else:
+        raise TypeError(f"can't pack a {type(value).__name__}")
+
+
+class _Reader:
+    def __init__(self, data, schema, api):
+        self.data = data
+        self.position = 0
+        self.schema = schema
+        self.api = api
+
+    def uint(self):
+        data = self.data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[self.position]
+            self.position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def int(self):
+        value = self.uint()
+        return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+    def raw(self, length):
+        start = self.position
+        self.position += length
+        return bytes(self.data[start:self.position])
+
+    def value(self):
+        tag = self.data[self.position]
+        self.position += 1
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _MODEL or tag == _FROZEN_MODEL:
+            cls = self.schema.classes[self.uint()]
+            # skip ``__init__`` (and ``__setattr__``), like ``copy`` does
+            model = cls.__new__(cls)
+            attributes = model.__dict__
+            attributes["_api"] = self.api
+            for name in self.schema.fields[cls]:
+                attributes[name] = self.value()
+            if tag == _FROZEN_MODEL:
+                # everything nested in the model was frozen when it was packed,
+                # and was frozen again when it was unpacked
+                object.__setattr__(model, "_frozen", True)
+            return model
+        if tag == _INT:
+            return self.int()
+        if tag == _STR:
+            return self.raw(self.uint()).decode("utf-8", "surrogatepass")
+        if tag == _ENUM:
+            cls = self.schema.classes[self.uint()]
+            return cls(self.value())
+        if tag == _FLOAT:
+            (value,) = _FLOAT_STRUCT.unpack(self.raw(8))
+            return value
+        if tag == _LIST:
+            return [self.value() for _ in range(self.uint())]
+        if tag == _TUPLE:
+            return tuple(self.value() for _ in range(self.uint()))
+        if tag == _DATETIME:
+            aware = self.data[self.position]
+            self.position += 1
+            if not aware:
+                return _EPOCH + timedelta(microseconds=self.int())
+            offset = timedelta(seconds=self.int())
+            value = _EPOCH_UTC + timedelta(microseconds=self.int())
+            return value.astimezone(timezone(offset))
+        if tag == _DICT:
+            return {self.value(): self.value() for _ in range(self.uint())}
+        if tag == _FROZEN_DICT:
+            return MappingProxyType({self.value(): self.value() for _ in
+                range(self.uint())})
+        if tag == _CURSOR:
+            return Cursor(self.value())
+        if tag == _FROZEN_CURSOR:
+            # its values were frozen when it was packed, and were frozen
+            # again when they were unpacked
+            cursor = Cursor(self.value())
+            object.__setattr__(cursor, "_frozen", True)
+            return cursor
+        if tag == _VALUE:
+            cls = self.schema.classes[self.uint()]
+            return cls(self.value())
+        if tag == _BYTES:
+            return self.raw(self.uint())
+        raise ValueError(f"invalid packed value (unknown tag {tag})")
+
+
+def pack_model(value):
+    """
+    Packs ``value`` (a model, a list of models, or anything a model may
+    contain) into bytes, which ``unpack_model`` turns back into an equal
+    value.
+    """
+    schema = _get_schema()
+    out = bytearray(schema.header)
+    _pack(out, value, schema)
+    return bytes(out)
+
+def is_compatible(data):
+    """
+    Whether ``data`` was packed by ``pack_model`` with the same models as ours,
+    so ``unpack_model`` can unpack it.
+    """
+    return data[:len(_MAGIC) + 5] == _get_schema().header
+
+def unpack_model(data, api=None):
+    """
+    Unpacks the value packed into ``data`` by ``pack_model``.
+
+    Parameters
+    ----------
+    data: bytes
+        The packed value.
+    api: OssapiV2
+        The api to attach to the unpacked models, for following foreign keys.
+        If not passed, the models can still be used, but not to make requests.
+    """
+    schema = _get_schema()
+    if not is_compatible(data):
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("not a packed model")
+        raise ValueError("this model was packed by a different version of "
+            "ossapi, with different models")
+    reader = _Reader(memoryview(data), schema, api)
+    reader.position = len(schema.header)
+    value = reader.value()
+    if api is not None and api.frozen:
+        value = freeze(value)
+    return value
@@ -0,0 +1,688 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import struct
+import base64
+import time
+import copy
+import json
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi.middleware import Middleware, Request
+from ossapi.transport import Response
+from ossapi.circuitbreaker import CircuitOpenError
+from ossapi.enums import RankStatus
+from ossapi.backends import MemoryBackend, SQLiteBackend
+from ossapi.utils import is_frozen
+from ossapi.binary import (pack_model, is_compatible,
+    CONTENT_TYPE as PACKED_CONTENT_TYPE)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+def _ranked_ttl(model):
+    # ranked and approved maps can't change anymore. Everything else (including
+    # loved maps, which can be unloved) can.
+    if model.status in [RankStatus.RANKED, RankStatus.APPROVED]:
+        return DAY
+    return MINUTE
+
+# how long to cache the responses of each endpoint for, in seconds. A ttl may
+# also be a function which takes the decoded model and returns its ttl.
+# Endpoints which aren't listed here use ``ResponseCache``'s ``default_ttl``.
+DEFAULT_TTLS = {
+    "beatmap": _ranked_ttl,
+    "beatmapset": _ranked_ttl,
+    "changelog_build": DAY,
+    "seasonal_backgrounds": DAY,
+    "spotlights": HOUR,
+    "wiki_page": HOUR,
+    "news_post": HOUR,
+    "changelog_listing": 10 * MINUTE,
+    "ranking": MINUTE,
+    "user": MINUTE,
+    "create_pm": 0
+}
+
+# endpoints whose content rarely changes, so it's worth asking the api whether
+# an expired response is still up to date before fetching it again.
+REVALIDATE = {"wiki_page", "news_post", "changelog_listing", "changelog_build",
+    "spotlights", "seasonal_backgrounds"}
+
+# endpoints which look up a single user, beatmap, or score by id, name, or
+# checksum. Lookups of things which don't exist (or are restricted) are cached
+# too, so asking for them again doesn't need another request.
+NEGATIVE_CACHE = {"user", "beatmap", "beatmapset", "score",
+    "beatmap_user_score"}
+
+
+class CacheMissError(LookupError):
+    """
+    Raised instead of making a request for a call made with
+    ``only_if_cached=True`` which couldn't be answered from a cache.
+    """
+    def __init__(self, request):
+        self.request = request
+        super().__init__(f"{request} was made with only_if_cached=True, but "
+            "isn't cached")
+
+
+class CacheEntry:
+    """
+    A cached response.
+
+    ``response`` is a ``Response`` whose ``model`` is set if the cache stores
+    models, and ``None`` if it stores raw responses.
+    """
+    # the length of the header which holds the length of the metadata, in a
+    # packed entry
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, response, stored_at, expires_at):
+        self.response = response
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.size = len(response.content)
+
+    def __len__(self):
+        # so ``MemoryBackend`` can measure us like it would a packed entry
+        return self.size
+
+    def pack(self):
+        """
+        This entry as bytes, for backends which can only store bytes. The
+        model, if any, is not included.
+        """
+        r = self.response
+        metadata = json.dumps({
+            "status_code": r.status_code,
+            "headers": dict(r.headers),
+            "url": r.url,
+            "wire_size": r.wire_size,
+            "stored_at": self.stored_at,
+            "expires_at": self.expires_at
+        }).encode("utf-8")
+        return self._HEADER.pack(len(metadata)) + metadata + r.content
+
+    @classmethod
+    def unpack(cls, data):
+        """
+        The entry packed into ``data`` by ``pack``.
+        """
+        start = cls._HEADER.size
+        (length,) = cls._HEADER.unpack_from(data)
+        metadata = json.loads(data[start:start + length])
+        response = Response(metadata["status_code"],
+            CaseInsensitiveDict(metadata["headers"]),
+            data[start + length:], metadata["url"], metadata["wire_size"],
+            metadata["stored_at"])
+        return cls(response, metadata["stored_at"], metadata["expires_at"])
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    @property
+    def age(self):
+        """
+        How far along this entry is in its ttl, from 0 (just stored) to 1 (just
+        expired). Greater than 1 once expired.
+        """
+        ttl = self.expires_at - self.stored_at
+        if ttl <= 0:
+            return 1
+        return (time.time() - self.stored_at) / ttl
+
+    def validators(self):
+        """
+        The headers to send to ask the api whether this response is still up
+        to date.
+        """
+        headers = {}
+        etag = self.response.headers.get("ETag")
+        last_modified = self.response.headers.get("Last-Modified")
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+
+class ResponseCache(Middleware):
+    """
+    A cache of ``GET`` responses, keyed on the url and parameters of the
+    request.
+
+    How long a response is cached for depends on the endpoint it came from (see
+    ``DEFAULT_TTLS``). Immutable things like changelog builds and ranked
+    beatmaps are cached for a long time, while users and rankings are only
+    cached for a minute.
+
+    Responses are kept in memory by default, evicting the least recently used
+    responses once they take up more than ``max_size`` bytes. Pass a
+    ``backend`` to keep them somewhere else, like on disk with
+    ``SQLiteBackend`` or in a redis server shared by many processes with
+    ``RedisBackend``.
+
+    Expired responses are kept around for ``keep_expired`` seconds. For endpoints
+    whose content rarely changes (see ``REVALIDATE``), the next request for an
+    expired response is a conditional request, using the ``ETag`` and
+    ``Last-Modified`` headers of the expired response. If the api responds
+    that nothing changed (with a ``304 Not Modified``), the expired response is
+    used again, without downloading or decoding it again.
+
+    Lookups which the api answers with a ``404 Not Found`` are cached for
+    ``negative_ttl``, for endpoints which look up a single user, beatmap, or
+    score (see ``NEGATIVE_CACHE``). Repeating a lookup of something which
+    doesn't exist then raises ``NotFoundError`` without making a request.
+
+    If a request fails with ``CircuitOpenError`` (see ``CircuitBreaker``), an
+    expired response is returned instead, since stale data is usually better
+    than no data while the api is down.
+
+    Each call to an endpoint method can also override this policy with
+    ``no_cache=True``, which always fetches a fresh response (and caches it),
+    ``max_age=``, which accepts a cached response received at most that many
+    seconds ago instead of one within its ttl, ``stale_ok=True``, which
+    accepts any cached response (even an expired one, refreshing it in the
+    background), and ``only_if_cached=True``, which raises ``CacheMissError``
+    instead of making a request. See ``Request`` for details.
+
+    Callers which can't wait on the network can opt into two more modes. With
+    ``stale_while_revalidate``, a response which expired recently is returned
+    right away, and refreshed in the background. With ``refresh_ahead``, a
+    response which is requested shortly before it expires is refreshed in the
+    background, so popular responses never expire at all. Background refreshes
+    are made at low priority (see ``AIMDLimiter``), and at most one refresh
+    per response is in flight at a time.
+
+    Parameters
+    ----------
+    backend: CacheBackend
+        Where to keep the cached responses. Defaults to a ``MemoryBackend``.
+    max_size: int
+        The maximum total size in bytes of the cached responses, as measured by
+        the size of their (decompressed) bodies. Only used if ``backend`` isn't
+        passed.
+    ttls: dict
+        Endpoint names (eg ``"user"``) to how long in seconds to cache their
+        responses for. A ttl may also be a function which takes the decoded
+        model and returns its ttl. Overrides ``DEFAULT_TTLS`` for the endpoints
+        it contains. A ttl of 0 disables caching for that endpoint.
+    default_ttl: float
+        The ttl of endpoints which aren't in ``ttls`` or ``DEFAULT_TTLS``.
+        Defaults to 0, which doesn't cache them.
+    revalidate: set
+        Endpoint names whose expired responses should be revalidated with a
+        conditional request. Defaults to ``REVALIDATE``.
+    negative_ttl: float
+        How long in seconds to cache ``404 Not Found`` responses for. Pass 0 to
+        not cache them at all.
+    negative_cache: set
+        Endpoint names whose ``404 Not Found`` responses should be cached.
+        Defaults to ``NEGATIVE_CACHE``.
+    stale_while_revalidate: float
+        For how many seconds after a response expires to keep returning it
+        while refreshing it in the background. Defaults to 0, which always
+        waits on a fresh response.
+    refresh_ahead: float
+        How far along in its ttl (between 0 and 1) a response must be for a
+        request for it to trigger a background refresh. For instance, 0.8
+        refreshes a response with a ttl of 60 seconds when it's requested after
+        48 seconds. Defaults to ``None``, which never refreshes ahead.
+    keep_expired: float
+        How long in seconds to keep responses around after they expire, for
+        revalidating them and for falling back to them.
+    store: {"model", "packed", "raw"}
+        Whether to cache decoded models, models packed with ``pack_model``, or
+        raw responses. Caching models skips decoding on a cache hit, but takes
+        up more memory than ``max_size`` accounts for. Each cache hit receives
+        its own copy of the model, unless the model is frozen (see
+        ``OssapiV2``'s ``frozen`` parameter), in which case every cache hit
+        shares the same model. Only backends which keep responses in this
+        process can store models. Packed models are smaller than raw responses
+        and much faster to decode, but can only be decoded by the same version
+        of ossapi; responses packed by another version count as cache misses.
+        Defaults to storing models if the backend can, and packed models
+        otherwise.
+    """
+    # how many responses to read from or write to the backend at once when
+    # exporting or loading
+    BATCH_SIZE = 500
+
+    def __init__(self, *,
+        backend=None,
+        max_size=64 * 1024 * 1024,
+        ttls={},
+        default_ttl=0,
+        revalidate=REVALIDATE,
+        negative_ttl=5 * MINUTE,
+        negative_cache=NEGATIVE_CACHE,
+        stale_while_revalidate=0,
+        refresh_ahead=None,
+        keep_expired=DAY,
+        store=None
+    ):
+        backend = backend or MemoryBackend(max_size=max_size)
+        if store is None:
+            store = "packed" if backend.BYTES_ONLY else "model"
+        if store not in ["model", "packed", "raw"]:
+            raise ValueError(f"`store` must be one of 'model', 'packed', or "
+                f"'raw', got {store!r}")
+        if store == "model" and backend.BYTES_ONLY:
+            raise ValueError(f"{type(backend).__name__} can only store raw "
+                "responses, not models")
+        self.backend = backend
+        self.ttls = {**DEFAULT_TTLS, **ttls}
+        self.default_ttl = default_ttl
+        self.revalidate = set(revalidate)
+        self.negative_ttl = negative_ttl
+        self.negative_cache = set(negative_cache)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.refresh_ahead = refresh_ahead
+        self.keep_expired = max(keep_expired, stale_while_revalidate)
+        self.store = store
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        # keys which are being refreshed in the background
+        self._refreshing = set()
+        self._executor = None
+        self.log = logging.getLogger(__name__)
+
+    def ttl(self, endpoint, response):
+        """
+        How long in seconds to cache ``response``, which came from
+        ``endpoint``.
+        """
+        ttl = self.ttls.get(endpoint, self.default_ttl)
+        if callable(ttl):
+            ttl = ttl(response.decode())
+        return ttl
+
+    def cacheable(self, request):
+        """
+        Whether responses to ``request`` might be cached.
+        """
+        if request.method != "GET":
+            return False
+        if self.negative_ttl > 0 and request.endpoint in self.negative_cache:
+            return True
+        return self.ttls.get(request.endpoint, self.default_ttl) != 0
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    def get(self, key, *, stale=False):
+        """
+        The entry cached under ``key``, or ``None`` if there isn't one. Expired
+        entries are only returned if ``stale`` is ``True``.
+        """
+        entry = self.backend.get(self._key(key))
+        if entry is None:
+            return None
+        if self.backend.BYTES_ONLY:
+            entry = CacheEntry.unpack(entry)
+        if not (stale or entry.fresh):
+            return None
+        response = entry.response
+        if (response.headers.get("Content-Type") == PACKED_CONTENT_TYPE and
+            not is_compatible(response.content)):
+            # packed by another version of ossapi
+            return None
+        return entry
+
+    def set(self, key, response, ttl):
+        """
+        Caches ``response`` under ``key`` for ``ttl`` seconds.
+        """
+        now = time.time()
+        entry = CacheEntry(response, now, now + ttl)
+        if self.backend.BYTES_ONLY:
+            entry = entry.pack()
+        self.backend.set(self._key(key), entry, ttl + self.keep_expired)
+
+    def delete(self, key):
+        self.backend.delete(self._key(key))
+
+    def invalidate(self, key, before):
+        """
+        Deletes the entry cached under ``key`` if it was stored before
+        ``before`` (a unix timestamp), and returns whether it did.
+        """
+        entry = self.get(key, stale=True)
+        if entry is None or entry.stored_at >= before:
+            return False
+        self.delete(key)
+        return True
+
+    def clear(self):
+        self.backend.clear()
+
+    def export(self):
+        """
+        Every cached response (including expired responses we still keep), as
+        json serializable records which ``load`` can cache again, in this or
+        another process. See ``OssapiV2.dump_caches``.
+        """
+        keys = self.backend.keys()
+        for i in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[i:i + self.BATCH_SIZE]
+            for key, entry in zip(batch, self.backend.get_many(batch)):
+                if entry is None:
+                    continue
+                if self.backend.BYTES_ONLY:
+                    entry = CacheEntry.unpack(entry)
+                r = entry.response
+                record = {
+                    "cache": "response",
+                    "key": json.loads(key),
+                    "status_code": r.status_code,
+                    "headers": dict(r.headers),
+                    "url": r.url,
+                    "stored_at": entry.stored_at,
+                    "expires_at": entry.expires_at
+                }
+                # json responses are kept readable. Anything else (like packed
+                # models) is base64 encoded, since it can't be written as text.
+                try:
+                    record["content"] = r.content.decode("utf-8")
+                except UnicodeDecodeError:
+                    record["content"] = base64.b64encode(r.content).decode(
+                        "ascii")
+                    record["encoding"] = "base64"
+                yield record
+
+    def load(self, records):
+        """
+        Caches the responses in ``records``, as returned by ``export``, until
+        they would have expired in the cache they were exported from.
+        Responses which have been expired for longer than ``keep_expired`` are
+        skipped. Returns how many responses were cached.
+
+        Loaded responses are decoded when they're first requested, not when
+        they're loaded.
+        """
+        now = time.time()
+        count = 0
+        # backend ttl to the entries to store with that ttl, so backends can
+        # store them in batches
+        pending = {}
+
+        def flush():
+            for ttl, values in pending.items():
+                self.backend.set_many(values, ttl)
+            pending.clear()
+
+        for record in records:
+            ttl = int(record["expires_at"] - now + self.keep_expired)
+            if ttl <= 0:
+                continue
+            content = record["content"]
+            if record.get("encoding") == "base64":
+                content = base64.b64decode(content)
+            else:
+                # older dumps escaped invalid utf-8 instead of base64 encoding
+                # it
+                content = content.encode("utf-8", "surrogateescape")
+            response = Response(record["status_code"],
+                CaseInsensitiveDict(record["headers"]), content, record["url"],
+                received_at=record["stored_at"])
+            entry = CacheEntry(response, record["stored_at"],
+                record["expires_at"])
+            if self.backend.BYTES_ONLY:
+                entry = entry.pack()
+            pending.setdefault(ttl, {})[self._key(record["key"])] = entry
+            count += 1
+            if count % self.BATCH_SIZE == 0:
+                flush()
+        flush()
+        return count
+
+    def _copy(self, response):
+        """
+        A copy of the cached ``response`` which can be returned to a caller,
+        without letting the caller modify what we have cached.
+        """
+        copied = response.copy()
+        if response.model is not None:
+            copied.model = self._copy_model(response.model)
+        return copied
+
+    @staticmethod
+    def _copy_model(model):
+        # nobody can modify a frozen model, so it can be shared as is
+        return model if is_frozen(model) else copy.deepcopy(model)
+
+    def __call__(self, request, next_):
+        if not self.cacheable(request):
+            return next_(request)
+
+        entry = self.get(request.key, stale=True)
+        if entry is not None and self.acceptable(request, entry):
+            with self._lock:
+                self.hits += 1
+                if entry.response.status_code == 404:
+                    self.negative_hits += 1
+            if (self.refresh_ahead is not None and
+                entry.age >= self.refresh_ahead and
+                not request.only_if_cached):
+                self._refresh(request, entry, next_)
+            return self._copy(entry.response)
+
+        # a caller which asked for a ``max_age`` doesn't want anything older,
+        # unless it also said stale responses are ok
+        if (entry is not None and not request.refresh and (request.stale_ok or
+            (request.max_age is None and
+            time.time() - entry.expires_at < self.stale_while_revalidate))):
+            with self._lock:
+                self.hits += 1
+                self.stale_hits += 1
+            if not request.only_if_cached:
+                self._refresh(request, entry, next_)
+            return self._copy(entry.response)
+
+        with self._lock:
+            self.misses += 1
+        return self._fetch(request, entry, next_)
+
+    @staticmethod
+    def acceptable(request, entry):
+        """
+        Whether the cached ``entry`` is fresh enough to answer ``request``
+        with, without refreshing it.
+        """
+        if request.refresh:
+            return False
+        if request.max_age is not None:
+            return time.time() - entry.stored_at <= request.max_age
+        return entry.fresh
+
+    def _fetch(self, request, entry, next_):
+        """
+        Sends ``request`` on to the rest of the chain, caches the response if
+        appropriate, and returns it. ``entry`` is the expired entry for
+        ``request``, if there is one.
+        """
+        if entry is not None and request.endpoint in self.revalidate:
+            request.headers.update(entry.validators())
+        try:
+            response = next_(request)
+        except CircuitOpenError:
+            if entry is None:
+                raise
+            return self._copy(entry.response)
+
+        if response.status_code == 304 and entry is not None:
+            return self._revalidated(request, entry, response)
+        if (response.status_code == 404 and self.negative_ttl > 0 and
+            request.endpoint in self.negative_cache):
+            # there is no model to cache, so always store these raw
+            self.set(request.key, response.copy(), self.negative_ttl)
+            return response
+        if response.status_code != 200:
+            return response
+        ttl = self.ttl(request.endpoint, response)
+        if ttl > 0:
+            cached = response.copy()
+            if self.store == "model":
+                # the caller receives the model we just decoded, so we need to
+                # cache a copy of it instead.
+                cached.model = self._copy_model(response.decode())
+            if self.store == "packed":
+                cached = self._pack(response)
+            self.set(request.key, cached, ttl)
+        return response
+
+    def _pack(self, response):
+        """
+        A copy of ``response`` whose body is its model, packed with
+        ``pack_model``. ``OssapiV2`` unpacks it instead of decoding it as json.
+        """
+        try:
+            content = pack_model(response.decode())
+        except TypeError:
+            # not every model can be packed (eg subclasses of our models
+            # defined elsewhere), but the raw response can always be cached
+            return response.copy()
+        headers = CaseInsensitiveDict(response.headers)
+        headers["Content-Type"] = PACKED_CONTENT_TYPE
+        packed = Response(response.status_code, headers, content,
+            response.url, response.wire_size, response.received_at)
+        packed.decoder = response.decoder
+        return packed
+
+    def _refresh(self, request, entry, next_):
+        """
+        Refreshes ``entry``, the cached entry for ``request``, in the
+        background, unless it's already being refreshed.
+        """
+        key = request.key
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    thread_name_prefix="ossapi-refresh")
+
+        # the original request belongs to the caller and is still in use
+        background = Request(request.method, request.url, request.params,
+            request.data, request.type_, request.endpoint, request.arguments)
+        background.low_priority = True
+
+        def refresh():
+            try:
+                self._fetch(background, entry, next_)
+            except Exception as e:
+                self.log.warning(f"failed to refresh {background} in the "
+                    f"background: {e!r}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        self._executor.submit(refresh)
+
+    def _revalidated(self, request, entry, not_modified):
+        """
+        Returns the response in ``entry`` after the api told us it is still up
+        to date with the ``304`` response ``not_modified``, and caches it for
+        another ttl.
+        """
+        with self._lock:
+            self.revalidations += 1
+        # the 304 may come with updated validators
+        headers = CaseInsensitiveDict(entry.response.headers)
+        for header in ["ETag", "Last-Modified"]:
+            if header in not_modified.headers:
+                headers[header] = not_modified.headers[header]
+        cached = entry.response.copy()
+        cached.headers = headers
+        cached.model = entry.response.model
+        # the api just told us it's up to date
+        cached.received_at = not_modified.received_at
+        # responses restored from disk can't decode themselves yet
+        if cached.decoder is None:
+            cached.decoder = not_modified.decoder
+
+        response = self._copy(cached)
+        ttl = self.ttl(request.endpoint, response)
+        if ttl > 0:
+            self.set(request.key, cached, ttl)
+        return response
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.backend.close()
+
+    def metrics(self):
+        metrics = {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_evictions": self.backend.evictions,
+            "cache_revalidations": self.revalidations,
+            "cache_stale_hits": self.stale_hits,
+            "cache_negative_hits": self.negative_hits,
+            "cache_refreshes": self.refreshes
+        }
+        size = self.backend.size
+        if size is not None:
+            metrics["cache_size"] = size
+        return metrics
+
+
+class CacheGate(Middleware):
+    """
+    Raises ``CacheMissError`` for requests made with ``only_if_cached=True``
+    which weren't answered by any cache in front of it, instead of passing
+    them on towards the api. ``OssapiV2`` places this right after its caches.
+    """
+    def __init__(self):
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request, next_):
+        if request.only_if_cached:
+            with self._lock:
+                self.misses += 1
+            raise CacheMissError(request)
+        return next_(request)
+
+    def metrics(self):
+        # like the rest of ``OssapiV2.metrics``, only report what was used
+        if not self.misses:
+            return {}
+        return {"cache_only_misses": self.misses}
+
+
+class SQLiteCache(ResponseCache):
+    """
+    A ``ResponseCache`` which stores responses in a SQLite database on disk
+    (see ``SQLiteBackend``), so they survive restarts and can be shared between
+    processes on the same host.
+
+    Responses are stored as packed models (see ``pack_model``) by default,
+    and unpacked on every cache hit. Hit, miss, and eviction counts are only
+    counted for this process.
+
+    Parameters
+    ----------
+    path: str or Path
+        The path to the database file. It is created if it doesn't exist.
+    max_size: int
+        The maximum total size in bytes of the cached responses.
+    **kwargs
+        Passed on to ``ResponseCache``.
+    """
+    def __init__(self, path, *, max_size=256 * 1024 * 1024, **kwargs):
+        backend = SQLiteBackend(path, max_size=max_size)
+        super().__init__(backend=backend, **kwargs)
@@ -0,0 +1,222 @@
+from enum import Enum
+from collections import deque
+import threading
+import time
+
+from requests import RequestException
+
+from ossapi.middleware import Middleware
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request when the circuit for that request's
+    endpoint family is open.
+    """
+    def __init__(self, family, retry_after):
+        self.family = family
+        # how long in seconds until the circuit allows trial requests again
+        self.retry_after = retry_after
+        super().__init__(f"the circuit for the `{family}` endpoints is open, "
+            f"refusing to make a request for another {retry_after:.1f} "
+            "seconds")
+
+
+class _Circuit:
+    """
+    The state of a single endpoint family. Not threadsafe by itself;
+    ``CircuitBreaker`` is responsible for holding its lock while touching this.
+    """
+    def __init__(self, window):
+        self.state = CircuitState.CLOSED
+        # outcomes of the most recent calls, ``True`` for a failure (or a call
+        # slower than the latency threshold) and ``False`` otherwise.
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.trials_in_flight = 0
+        self.trial_successes = 0
+
+
+class CircuitBreaker(Middleware):
+    """
+    A circuit breaker for ``OssapiV2`` requests, keyed per endpoint family (the
+    first path segment of the endpoint, eg ``users`` or ``beatmapsets``).
+
+    While a family's circuit is closed, requests go through as normal and their
+    outcomes are recorded. Once at least ``minimum_calls`` of the last
+    ``window`` calls have been recorded and the fraction of them which failed
+    reaches ``failure_threshold``, the circuit opens and every request to that
+    family raises ``CircuitOpenError`` without touching the network. After
+    ``recovery_time`` seconds the circuit becomes half open and lets up to
+    ``trial_calls`` requests through. If all of them succeed the circuit closes
+    again; if any of them fail it reopens.
+
+    Parameters
+    ----------
+    failure_threshold: float
+        The fraction (between 0 and 1) of failed calls in the window at which
+        the circuit opens.
+    latency_threshold: float
+        Calls which take longer than this many seconds are counted as failures,
+        even if they eventually succeed. Pass ``None`` to only count errors.
+    window: int
+        How many of the most recent calls to consider when computing the
+        failure rate.
+    minimum_calls: int
+        The circuit will not open until at least this many calls have been
+        recorded in the window.
+    recovery_time: float
+        How long in seconds to stay open before allowing trial requests.
+    trial_calls: int
+        How many trial requests to allow while half open.
+    """
+    def __init__(self, *,
+        failure_threshold=0.5,
+        latency_threshold=10,
+        window=20,
+        minimum_calls=10,
+        recovery_time=30,
+        trial_calls=3
+    ):
+        if not 0 < failure_threshold <= 1:
+            raise ValueError("`failure_threshold` must be in (0, 1], got "
+                f"{failure_threshold}")
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.window = window
+        self.minimum_calls = min(minimum_calls, window)
+        self.recovery_time = recovery_time
+        self.trial_calls = trial_calls
+
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, family):
+        circuit = self._circuits.get(family)
+        if circuit is None:
+            circuit = _Circuit(self.window)
+            self._circuits[family] = circuit
+        return circuit
+
+    def state(self, family):
+        """
+        The current ``CircuitState`` of ``family``.
+        """
+        with self._lock:
+            circuit = self._circuit(family)
+            self._maybe_half_open(circuit)
+            return circuit.state
+
+    def states(self):
+        """
+        A mapping of every endpoint family we have seen to its current
+        ``CircuitState``.
+        """
+        with self._lock:
+            for circuit in self._circuits.values():
+                self._maybe_half_open(circuit)
+            return {family: circuit.state for family, circuit in
+                self._circuits.items()}
+
+    def _maybe_half_open(self, circuit):
+        if circuit.state is not CircuitState.OPEN:
+            return
+        if time.monotonic() - circuit.opened_at < self.recovery_time:
+            return
+        circuit.state = CircuitState.HALF_OPEN
+        circuit.trials_in_flight = 0
+        circuit.trial_successes = 0
+
+    def _open(self, circuit):
+        circuit.state = CircuitState.OPEN
+        circuit.opened_at = time.monotonic()
+        circuit.outcomes.clear()
+
+    def before_call(self, family):
+        """
+        Called before making a request to ``family``. Raises
+        ``CircuitOpenError`` if the request should not be made.
+        """
+        with self._lock:
+            circuit = self._circuit(family)
+            self._maybe_half_open(circuit)
+
+            if circuit.state is CircuitState.OPEN:
+                elapsed = time.monotonic() - circuit.opened_at
+                raise CircuitOpenError(family, self.recovery_time - elapsed)
+
+            if circuit.state is CircuitState.HALF_OPEN:
+                if (circuit.trials_in_flight + circuit.trial_successes >=
+                    self.trial_calls):
+                    raise CircuitOpenError(family, 0)
+                circuit.trials_in_flight += 1
+
+    def record(self, family, *, success, latency):
+        """
+        Records the outcome of a request to ``family`` which was allowed by
+        ``before_call``.
+
+        Parameters
+        ----------
+        success: bool
+            Whether the request succeeded. Connection errors and server errors
+            (5xx) are failures; client errors like a 404 are not, since they
+            don't say anything about the health of the api.
+        latency: float
+            How long in seconds the request took.
+        """
+        failed = not success or (self.latency_threshold is not None and
+            latency > self.latency_threshold)
+
+        with self._lock:
+            circuit = self._circuit(family)
+
+            if circuit.state is CircuitState.HALF_OPEN:
+                circuit.trials_in_flight = max(circuit.trials_in_flight - 1, 0)
+                if failed:
+                    self._open(circuit)
+                    return
+                circuit.trial_successes += 1
+                if circuit.trial_successes >= self.trial_calls:
+                    circuit.state = CircuitState.CLOSED
+                    circuit.outcomes.clear()
+                return
+
+            # a request which was let through before the circuit opened can
+            # finish after it opened. Its outcome is stale, so ignore it.
+            if circuit.state is CircuitState.OPEN:
+                return
+
+            circuit.outcomes.append(failed)
+            if len(circuit.outcomes) < self.minimum_calls:
+                return
+            failure_rate = sum(circuit.outcomes) / len(circuit.outcomes)
+            if failure_rate >= self.failure_threshold:
+                self._open(circuit)
+
+    def __call__(self, request, next_):
+        family = request.family
+        self.before_call(family)
+        start = time.monotonic()
+        try:
+            response = next_(request)
+        except Exception as e:
+            # only network errors say anything about the health of the api.
+            # Anything else (like an expired token) still needs to be recorded
+            # to free up a trial slot, but as a success.
+            self.record(family, success=not isinstance(e, RequestException),
+                latency=time.monotonic() - start)
+            raise
+        self.record(family, success=response.status_code < 500,
+            latency=time.monotonic() - start)
+        return response
+
+    def metrics(self):
+        return {"circuit_states": {family: state.value for family, state in
+            self.states().items()}}
@@ -0,0 +1,78 @@
+import threading
+
+from ossapi.middleware import Middleware
+
+# headers which make a request conditional
+VALIDATORS = ["If-None-Match", "If-Modified-Since"]
+
+
+class _Call:
+    """
+    A call which is in flight, and which other callers may wait on.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class RequestCoalescer(Middleware):
+    """
+    Coalesces concurrent identical calls (often called "singleflight"). If a
+    call with a given key is made while another call with the same key is
+    still in flight, the second call waits for the first one and receives its
+    result (or exception) instead of running itself.
+
+    As a middleware, coalesces identical ``GET`` requests. Conditional
+    requests (eg a ``ResponseCache`` revalidating a response) are only
+    coalesced with requests which have the same validators, since the api may
+    answer them with a ``304 Not Modified`` which is of no use to anyone else.
+    """
+    def __init__(self):
+        # how many calls were answered by another in-flight call
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """
+        Returns ``function()``, unless a call with ``key`` is already in
+        flight, in which case the result of that call is returned instead.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def __call__(self, request, next_):
+        if request.method != "GET":
+            return next_(request)
+        key = (*request.key, *[request.headers.get(header)
+            for header in VALIDATORS])
+        response = self.do(key, lambda: next_(request))
+        # every caller decodes the response into its own model
+        return response.copy()
+
+    def metrics(self):
+        return {"coalesced_requests": self.coalesced}
@@ -0,0 +1,183 @@
+import threading
+import time
+
+from requests import RequestException
+
+from ossapi.middleware import Middleware
+
+
+class AIMDLimiter(Middleware):
+    """
+    An adaptive limit on how many requests may be in flight at once.
+
+    The limit grows additively (by roughly ``increase`` per ``limit``
+    successful requests) while latency is stable and the limit is actually
+    being used, and shrinks multiplicatively (by a factor of ``backoff``) when
+    a request is ratelimited, times out, or takes more than
+    ``latency_tolerance`` times longer than the usual latency.
+
+    Parameters
+    ----------
+    initial_limit: int
+        How many requests may be in flight before we have any measurements.
+    min_limit: int
+        The limit never shrinks below this.
+    max_limit: int
+        The limit never grows above this.
+    increase: float
+        How much to grow the limit by per ``limit`` successful requests.
+    backoff: float
+        The factor to multiply the limit by when backing off.
+    latency_tolerance: float
+        A request which takes longer than this many times the usual latency of
+        its endpoint counts as a latency jump and causes a backoff.
+    smoothing: float
+        The weight of each new latency sample in the moving average used as the
+        usual latency of an endpoint.
+    """
+    # the fraction of the limit which low priority requests may use.
+    LOW_PRIORITY_SHARE = 0.5
+
+    def __init__(self, *,
+        initial_limit=4,
+        min_limit=1,
+        max_limit=32,
+        increase=1,
+        backoff=0.5,
+        latency_tolerance=2,
+        smoothing=0.05
+    ):
+        if not min_limit <= initial_limit <= max_limit:
+            raise ValueError("`initial_limit` must be between `min_limit` and "
+                f"`max_limit`, got {initial_limit}")
+        if not 0 < backoff < 1:
+            raise ValueError(f"`backoff` must be in (0, 1), got {backoff}")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.backoffs = 0
+        # how many normal priority requests are waiting for a slot
+        self._waiting = 0
+        self._limit = float(initial_limit)
+        # endpoint to the moving average of its latencies. Endpoints differ
+        # too much in how long they take (compare ``user`` with ``search``) to
+        # share one.
+        self._baselines = {}
+        # incremented every time we back off. A request which started before
+        # the most recent backoff can't cause another one, so a single burst of
+        # errors only cuts the limit once.
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        The current number of requests which may be in flight at once.
+        """
+        return int(self._limit)
+
+    def baseline_latency(self, endpoint=None):
+        """
+        The moving average of latencies of successful requests to
+        ``endpoint``, in seconds, or ``None`` if there haven't been any yet.
+        """
+        return self._baselines.get(endpoint)
+
+    def acquire(self, timeout=None, *, low_priority=False):
+        """
+        Blocks until a request may be made, and returns a token which must be
+        passed to ``release`` when the request finishes. Raises
+        ``TimeoutError`` if ``timeout`` seconds pass without being able to make
+        a request.
+
+        Low priority requests (like background refreshes) may only use up to
+        ``LOW_PRIORITY_SHARE`` of the limit, and never take a slot while a
+        normal priority request is waiting for one.
+        """
+        def available():
+            if not low_priority:
+                return self.in_flight < self.limit
+            share = max(int(self.limit * self.LOW_PRIORITY_SHARE), 1)
+            return self._waiting == 0 and self.in_flight < share
+
+        with self._condition:
+            if not low_priority:
+                self._waiting += 1
+            try:
+                allowed = self._condition.wait_for(available, timeout)
+            finally:
+                if not low_priority:
+                    self._waiting -= 1
+            if not allowed:
+                raise TimeoutError("timed out waiting for a request slot")
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self, token, latency, *, endpoint=None, dropped=False):
+        """
+        Finishes a request which was started with ``acquire``.
+
+        Parameters
+        ----------
+        token: int
+            The token returned by ``acquire``.
+        latency: float
+            How long in seconds the request took.
+        endpoint: str
+            The endpoint the request was made to. Its latency is only compared
+            to earlier requests to the same endpoint.
+        dropped: bool
+            Whether the request was ratelimited or timed out.
+        """
+        with self._condition:
+            # whether the limit was (nearly) used up by this request; we only
+            # grow the limit if it's what is holding us back.
+            saturated = self.in_flight * 2 >= self.limit
+            self.in_flight -= 1
+
+            baseline = self._baselines.get(endpoint)
+            jumped = (baseline is not None and
+                latency > baseline * self.latency_tolerance)
+            if dropped or jumped:
+                if token == self._epoch:
+                    self._epoch += 1
+                    self.backoffs += 1
+                    self._limit = max(self._limit * self.backoff,
+                        self.min_limit)
+            else:
+                if baseline is None:
+                    baseline = latency
+                else:
+                    baseline += self.smoothing * (latency - baseline)
+                self._baselines[endpoint] = baseline
+                if saturated:
+                    self._limit = min(self._limit + self.increase /
+                        self._limit, self.max_limit)
+
+            self._condition.notify_all()
+
+    def __call__(self, request, next_):
+        token = self.acquire(low_priority=request.low_priority)
+        start = time.monotonic()
+        try:
+            response = next_(request)
+        except Exception as e:
+            self.release(token, time.monotonic() - start,
+                endpoint=request.endpoint,
+                dropped=isinstance(e, RequestException))
+            raise
+        self.release(token, time.monotonic() - start,
+            endpoint=request.endpoint, dropped=response.status_code == 429)
+        return response
+
+    def metrics(self):
+        return {
+            "concurrency_limit": self.limit,
+            "in_flight_requests": self.in_flight,
+            "concurrency_backoffs": self.backoffs
+        }
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import hashlib
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi.middleware import Middleware
+from ossapi.transport import Response
+from ossapi.utils import is_frozen
+from ossapi.binary import pack_model, CONTENT_TYPE as PACKED_CONTENT_TYPE
+
+
+class _Digest:
+    """
+    The digest of the last response to a request, and the model it was decoded
+    into.
+    """
+    def __init__(self, digest, packed, model):
+        self.digest = digest
+        # the model packed with ``pack_model``, or ``None`` if it couldn't be
+        # packed
+        self.packed = packed
+        # the model itself, if it's frozen and so can be shared
+        self.model = model
+
+
+class DigestCache(Middleware):
+    """
+    Remembers a digest of the last response to each ``GET`` request, along
+    with the model it was decoded into. If the api responds to a request with
+    exactly the same body as last time, the model from last time is returned
+    again, without parsing the json or instantiating any models.
+
+    This is meant for polling endpoints whose responses rarely change between
+    polls (like ``beatmap_scores``, ``user_recent_activity``, or the first
+    page of ``ranking``), where decoding would otherwise take up most of the
+    time spent on each poll. Every caller still receives its own copy of the
+    model (which is unpacked with ``unpack_model``, much faster than decoding
+    it again), unless models are frozen, in which case the same model is
+    shared. See ``OssapiV2.poll`` to find out whether a poll returned anything
+    new.
+
+    Parameters
+    ----------
+    max_entries: int
+        How many requests to remember the last response of. The least recently
+        used requests are forgotten first.
+    """
+    def __init__(self, *, max_entries=10_000):
+        self.max_entries = max_entries
+        # responses which were the same as last time
+        self.hits = 0
+        # responses which were different from last time (or the first for
+        # their request)
+        self.misses = 0
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def digest(content):
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    @contextmanager
+    def track(self):
+        """
+        Yields a list, and appends to it whether the response to each request
+        made (in this thread) inside the ``with`` block was different from the
+        last response to the same request.
+        """
+        previous = getattr(self._local, "changes", None)
+        changes = []
+        self._local.changes = changes
+        try:
+            yield changes
+        finally:
+            self._local.changes = previous
+
+    def _record(self, changed):
+        changes = getattr(self._local, "changes", None)
+        if changes is not None:
+            changes.append(changed)
+
+    def __call__(self, request, next_):
+        response = next_(request)
+        if (request.method != "GET" or response.status_code != 200 or
+            response.headers.get("Content-Type") == PACKED_CONTENT_TYPE):
+            return response
+
+        key = request.key
+        digest = self.digest(response.content)
+        with self._lock:
+            previous = self._digests.get(key)
+            if previous is not None:
+                self._digests.move_to_end(key)
+            changed = previous is None or previous.digest != digest
+            if changed:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._record(changed)
+
+        if not changed:
+            if previous.packed is None:
+                return response
+            return self._unchanged(response, previous)
+
+        model = response.decode()
+        try:
+            packed = pack_model(model)
+        except TypeError:
+            # not every model can be packed (eg subclasses of our models
+            # defined elsewhere). We can still tell whether it changed.
+            packed = None
+        entry = _Digest(digest, packed, model if is_frozen(model) else None)
+        with self._lock:
+            self._digests[key] = entry
+            self._digests.move_to_end(key)
+            while len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+        return response
+
+    @staticmethod
+    def _unchanged(response, previous):
+        """
+        A copy of ``response`` which decodes into the model of ``previous``
+        instead of decoding its body.
+        """
+        headers = CaseInsensitiveDict(response.headers)
+        headers["Content-Type"] = PACKED_CONTENT_TYPE
+        unchanged = Response(response.status_code, headers, previous.packed,
+            response.url, response.wire_size, response.received_at)
+        unchanged.decoder = response.decoder
+        # frozen models can be shared as is. If the response is copied (and so
+        # loses its model) on the way out, the copy is unpacked instead.
+        unchanged.model = previous.model
+        return unchanged
+
+    def clear(self):
+        with self._lock:
+            self._digests.clear()
+
+    def metrics(self):
+        return {
+            "digest_hits": self.hits,
+            "digest_misses": self.misses,
+            "digest_entries": len(self._digests)
+        }
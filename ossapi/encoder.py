@@ -1,10 +1,18 @@
 import json
 from json import JSONEncoder
 from datetime import datetime
+from types import MappingProxyType
 from enum import Enum
+from pathlib import Path
+import gzip
+import time
 
 from ossapi.models import Model
 from ossapi.mod import Mod
+from ossapi.utils import Field, freeze
+
+# the version of the dump format written by ``write_dump``
+DUMP_VERSION = 1
 
 class ModelEncoder(JSONEncoder):
     def default(self, o):
@@ -14,12 +22,22 @@ class ModelEncoder(JSONEncoder):
             return o.value
         if isinstance(o, Mod):
             return o.value
+        # dicts of frozen models
+        if isinstance(o, MappingProxyType):
+            return dict(o)
 
         to_serialize = {}
         if isinstance(o, Model):
             for name, value in o.__dict__.items():
+                # attributes which the api returns under a different name
+                # (eg ``_beatmapset``, returned as ``beatmapset``) are
+                # serialized under the name the api uses, so
+                # ``deserialize_model`` can read them back.
+                field = getattr(type(o), name, None)
+                if isinstance(field, Field) and field.name:
+                    name = field.name
                 # don't seriailize private attributes, like ``_api``.
-                if name.startswith("_"):
+                elif name.startswith("_"):
                     continue
                 to_serialize[name] = value
             return to_serialize
@@ -30,3 +48,64 @@ class ModelEncoder(JSONEncoder):
 def serialize_model(model, ensure_ascii=False, **kwargs):
     return json.dumps(model, cls=ModelEncoder,  ensure_ascii=ensure_ascii,
         **kwargs)
+
+def deserialize_model(data, type_, api):
+    """
+    The model of type ``type_`` serialized into ``data`` by
+    ``serialize_model``. ``data`` may also be the already parsed json.
+
+    Parameters
+    ----------
+    data: str or dict or list
+        The serialized model.
+    type_: type
+        The type of the model, eg ``Beatmap`` or ``List[UserCompact]``.
+    api: OssapiV2
+        The api to attach to the model (and any nested models), for following
+        foreign keys. If the api returns frozen models, so does this.
+    """
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    model = api._instantiate_type(type_, data)
+    if api.frozen:
+        model = freeze(model)
+    return model
+
+
+def _open(path, mode):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def write_dump(path, records):
+    """
+    Writes ``records`` (json serializable dicts, like the ones returned by
+    ``ResponseCache.export`` and ``EntityStore.export``) to a dump file at
+    ``path``, one record per line. If ``path`` ends in ``.gz``, the file is
+    gzipped. Returns how many records were written.
+    """
+    count = 0
+    with _open(path, "w") as f:
+        header = {"ossapi_dump": DUMP_VERSION, "created_at": time.time()}
+        f.write(json.dumps(header) + "\n")
+        for record in records:
+            f.write(json.dumps(record, cls=ModelEncoder, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+def read_dump(path):
+    """
+    The records in the dump file at ``path``, written by ``write_dump``. The
+    file is read lazily, one record at a time.
+    """
+    with _open(path, "r") as f:
+        header = json.loads(f.readline() or "{}")
+        version = header.get("ossapi_dump")
+        if version != DUMP_VERSION:
+            raise ValueError(f"{path} is not an ossapi dump of version "
+                f"{DUMP_VERSION} (got version {version})")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
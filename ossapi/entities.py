@@ -0,0 +1,432 @@
+import threading
+import struct
+import time
+import copy
+import json
+
+from ossapi.middleware import Middleware
+from ossapi.transport import Response
+from ossapi.backends import MemoryBackend
+from ossapi.models import (UserCompact, User, BeatmapCompact, Beatmap,
+    BeatmapsetCompact, Beatmapset)
+from ossapi.enums import UserLookupKey
+from ossapi.utils import Model, is_frozen
+from ossapi.cache import MINUTE, _ranked_ttl
+from ossapi.encoder import deserialize_model
+from ossapi.binary import (pack_model, unpack_model, is_compatible,
+    CONTENT_TYPE as PACKED_CONTENT_TYPE)
+
+# the kinds of entities we keep, with the compact and full model of each kind.
+# Check subclasses first, since every full model is also a compact model.
+KINDS = {
+    "user": (UserCompact, User),
+    "beatmap": (BeatmapCompact, Beatmap),
+    "beatmapset": (BeatmapsetCompact, Beatmapset)
+}
+
+# how long in seconds entities of each kind stay fresh. A ttl may also be a
+# function which takes the entity and returns its ttl.
+DEFAULT_TTLS = {
+    "user": MINUTE,
+    "beatmap": _ranked_ttl,
+    "beatmapset": _ranked_ttl
+}
+
+def _user_lookup(arguments):
+    user = arguments["user"]
+    # users have different statistics for each mode. We only keep users as
+    # returned without a mode.
+    if arguments["mode"] is not None or not isinstance(user, int):
+        return None
+    # ``user`` may be a username which happens to be a number
+    if arguments["key"] not in [None, UserLookupKey.ID]:
+        return None
+    return ("user", user)
+
+def _beatmap_lookup(arguments):
+    if arguments["checksum"] or arguments["filename"]:
+        return None
+    return ("beatmap", arguments["beatmap_id"])
+
+def _beatmapset_lookup(arguments):
+    if not arguments["beatmapset_id"]:
+        return None
+    return ("beatmapset", arguments["beatmapset_id"])
+
+# endpoints which look up a single entity, to a function which takes the
+# arguments of the endpoint and returns the ``(kind, id)`` of the entity it
+# looks up, or ``None`` if it can't tell.
+LOOKUPS = {
+    "user": _user_lookup,
+    "beatmap": _beatmap_lookup,
+    "beatmapset": _beatmapset_lookup
+}
+
+def kind_of(model):
+    """
+    The ``(kind, full)`` of ``model``, or ``None`` if it isn't an entity.
+    """
+    for kind, (compact_type, full_type) in KINDS.items():
+        if isinstance(model, compact_type):
+            return (kind, isinstance(model, full_type))
+    return None
+
+def walk(value):
+    """
+    Every model in ``value`` (a model, or a list of models), including
+    ``value`` itself and any models nested inside it.
+    """
+    stack = [value]
+    seen = set()
+    while stack:
+        value = stack.pop()
+        if isinstance(value, (list, tuple)):
+            stack.extend(value)
+            continue
+        if not isinstance(value, Model) or id(value) in seen:
+            continue
+        seen.add(id(value))
+        yield value
+        for name, attribute in vars(value).items():
+            if name != "_api":
+                stack.append(attribute)
+
+
+class _Entity:
+    """
+    A stored entity, and whether it's the full or compact variant.
+
+    Entities loaded from a dump, or read from a backend which only stores
+    bytes, are kept serialized until they're first used, and decoded with
+    ``decode`` then.
+    """
+    # the length of the header which holds the length of the metadata, in a
+    # packed entity
+    _HEADER = struct.Struct(">I")
+
+    def __init__(self, model, full, expires_at, *, stored_at=None,
+        full_model=None, decode=None):
+        self._model = model
+        self.full = full
+        # whether the model is of the full type. A full model nested in another
+        # response (like the beatmap of a score) may be missing fields the api
+        # only returns when looking it up directly, and is only stored as a
+        # compact entity.
+        self.full_model = full if full_model is None else full_model
+        self.expires_at = expires_at
+        # when the entity was received from the api, if known
+        self.stored_at = stored_at
+        self._decode = decode
+
+    @property
+    def model(self):
+        if self._decode is not None:
+            self._model = self._decode(self._model)
+            self._decode = None
+        return self._model
+
+    @property
+    def serialized(self):
+        """
+        The model, or its serialized form if it hasn't been decoded yet.
+        """
+        return self._model
+
+    def __len__(self):
+        # ``MemoryBackend`` measures its values with ``len``. We limit the
+        # number of entities, not their size.
+        return 1
+
+    def pack(self):
+        """
+        This entity as bytes, for backends which can only store bytes. The
+        model is packed with ``pack_model``, which raises ``TypeError`` if it
+        can't be packed.
+        """
+        metadata = json.dumps({
+            "full": self.full,
+            "full_model": self.full_model,
+            "expires_at": self.expires_at,
+            "stored_at": self.stored_at
+        }).encode("utf-8")
+        return (self._HEADER.pack(len(metadata)) + metadata +
+            pack_model(self.model))
+
+    @classmethod
+    def unpack(cls, data, api=None):
+        """
+        The entity packed into ``data`` by ``pack``. Its model is unpacked
+        (and attached to ``api``) when it's first used.
+        """
+        start = cls._HEADER.size
+        (length,) = cls._HEADER.unpack_from(data)
+        metadata = json.loads(data[start:start + length])
+        return cls(data[start + length:], metadata["full"],
+            metadata["expires_at"], stored_at=metadata["stored_at"],
+            full_model=metadata["full_model"],
+            decode=lambda data: unpack_model(data, api))
+
+
+class EntityStore(Middleware):
+    """
+    Keeps the users, beatmaps, and beatmapsets found anywhere in any response,
+    keyed by ``(kind, id)``, and answers later requests for them without making
+    a request.
+
+    Every response is searched for entities, including ones nested in other
+    models, like the beatmap and beatmapset of a ``Score`` or the users of a
+    ``CommentBundle``. Requests which look up a single entity by id (see
+    ``LOOKUPS``), like ``api.user(12092800)``, ``api.beatmap(221777)``, or
+    ``model.expand()``, are answered from the store if it has a fresh copy of
+    the full variant of that entity.
+
+    Compact and full variants are tracked separately. Only the entity returned
+    by a lookup endpoint (eg ``api.user``) is stored as a full entity. Every
+    entity nested in a response is stored as a compact entity, even if it's an
+    instance of the full model (like the ``Beatmap`` of a ``Score``), since
+    the api leaves out some of the fields of nested models. A compact entity
+    never answers a request for the full model, and never replaces a full
+    entity which is still fresh.
+
+    Parameters
+    ----------
+    backend: CacheBackend
+        Where to keep the entities. Defaults to a ``MemoryBackend`` which keeps
+        at most ``max_entities`` entities. Backends which only store bytes (like
+        ``SQLiteBackend`` or ``RedisBackend``, which can be shared between
+        processes) store entities packed with ``pack_model``, and unpack them
+        on every hit. Entities packed by another version of ossapi count as
+        misses, and models which can't be packed aren't stored.
+    max_entities: int
+        The maximum number of entities to keep. Only used if ``backend`` isn't
+        passed.
+    ttls: dict
+        Kinds of entities (``"user"``, ``"beatmap"``, or ``"beatmapset"``) to
+        how long in seconds they stay fresh for. A ttl may also be a function
+        which takes the entity and returns its ttl. Overrides ``DEFAULT_TTLS``
+        for the kinds it contains.
+    """
+    def __init__(self, *, backend=None, max_entities=100_000, ttls={}):
+        self.backend = backend or MemoryBackend(max_size=max_entities)
+        self.ttls = {**DEFAULT_TTLS, **ttls}
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind, id_):
+        return f"{kind}:{id_}"
+
+    def _get(self, key, api=None):
+        entity = self.backend.get(key)
+        if entity is None or not self.backend.BYTES_ONLY:
+            return entity
+        entity = _Entity.unpack(entity, api)
+        if not is_compatible(entity.serialized):
+            # packed by another version of ossapi
+            return None
+        return entity
+
+    def _set(self, key, entity, ttl):
+        if self.backend.BYTES_ONLY:
+            entity = entity.pack()
+        self.backend.set(key, entity, ttl)
+
+    def _fresh(self, kind, id_, *, full=True, max_age=None):
+        entity = self._get(self._key(kind, id_))
+        if entity is None or (full and not entity.full):
+            return None
+        if max_age is not None and (entity.stored_at is None or
+            time.time() - entity.stored_at > max_age):
+            return None
+        return entity
+
+    def get(self, kind, id_, *, full=True, max_age=None):
+        """
+        A copy of the stored entity of ``kind`` with ``id_`` (or the entity
+        itself, if it's frozen), or ``None`` if we don't have a fresh one. If
+        ``full`` is ``True``, only the full variant of the entity is returned.
+        If ``max_age`` is passed, only an entity received from the api at most
+        ``max_age`` seconds ago is returned.
+
+        Models unpacked from a backend which only stores bytes aren't attached
+        to an api, and can't make requests.
+        """
+        entity = self._fresh(kind, id_, full=full, max_age=max_age)
+        if entity is None:
+            return None
+        model = entity.model
+        if self.backend.BYTES_ONLY:
+            # unpacked just now, so nobody else holds it
+            return model
+        # nobody can modify a frozen model, so it can be shared as is
+        return model if is_frozen(model) else copy.deepcopy(model)
+
+    def add(self, model, *, full=False):
+        """
+        Stores every entity in ``model`` (a model or list of models), including
+        ``model`` itself, as compact entities. If ``full`` is ``True``,
+        ``model`` itself is stored as a full entity instead, if it's a full
+        model. Only pass ``full`` for models which were returned by looking
+        them up directly.
+        """
+        for value in walk(model):
+            kind = kind_of(value)
+            if kind is None:
+                continue
+            kind, full_model = kind
+            full_entity = full and full_model and value is model
+            key = self._key(kind, value.id)
+            if not full_entity:
+                existing = self._get(key)
+                if existing is not None and existing.full:
+                    continue
+            ttl = self.ttls[kind]
+            if callable(ttl):
+                ttl = ttl(value)
+            # the caller still holds (and may modify) ``value``. Packing
+            # copies it anyway.
+            if not (is_frozen(value) or self.backend.BYTES_ONLY):
+                value = copy.deepcopy(value)
+            now = time.time()
+            entity = _Entity(value, full_entity, now + ttl, stored_at=now,
+                full_model=full_model)
+            try:
+                self._set(key, entity, ttl)
+            except TypeError:
+                # not every model can be packed (eg subclasses of our models
+                # defined elsewhere)
+                continue
+
+    def delete(self, kind, id_):
+        self.backend.delete(self._key(kind, id_))
+
+    def invalidate(self, kind, id_, before):
+        """
+        Deletes the stored entity of ``kind`` with ``id_`` if it was stored
+        before ``before`` (a unix timestamp), and returns whether it did.
+        Entities which don't know when they were stored (like ones loaded from
+        an older dump) are always deleted.
+        """
+        entity = self._get(self._key(kind, id_))
+        if entity is None or (entity.stored_at is not None and
+            entity.stored_at >= before):
+            return False
+        self.delete(kind, id_)
+        return True
+
+    def clear(self):
+        self.backend.clear()
+
+    def export(self):
+        """
+        Every stored entity, as json serializable records which ``load`` can
+        store again, in this or another process. See
+        ``OssapiV2.dump_caches``.
+        """
+        for key in self.backend.keys():
+            entity = self._get(key)
+            if entity is None:
+                continue
+            yield {
+                "cache": "entity",
+                "kind": key.split(":", 1)[0],
+                "full": entity.full,
+                "full_model": entity.full_model,
+                "expires_at": entity.expires_at,
+                "stored_at": entity.stored_at,
+                # serialized by ``write_dump``
+                "model": (entity.model if self.backend.BYTES_ONLY else
+                    entity.serialized)
+            }
+
+    def load(self, records, api):
+        """
+        Stores the entities in ``records``, as returned by ``export``, until
+        they would have expired in the store they were exported from. Returns
+        how many entities were stored.
+
+        Loaded entities are decoded (and attached to ``api``) when they're
+        first used, not when they're loaded, unless the backend only stores
+        bytes.
+        """
+        now = time.time()
+        count = 0
+        for record in records:
+            ttl = record["expires_at"] - now
+            if ttl <= 0:
+                continue
+            kind, full = record["kind"], record["full"]
+            full_model = record.get("full_model", full)
+            type_ = KINDS[kind][1 if full_model else 0]
+            decode = lambda data, type_=type_: deserialize_model(data, type_,
+                api)
+            entity = _Entity(record["model"], full, record["expires_at"],
+                stored_at=record.get("stored_at"), full_model=full_model,
+                decode=decode)
+            try:
+                self._set(self._key(kind, record["model"]["id"]), entity, ttl)
+            except TypeError:
+                continue
+            count += 1
+        return count
+
+    def lookup(self, request):
+        """
+        The ``(kind, id)`` of the entity ``request`` looks up, or ``None`` if
+        it doesn't look up a single entity.
+        """
+        if request.method != "GET" or request.endpoint not in LOOKUPS:
+            return None
+        return LOOKUPS[request.endpoint](request.arguments)
+
+    def __call__(self, request, next_):
+        lookup = self.lookup(request)
+        if lookup is not None and not request.refresh:
+            entity = self._fresh(*lookup, max_age=request.max_age)
+            with self._lock:
+                if entity is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            # entities loaded from older dumps don't know when they were
+            # received, so count them as old
+            received_at = None if entity is None else entity.stored_at or 0
+            if entity is not None and self.backend.BYTES_ONLY:
+                # ``OssapiV2`` unpacks it, and attaches it to itself
+                headers = {"Content-Type": PACKED_CONTENT_TYPE}
+                return Response(200, headers, entity.serialized, request.url,
+                    received_at=received_at)
+            if entity is not None:
+                model = entity.model
+                if not is_frozen(model):
+                    model = copy.deepcopy(model)
+                response = Response(200, {}, b"", request.url,
+                    received_at=received_at)
+                response.model = model
+                return response
+
+        response = next_(request)
+        if response.status_code != 200:
+            return response
+        model = response.decode()
+        # users have different statistics for each mode, so don't keep users
+        # which were requested with a mode.
+        if request.arguments.get("mode") is not None and isinstance(model,
+            User):
+            return response
+        # only a lookup endpoint returns every field of the entity it looks
+        # up
+        self.add(model, full=request.method == "GET" and
+            request.endpoint in LOOKUPS)
+        return response
+
+    def metrics(self):
+        return {
+            "entity_hits": self.hits,
+            "entity_misses": self.misses
+        }
+
+    def close(self):
+        self.backend.close()
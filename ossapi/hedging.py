@@ -0,0 +1,242 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import time
+import logging
+
+from ossapi.middleware import Middleware
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent ``window`` latency samples of an endpoint and
+    answers percentile queries over them.
+    """
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p):
+        """
+        The ``p``th percentile (between 0 and 1) of the recorded samples, or
+        ``None`` if there are no samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(int(p * len(samples)), len(samples) - 1)
+        return samples[index]
+
+
+class HedgingPolicy(Middleware):
+    """
+    Sends a second, identical request for idempotent (``GET``) requests which
+    are taking unusually long, and uses whichever response arrives first.
+
+    A request is considered to be taking unusually long once it has been in
+    flight for longer than the ``percentile`` latency of its endpoint over the
+    last ``window`` requests. Endpoints with fewer than ``min_samples``
+    recorded requests are never hedged.
+
+    Hedged requests count against the api's ratelimit like any other request,
+    so they are bounded in two ways. First, at most ``budget`` (a fraction
+    between 0 and 1) of requests may be hedged. Second, no request is hedged
+    while the remaining ratelimit reported by the api drops below
+    ``ratelimit_reserve`` (a fraction of the total ratelimit). A hedged request
+    also takes up a slot of ``OssapiV2``'s concurrency limiter, if it has one,
+    like any other request.
+
+    Parameters
+    ----------
+    percentile: float
+        The latency percentile after which to send the hedged request.
+    budget: float
+        The maximum fraction of requests which may be hedged.
+    ratelimit_reserve: float
+        Don't hedge while less than this fraction of the ratelimit remains.
+    window: int
+        How many of the most recent latencies to keep per endpoint.
+    min_samples: int
+        How many latencies an endpoint needs before it can be hedged.
+    max_workers: int
+        The maximum number of hedged requests which may be in flight at once.
+        Hedges beyond this wait for an earlier hedge to finish. Also the
+        maximum number of requests which may be in flight while waiting to see
+        whether they need hedging. Requests beyond this are sent without being
+        hedged.
+    """
+    # how many unused hedges we can save up for a burst of slow requests
+    MAX_TOKENS = 10
+
+    def __init__(self, *,
+        percentile=0.95,
+        budget=0.05,
+        ratelimit_reserve=0.2,
+        window=100,
+        min_samples=20,
+        max_workers=32
+    ):
+        if not 0 <= budget <= 1:
+            raise ValueError(f"`budget` must be in [0, 1], got {budget}")
+        self.percentile = percentile
+        self.budget = budget
+        self.ratelimit_reserve = ratelimit_reserve
+        self.window = window
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+
+        self.hedged = 0
+        self.hedges_won = 0
+        self._latencies = {}
+        self._tokens = 0
+        self._ratelimit = None
+        self._ratelimit_remaining = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._primary_executor = None
+        self._primary_slots = threading.BoundedSemaphore(max_workers)
+        self.log = logging.getLogger(__name__)
+
+    def latencies(self, endpoint):
+        with self._lock:
+            tracker = self._latencies.get(endpoint)
+            if tracker is None:
+                tracker = LatencyTracker(self.window)
+                self._latencies[endpoint] = tracker
+            return tracker
+
+    def delay(self, endpoint):
+        """
+        How long in seconds to wait on a request to ``endpoint`` before hedging
+        it, or ``None`` if requests to ``endpoint`` shouldn't be hedged yet.
+        """
+        tracker = self.latencies(endpoint)
+        if len(tracker) < self.min_samples:
+            return None
+        return tracker.percentile(self.percentile)
+
+    def _observe(self, response):
+        headers = response.headers
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        if limit is None or remaining is None:
+            return
+        with self._lock:
+            self._ratelimit = int(limit)
+            self._ratelimit_remaining = int(remaining)
+
+    def _acquire_hedge(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            if (self._ratelimit and self._ratelimit_remaining <
+                self._ratelimit * self.ratelimit_reserve):
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def _timed(self, endpoint, send):
+        """
+        ``send``, wrapped to record its latency and the ratelimit reported by
+        its response.
+        """
+        def timed_send():
+            start = time.monotonic()
+            response = send()
+            self.latencies(endpoint).add(time.monotonic() - start)
+            self._observe(response)
+            return response
+        return timed_send
+
+    def _submit_primary(self, function):
+        """
+        Runs ``function`` on a primary worker and returns a future for its
+        result, or returns ``None`` if every primary worker is busy.
+        """
+        # primaries are never queued, since every one has a caller waiting on
+        # it
+        if not self._primary_slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            if self._primary_executor is None:
+                self._primary_executor = ThreadPoolExecutor(self.max_workers,
+                    thread_name_prefix="ossapi-request")
+        future = self._primary_executor.submit(function)
+        future.add_done_callback(lambda _: self._primary_slots.release())
+        return future
+
+    def _submit_hedge(self, function):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers,
+                    thread_name_prefix="ossapi-hedge")
+        return self._executor.submit(function)
+
+    def execute(self, endpoint, send):
+        """
+        Calls ``send`` (which makes a request to ``endpoint`` and returns its
+        response), hedging it if it takes too long. Returns the first
+        successful response.
+        """
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget, self.MAX_TOKENS)
+
+        delay = self.delay(endpoint)
+        timed_send = self._timed(endpoint, send)
+        # requests which can't be hedged don't need to wait on another thread
+        if delay is None:
+            return timed_send()
+
+        # the primary request runs on a worker, since the calling thread needs
+        # to be free to hedge it. If every worker is busy, it's sent from the
+        # calling thread without being hedged instead.
+        primary = self._submit_primary(timed_send)
+        if primary is None:
+            return timed_send()
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._acquire_hedge():
+            return primary.result()
+
+        self.log.debug(f"hedging request to {endpoint} after {delay:.3f}s")
+        hedge = self._submit_hedge(timed_send)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if
+                future.exception() is None]
+            # if one of the requests errored, fall back to the other one. Only
+            # raise if both of them errored.
+            if not succeeded:
+                if pending:
+                    continue
+                return primary.result()
+            if hedge in succeeded and primary not in succeeded:
+                with self._lock:
+                    self.hedges_won += 1
+                return hedge.result()
+            # the hedge isn't needed if it hasn't started yet
+            hedge.cancel()
+            return succeeded[0].result()
+
+    def __call__(self, request, next_):
+        if request.method != "GET":
+            return next_(request)
+        return self.execute(request.endpoint, lambda: next_(request))
+
+    def metrics(self):
+        return {"hedged_requests": self.hedged, "hedges_won": self.hedges_won}
+
+    def close(self):
+        for executor in [self._executor, self._primary_executor]:
+            if executor is not None:
+                executor.shutdown(wait=False)
@@ -0,0 +1,518 @@
+from pathlib import Path
+import threading
+import re
+import hashlib
+import sqlite3
+import time
+
+from ossapi.middleware import Middleware, Request
+from ossapi.models import BeatmapCompact, UserCompact, UsernameChangeEvent
+from ossapi.enums import UserLookupKey
+from ossapi.entities import walk
+from ossapi.cache import CacheMissError
+
+
+class IndexedBeatmap:
+    """
+    What a ``BeatmapIndex`` knows about a beatmap.
+    """
+    def __init__(self, checksum, beatmap_id, beatmapset_id, mode, version,
+        status, updated_at):
+        self.checksum = checksum
+        self.beatmap_id = beatmap_id
+        self.beatmapset_id = beatmapset_id
+        # the mode as returned by the api (eg ``"osu"``), or ``None`` if
+        # unknown
+        self.mode = mode
+        self.version = version
+        # the ``RankStatus`` value, or ``None`` if unknown
+        self.status = status
+        # when this entry was last updated, as a unix timestamp
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return (f"IndexedBeatmap(checksum={self.checksum!r}, "
+            f"beatmap_id={self.beatmap_id}, "
+            f"beatmapset_id={self.beatmapset_id}, version={self.version!r})")
+
+
+class _Index(Middleware):
+    """
+    A middleware which keeps an index in a SQLite database, created with
+    ``SCHEMA``.
+    """
+    SCHEMA = None
+    # how many values to look up in a single query
+    _MAX_VARIABLES = 500
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self._lock = threading.Lock()
+        # an in memory database only exists for the connection which created
+        # it, so every thread shares one connection (guarded by ``_lock``).
+        self._db = sqlite3.connect(self.path or ":memory:",
+            check_same_thread=False, isolation_level=None)
+        if self.path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(self.SCHEMA)
+
+    def _write(self, statements):
+        """
+        Runs every ``(sql, parameters)`` pair in ``statements`` in a single
+        transaction.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters in statements:
+                    self._db.execute(sql, parameters)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self):
+        self._db.close()
+
+
+class BeatmapIndex(_Index):
+    """
+    A persistent index from beatmap checksums (the md5 hash of the ``.osu``
+    file) to beatmap ids.
+
+    Every beatmap with a checksum found in any response is added to the index.
+    Lookups by checksum (``api.beatmap(checksum=...)``, and so
+    ``Replay.beatmap``) of indexed beatmaps are turned into lookups by id,
+    which an ``EntityStore`` or ``ResponseCache`` can answer without a request.
+    If the beatmap returned by the api no longer has the checksum we looked up
+    (because the beatmap was updated since we indexed it), the entry is removed
+    and the lookup by checksum is made after all.
+
+    The index can also be seeded ahead of time from a local osu! songs folder
+    with ``import_songs``, or from any other listing with ``add``.
+
+    Parameters
+    ----------
+    path: str or Path
+        Where to keep the index, as a SQLite database. It is created if it
+        doesn't exist. If not passed, the index is kept in memory only.
+    """
+    SCHEMA = """CREATE TABLE IF NOT EXISTS beatmaps (
+        checksum TEXT PRIMARY KEY,
+        beatmap_id INTEGER NOT NULL,
+        beatmapset_id INTEGER,
+        mode TEXT,
+        version TEXT,
+        status INTEGER,
+        updated_at REAL NOT NULL
+    )"""
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM beatmaps").fetchone()[0]
+
+    def get(self, checksum):
+        """
+        The ``IndexedBeatmap`` with ``checksum``, or ``None`` if it isn't
+        indexed.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM beatmaps WHERE checksum = ?",
+                [checksum]).fetchone()
+        if row is None:
+            return None
+        return IndexedBeatmap(*row)
+
+    def add(self, beatmaps):
+        """
+        Indexes every beatmap in ``beatmaps``, which may be ``BeatmapCompact``
+        models or ``IndexedBeatmap``s. Beatmaps without a checksum are ignored.
+        Beatmaps which are already indexed with the same values are left
+        alone, and keep their ``updated_at``.
+        """
+        now = time.time()
+        # checksum to row, so a beatmap found several times in one response is
+        # only written once
+        rows = {}
+        for beatmap in beatmaps:
+            if isinstance(beatmap, IndexedBeatmap):
+                rows[beatmap.checksum] = [beatmap.checksum, beatmap.beatmap_id,
+                    beatmap.beatmapset_id, beatmap.mode, beatmap.version,
+                    beatmap.status, now]
+                continue
+            if not beatmap.checksum:
+                continue
+            rows[beatmap.checksum] = [beatmap.checksum, beatmap.id,
+                beatmap.beatmapset_id, beatmap.mode.value, beatmap.version,
+                beatmap.status.value, now]
+
+        # most responses only contain beatmaps we've already indexed, so check
+        # for changes before taking the write lock.
+        checksums = list(rows)
+        for i in range(0, len(checksums), self._MAX_VARIABLES):
+            batch = checksums[i:i + self._MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(batch))
+            with self._lock:
+                indexed = self._db.execute("SELECT checksum, beatmap_id, "
+                    "beatmapset_id, mode, version, status FROM beatmaps WHERE "
+                    f"checksum IN ({placeholders})", batch).fetchall()
+            for checksum, *values in indexed:
+                if rows[checksum][1:6] == values:
+                    del rows[checksum]
+        if not rows:
+            return
+        # another thread (or process) may have indexed the same beatmap since,
+        # so only update rows which actually changed.
+        self._write(("INSERT INTO beatmaps VALUES (?, ?, ?, ?, ?, ?, ?) ON "
+            "CONFLICT (checksum) DO UPDATE SET beatmap_id = "
+            "excluded.beatmap_id, beatmapset_id = excluded.beatmapset_id, "
+            "mode = excluded.mode, version = excluded.version, status = "
+            "excluded.status, updated_at = excluded.updated_at WHERE "
+            "beatmaps.beatmap_id IS NOT excluded.beatmap_id OR "
+            "beatmaps.beatmapset_id IS NOT excluded.beatmapset_id OR "
+            "beatmaps.mode IS NOT excluded.mode OR beatmaps.version IS NOT "
+            "excluded.version OR beatmaps.status IS NOT excluded.status", row)
+            for row in rows.values())
+
+    def delete(self, checksum):
+        self._write([("DELETE FROM beatmaps WHERE checksum = ?", [checksum])])
+
+    def import_songs(self, path):
+        """
+        Indexes every submitted beatmap in a local osu! songs folder (or any
+        folder containing ``.osu`` files), and returns how many were indexed.
+        """
+        beatmaps = []
+        for osu_file in Path(path).rglob("*.osu"):
+            beatmap = self._read_osu_file(osu_file)
+            if beatmap is not None:
+                beatmaps.append(beatmap)
+        self.add(beatmaps)
+        return len(beatmaps)
+
+    @staticmethod
+    def _read_osu_file(path):
+        data = path.read_bytes()
+        checksum = hashlib.md5(data).hexdigest()
+        values = {}
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            # the values we want are all in the [General] and [Metadata]
+            # sections, which come before the (much longer) hit objects.
+            if line.strip() == "[HitObjects]":
+                break
+            key, sep, value = line.partition(":")
+            if sep:
+                values[key.strip()] = value.strip()
+        try:
+            beatmap_id = int(values.get("BeatmapID", 0))
+            beatmapset_id = int(values.get("BeatmapSetID", -1))
+        except ValueError:
+            return None
+        # unsubmitted beatmaps have no (or a non-positive) id
+        if beatmap_id <= 0:
+            return None
+        modes = ["osu", "taiko", "fruits", "mania"]
+        mode = values.get("Mode", "0")
+        mode = modes[int(mode)] if mode in ["0", "1", "2", "3"] else None
+        return IndexedBeatmap(checksum, beatmap_id,
+            beatmapset_id if beatmapset_id > 0 else None, mode,
+            values.get("Version"), None, time.time())
+
+    def __call__(self, request, next_):
+        arguments = request.arguments
+        if (request.method == "GET" and request.endpoint == "beatmap" and
+            arguments.get("checksum") and not arguments.get("beatmap_id") and
+            not arguments.get("filename")):
+            response = self._lookup(request, next_)
+        else:
+            response = None
+
+        if response is None:
+            response = next_(request)
+        if response.status_code == 200:
+            self.add(model for model in walk(response.decode()) if
+                isinstance(model, BeatmapCompact))
+        return response
+
+    def _lookup(self, request, next_):
+        """
+        Looks up the beatmap ``request`` asks for by id instead of by checksum,
+        if it's indexed. Returns ``None`` if that isn't possible.
+        """
+        checksum = request.arguments["checksum"]
+        indexed = self.get(checksum)
+        if indexed is None:
+            return None
+
+        beatmap_id = indexed.beatmap_id
+        params = {"checksum": None, "filename": None, "id": beatmap_id}
+        arguments = {"beatmap_id": beatmap_id, "checksum": None,
+            "filename": None}
+        by_id = Request("GET", request.url, params, {}, request.type_,
+            "beatmap", arguments)
+        by_id.refresh = request.refresh
+        by_id.max_age = request.max_age
+        by_id.only_if_cached = request.only_if_cached
+        by_id.stale_ok = request.stale_ok
+        try:
+            response = next_(by_id)
+        except CacheMissError:
+            # the lookup by the original key may still be cached
+            return None
+        if response.status_code != 200:
+            return None
+        if response.decode().checksum != checksum:
+            # the beatmap was updated since we indexed it
+            self.delete(checksum)
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def metrics(self):
+        return {"beatmap_index_hits": self.hits}
+
+
+class UsernameIndex(_Index):
+    """
+    A persistent index from usernames to user ids, which tracks renames.
+
+    The current username (and any previous usernames) of every user found in
+    any response is added to the index, as are the renames in any
+    ``UsernameChangeEvent`` returned by ``api.user_recent_activity``. Lookups
+    by username (``api.user(name, key=UserLookupKey.USERNAME)``, and so
+    ``Replay.user``) of indexed usernames are turned into lookups by id, which
+    an ``EntityStore`` or ``ResponseCache`` can answer without a request.
+
+    Every response is indexed as of when it was received from the api (see
+    ``Response.received_at``), so a response answered by a cache long after
+    a rename doesn't undo it. Like the api, the index resolves previous
+    usernames to the user who had them, unless someone else has taken the name
+    since. Usernames are matched
+    case insensitively. If the user returned by the api doesn't have (and
+    never had) the username we looked up, the entry is removed and the lookup
+    by username is made after all.
+
+    Parameters
+    ----------
+    path: str or Path
+        Where to keep the index, as a SQLite database. It is created if it
+        doesn't exist. If not passed, the index is kept in memory only.
+    """
+    # ``current`` is whether ``username`` is the user's username right now, as
+    # opposed to a previous username of theirs. ``updated_at`` is when we
+    # learned this, so we never replace newer information with older.
+    SCHEMA = """CREATE TABLE IF NOT EXISTS usernames (
+        username TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        current INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )"""
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        # for finding every username of a user
+        self._db.execute("CREATE INDEX IF NOT EXISTS usernames_user_id ON "
+            "usernames (user_id)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM usernames").fetchone()[0]
+
+    def get(self, username):
+        """
+        The id of the user with (or who previously had) ``username``, or
+        ``None`` if it isn't indexed.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT user_id FROM usernames WHERE "
+                "username = ?", [username.lower()]).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def _rename(user_id, username, at):
+        """
+        The statements which record that ``user_id`` has been called
+        ``username`` since ``at``.
+        """
+        username = username.lower()
+        return [
+            # the user's other usernames are now previous usernames
+            ("UPDATE usernames SET current = 0, updated_at = ? WHERE "
+                "user_id = ? AND current = 1 AND username != ? AND "
+                "updated_at <= ?", [at, user_id, username, at]),
+            ("INSERT INTO usernames VALUES (?, ?, 1, ?) ON CONFLICT (username) "
+                "DO UPDATE SET user_id = excluded.user_id, current = 1, "
+                "updated_at = excluded.updated_at WHERE excluded.updated_at >= "
+                "usernames.updated_at", [username, user_id, at])
+        ]
+
+    @staticmethod
+    def _previous(user_id, username, at):
+        """
+        The statements which record that ``user_id`` was called ``username``
+        before ``at``.
+        """
+        # a previous username only replaces another user's entry if that is a
+        # previous username too. Otherwise, someone else has taken the name.
+        return [("INSERT INTO usernames VALUES (?, ?, 0, ?) ON CONFLICT "
+            "(username) DO UPDATE SET user_id = excluded.user_id, current = 0, "
+            "updated_at = excluded.updated_at WHERE (usernames.current = 0 OR "
+            "usernames.user_id = excluded.user_id) AND excluded.updated_at >= "
+            "usernames.updated_at", [username.lower(), user_id, at])]
+
+    def _indexed(self, usernames, user_ids):
+        """
+        The ``(user_id, current, updated_at)`` of each of ``usernames`` which
+        is indexed, and the current usernames of each of ``user_ids`` (with
+        their ``updated_at``).
+        """
+        entries = {}
+        current = {}
+        queries = [
+            ("SELECT username, user_id, current, updated_at FROM usernames "
+                "WHERE username IN ({})", list(usernames)),
+            ("SELECT username, user_id, current, updated_at FROM usernames "
+                "WHERE current = 1 AND user_id IN ({})", list(user_ids))
+        ]
+        for sql, values in queries:
+            for i in range(0, len(values), self._MAX_VARIABLES):
+                batch = values[i:i + self._MAX_VARIABLES]
+                placeholders = ", ".join("?" * len(batch))
+                with self._lock:
+                    rows = self._db.execute(sql.format(placeholders),
+                        batch).fetchall()
+                for username, user_id, is_current, updated_at in rows:
+                    entries[username] = (user_id, is_current, updated_at)
+                    if is_current:
+                        current.setdefault(user_id, {})[username] = updated_at
+        return entries, current
+
+    def add(self, users, at=None):
+        """
+        Indexes the current and previous usernames of every ``UserCompact`` in
+        ``users``, as of ``at`` (a unix timestamp, defaulting to now), which is
+        when the api returned them.
+        """
+        at = time.time() if at is None else at
+        # user id to ``(username, previous usernames)``
+        names = {}
+        for user in users:
+            names[user.id] = (user.username.lower(), {username.lower() for
+                username in user.previous_usernames or []})
+        if not names:
+            return
+        usernames = set()
+        for username, previous in names.values():
+            usernames |= {username, *previous}
+        # most responses only contain users we've already indexed, so check
+        # which statements would change anything before taking the write
+        # lock. These are the same conditions the statements check, except
+        # that an entry which is already right isn't updated just to move its
+        # ``updated_at`` forward.
+        entries, current = self._indexed(usernames, names)
+        statements = []
+        for user_id, (username, previous) in names.items():
+            entry = entries.get(username)
+            others = current.get(user_id, {})
+            if (entry is None or entry[:2] != (user_id, 1) and
+                entry[2] <= at or any(updated_at <= at for other, updated_at
+                in others.items() if other != username)):
+                statements += self._rename(user_id, username, at)
+            for previous_username in previous - {username}:
+                entry = entries.get(previous_username)
+                if (entry is None or entry[:2] != (user_id, 0) and
+                    entry[2] <= at and (not entry[1] or entry[0] == user_id)):
+                    statements += self._previous(user_id, previous_username,
+                        at)
+        if statements:
+            self._write(statements)
+
+    def add_renames(self, events, user_id=None):
+        """
+        Indexes the renames in every ``UsernameChangeEvent`` in ``events``.
+        ``user_id`` is the id of the user the events are for, if known.
+        """
+        statements = []
+        for event in events:
+            # the user's url ends in their id, eg
+            # ``https://osu.ppy.sh/users/12092800``
+            match = re.search(r"/(?:u|users)/(\d+)", event.user.url)
+            event_user_id = int(match.group(1)) if match else user_id
+            if event_user_id is None:
+                continue
+            at = event.created_at.timestamp()
+            statements += self._rename(event_user_id, event.user.username, at)
+            if event.user.previousUsername:
+                statements += self._previous(event_user_id,
+                    event.user.previousUsername, at)
+        if statements:
+            self._write(statements)
+
+    def delete(self, username):
+        self._write([("DELETE FROM usernames WHERE username = ?",
+            [username.lower()])])
+
+    def __call__(self, request, next_):
+        arguments = request.arguments
+        if (request.method == "GET" and request.endpoint == "user" and
+            arguments.get("key") is UserLookupKey.USERNAME):
+            response = self._lookup(request, next_)
+        else:
+            response = None
+
+        if response is None:
+            response = next_(request)
+        if response.status_code != 200:
+            return response
+        models = list(walk(response.decode()))
+        # the response may have been answered by a cache, long after the api
+        # returned it. It's only as up to date as when it was received.
+        self.add((model for model in models if isinstance(model, UserCompact)),
+            response.received_at)
+        user_id = arguments.get("user_id")
+        self.add_renames((model for model in models if
+            isinstance(model, UsernameChangeEvent)),
+            user_id if isinstance(user_id, int) else None)
+        return response
+
+    def _lookup(self, request, next_):
+        """
+        Looks up the user ``request`` asks for by id instead of by username,
+        if it's indexed. Returns ``None`` if that isn't possible.
+        """
+        username = str(request.arguments["user"])
+        user_id = self.get(username)
+        if user_id is None:
+            return None
+
+        mode = request.arguments["mode"]
+        base_url = request.url[:request.url.rindex("/users/")]
+        url = f"{base_url}/users/{user_id}/{mode.value if mode else ''}"
+        arguments = {"user": user_id, "mode": mode, "key": None}
+        by_id = Request("GET", url, {"key": None}, {}, request.type_, "user",
+            arguments)
+        by_id.refresh = request.refresh
+        by_id.max_age = request.max_age
+        by_id.only_if_cached = request.only_if_cached
+        by_id.stale_ok = request.stale_ok
+        try:
+            response = next_(by_id)
+        except CacheMissError:
+            # the lookup by the original key may still be cached
+            return None
+        if response.status_code != 200:
+            return None
+        user = response.decode()
+        usernames = [user.username, *(user.previous_usernames or [])]
+        if username.lower() not in [name.lower() for name in usernames]:
+            # the username belongs to someone else now
+            self.delete(username)
+            return None
+        with self._lock:
+            self.hits += 1
+        return response
+
+    def metrics(self):
+        return {"username_index_hits": self.hits}
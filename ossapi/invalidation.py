@@ -0,0 +1,243 @@
+from collections import OrderedDict
+import threading
+import re
+
+from ossapi.middleware import Middleware, Request
+from ossapi.models import BeatmapCompact, BeatmapsetEvent
+from ossapi.enums import BeatmapsetEventType, GameMode
+from ossapi.entities import walk, kind_of
+from ossapi.utils import Model
+
+# beatmapset events which change the beatmapset (or its beatmaps) as returned
+# by the api, eg its status, genre, or nominations. Discussion and kudosu
+# events don't.
+BEATMAPSET_EVENTS = {
+    BeatmapsetEventType.APPROVE,
+    BeatmapsetEventType.BEATMAP_OWNER_CHANGE,
+    BeatmapsetEventType.DISQUALIFY,
+    BeatmapsetEventType.DISQUALIFY_LEGACY,
+    BeatmapsetEventType.GENRE_EDIT,
+    BeatmapsetEventType.LANGUAGE_EDIT,
+    BeatmapsetEventType.LOVE,
+    BeatmapsetEventType.NOMINATE,
+    BeatmapsetEventType.NOMINATION_RESET,
+    BeatmapsetEventType.NSFW_TOGGLE,
+    BeatmapsetEventType.QUALIFY,
+    BeatmapsetEventType.RANK,
+    BeatmapsetEventType.REMOVE_FROM_LOVED
+}
+
+# the kind of entity each url path segment refers to, in the urls of user
+# activity events (eg ``/b/221777?m=0`` or ``/users/12092800``)
+_URL_KINDS = {
+    "u": "user", "users": "user",
+    "b": "beatmap", "beatmaps": "beatmap",
+    "s": "beatmapset", "beatmapsets": "beatmapset"
+}
+_URL = re.compile(r"/(u|users|b|beatmaps|s|beatmapsets)/(\d+)")
+
+# endpoint arguments which hold the id of an entity the response is about, eg
+# ``beatmap_id`` of ``beatmap_scores``
+_ARGUMENT_KINDS = {
+    "user": "user", "user_id": "user",
+    "beatmap_id": "beatmap",
+    "beatmapset_id": "beatmapset"
+}
+
+def _entity_from_url(url):
+    """
+    The ``(kind, id)`` of the entity ``url`` links to, or ``None``.
+    """
+    match = _URL.search(url or "")
+    if match is None:
+        return None
+    return (_URL_KINDS[match.group(1)], int(match.group(2)))
+
+
+class EventInvalidator(Middleware):
+    """
+    Invalidates cached responses and stored entities when the api reports that
+    they changed, in the events returned by ``beatmapset_events`` and
+    ``user_recent_activity``.
+
+    This lets beatmaps and beatmapsets be cached for a long time (much longer
+    than ``DEFAULT_TTLS``), since they're dropped from the cache as soon as an
+    event says their status (or anything else about them) changed:
+
+    * beatmapset events which change a beatmapset (see ``BEATMAPSET_EVENTS``,
+      eg ``qualify``, ``rank``, ``love``, ``disqualify``, ``nsfw_toggle``, or
+      ``genre_edit``) invalidate the beatmapset and its beatmaps.
+    * every event in a user's recent activity invalidates that user, since it
+      means their profile changed. Rank events also invalidate their beatmap,
+      and beatmapset events (like ``BeatmapsetUpdateEvent``) their
+      beatmapset and its beatmaps.
+
+    To find the cached responses to invalidate, every response which may be
+    cached is tagged with the users, beatmaps, and beatmapsets it contains (or
+    that its request was about, like the beatmap of ``beatmap_scores``).
+    Invalidating an entity invalidates every response tagged with it, as well
+    as the responses to looking it up directly, even if they weren't tagged.
+    Only what was stored before the event (plus ``margin``) is invalidated, so
+    seeing the same event again in a later poll doesn't invalidate anything
+    which was fetched since.
+
+    Events are only seen if you request them, eg by polling
+    ``api.beatmapset_events()`` every few minutes.
+
+    Parameters
+    ----------
+    cache: ResponseCache
+        The cache to invalidate responses in.
+    entity_store: EntityStore
+        The store to invalidate entities in.
+    margin: float
+        How many seconds after an event something must have been stored to not
+        be invalidated by it. Covers differences between our clock and the
+        api's, and the api taking a moment to reflect an event everywhere.
+    max_tagged: int
+        How many responses to remember the tags of. The least recently tagged
+        responses are forgotten first, and are only invalidated if they're the
+        response to a direct lookup.
+    """
+    def __init__(self, cache=None, entity_store=None, *, margin=60,
+        max_tagged=100_000):
+        self.cache = cache
+        self.entity_store = entity_store
+        self.margin = margin
+        self.max_tagged = max_tagged
+
+        self.invalidated_responses = 0
+        self.invalidated_entities = 0
+        self._lock = threading.Lock()
+        # request key to the ``(kind, id)`` of every entity its response was
+        # tagged with, least recently tagged first
+        self._tagged = OrderedDict()
+        # ``(kind, id)`` to the keys of the requests tagged with it
+        self._keys = {}
+        # beatmapset id to the ids of its beatmaps we know of
+        self._beatmaps = {}
+
+    def __call__(self, request, next_):
+        response = next_(request)
+        if request.method != "GET" or response.status_code != 200:
+            return response
+        if self.cache is not None and self.cache.cacheable(request):
+            self._tag(request, response.decode())
+
+        if request.endpoint == "beatmapset_events":
+            events = response.decode().events
+            self._beatmapset_events(events, request.key)
+        elif request.endpoint == "user_recent_activity":
+            user_id = request.arguments["user_id"]
+            self._user_activity(user_id, response.decode(), request.key)
+        return response
+
+    def _tag(self, request, model):
+        tags = set()
+        for name, kind in _ARGUMENT_KINDS.items():
+            value = request.arguments.get(name)
+            if isinstance(value, int) and not isinstance(value, bool):
+                tags.add((kind, value))
+        beatmaps = []
+        for value in walk(model):
+            kind = kind_of(value)
+            if kind is not None:
+                tags.add((kind[0], value.id))
+            if isinstance(value, BeatmapCompact) and value.beatmapset_id:
+                beatmaps.append((value.beatmapset_id, value.id))
+
+        key = request.key
+        with self._lock:
+            for beatmapset_id, beatmap_id in beatmaps:
+                self._beatmaps.setdefault(beatmapset_id, set()).add(beatmap_id)
+            self._untag(key)
+            self._tagged[key] = tags
+            for tag in tags:
+                self._keys.setdefault(tag, set()).add(key)
+            while len(self._tagged) > self.max_tagged:
+                self._untag(next(iter(self._tagged)))
+
+    def _untag(self, key):
+        tags = self._tagged.pop(key, ())
+        for tag in tags:
+            keys = self._keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys[tag]
+
+    def _beatmapset_events(self, events, key):
+        for event in events:
+            if (not isinstance(event, BeatmapsetEvent) or
+                event.type not in BEATMAPSET_EVENTS or
+                event.beatmapset is None):
+                continue
+            before = event.created_at.timestamp() + self.margin
+            self.invalidate("beatmapset", event.beatmapset.id, before,
+                keep=key)
+
+    def _user_activity(self, user_id, events, key):
+        if not isinstance(user_id, int):
+            # looked up by username, which we don't know the id of
+            user_id = None
+        for event in events:
+            before = event.created_at.timestamp() + self.margin
+            for name, value in vars(event).items():
+                if not isinstance(value, Model) or name == "_api":
+                    continue
+                entity = _entity_from_url(getattr(value, "url", None))
+                if entity is not None:
+                    self.invalidate(*entity, before, keep=key)
+            if user_id is not None:
+                self.invalidate("user", user_id, before, keep=key)
+
+    def _direct_keys(self, kind, id_):
+        """
+        The keys of the requests which look up the entity of ``kind`` with
+        ``id_`` directly.
+        """
+        if kind == "user":
+            modes = ["", *(mode.value for mode in GameMode)]
+            lookups = [(f"/users/{id_}/{mode}", {}) for mode in modes]
+        elif kind == "beatmap":
+            lookups = [("/beatmaps/lookup", {"id": id_}),
+                ("/beatmapsets/lookup", {"beatmap_id": id_})]
+        else:
+            lookups = [(f"/beatmapsets/{id_}", {})]
+        return [Request("GET", url, params, {}, None).key for url, params in
+            lookups]
+
+    def invalidate(self, kind, id_, before, *, keep=None):
+        """
+        Invalidates the entity of ``kind`` (``"user"``, ``"beatmap"``, or
+        ``"beatmapset"``) with ``id_``, and every cached response which
+        contains it, if they were stored before ``before`` (a unix timestamp).
+        Invalidating a beatmapset also invalidates its beatmaps. The response
+        cached under ``keep``, if passed, is never invalidated.
+        """
+        entities = [(kind, id_)]
+        if kind == "beatmapset":
+            with self._lock:
+                beatmap_ids = list(self._beatmaps.get(id_, ()))
+            entities += [("beatmap", beatmap_id) for beatmap_id in beatmap_ids]
+
+        for kind, id_ in entities:
+            if (self.entity_store is not None and
+                self.entity_store.invalidate(kind, id_, before)):
+                with self._lock:
+                    self.invalidated_entities += 1
+            if self.cache is None:
+                continue
+            with self._lock:
+                keys = set(self._keys.get((kind, id_), ()))
+            keys.update(self._direct_keys(kind, id_))
+            keys.discard(keep)
+            for key in keys:
+                if self.cache.invalidate(key, before):
+                    with self._lock:
+                        self.invalidated_responses += 1
+
+    def metrics(self):
+        return {
+            "invalidated_responses": self.invalidated_responses,
+            "invalidated_entities": self.invalidated_entities
+        }
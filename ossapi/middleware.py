@@ -0,0 +1,145 @@
+from urllib.parse import urlencode
+import threading
+
+
+class Request:
+    """
+    A request to the api, as it passes through ``OssapiV2``'s middleware
+    chain.
+
+    Attributes
+    ----------
+    method: str
+        The http method of the request.
+    url: str
+        The url of the request, relative to ``OssapiV2.BASE_URL``.
+    params: dict
+        The query parameters of the request, already formatted by
+        ``OssapiV2._format_params``.
+    data: dict
+        The form data of the request.
+    type_: type
+        The type the response will be decoded into.
+    headers: dict
+        Extra headers to send with the request.
+    low_priority: bool
+        Whether this request was made in the background (eg to refresh a
+        cached response) rather than by a caller waiting on it.
+    refresh: bool
+        Whether the caller wants a fresh copy from the api, rather than one we
+        already have (eg in a cache). Set for ``expand(refresh=True)`` and
+        similar, and for endpoint methods called with ``no_cache=True``.
+    max_age: float
+        If not ``None``, the caller accepts a copy we already have (eg in a
+        cache) only if it was received from the api at most this many seconds
+        ago, regardless of how long we would otherwise consider it fresh for.
+        Set by calling an endpoint method with ``max_age=``.
+    only_if_cached: bool
+        Whether the caller only wants a copy we already have, and would rather
+        have ``CacheMissError`` raised than make a request to the api. Set by
+        calling an endpoint method with ``only_if_cached=True``.
+    stale_ok: bool
+        Whether the caller accepts a copy we already have even if it has
+        expired. Set by calling an endpoint method with ``stale_ok=True``.
+    endpoint: str
+        The name of the endpoint method which made this request (eg ``user``),
+        or the endpoint family if the request wasn't made by an endpoint
+        method.
+    arguments: dict
+        The arguments the endpoint method was called with, by name (eg
+        ``{"user": 12092800, "mode": None, "key": None}``).
+    family: str
+        The first path segment of the url, eg ``users`` for
+        ``/users/12092800/scores/best``.
+    """
+    def __init__(self, method, url, params, data, type_, endpoint=None,
+        arguments={}):
+        self.method = method
+        self.url = url
+        self.params = params
+        self.data = data
+        self.type_ = type_
+        self.headers = {}
+        self.low_priority = False
+        self.refresh = False
+        self.max_age = None
+        self.only_if_cached = False
+        self.stale_ok = False
+        self.family = url.lstrip("/").split("/", 1)[0]
+        self.endpoint = endpoint or self.family
+        self.arguments = arguments
+        self._key = None
+
+    @property
+    def key(self):
+        """
+        A key which is identical for two requests if and only if they result in
+        the same http request.
+        """
+        if self._key is None:
+            # requests drops parameters with a value of ``None``, so they don't
+            # make a request any different
+            params = [(k, v) for k, v in self.params.items() if v is not None]
+            self._key = (self.method, self.url,
+                urlencode(sorted(params), doseq=True))
+        return self._key
+
+    def __repr__(self):
+        return f"Request({self.method} {self.url}, params={self.params})"
+
+
+class Middleware:
+    """
+    Base class for ``OssapiV2`` middleware.
+
+    Every request made by ``OssapiV2`` passes through its middleware chain
+    (``OssapiV2.middleware``) in order, before being sent by its transport.
+    Each middleware is called with the ``Request`` and a ``next_`` function
+    which passes the request on to the rest of the chain and returns the
+    ``Response``. A middleware may modify the request, inspect or replace the
+    response, or return a response without calling ``next_`` at all, which
+    skips the rest of the chain (including the network).
+
+    The response is decoded into a model only after it leaves the chain, and
+    only if nothing decoded it already (see ``Response.decode``). A response
+    created by a middleware is decoded like any other response from the api.
+
+    Any callable with the signature ``(request, next_)`` works as a middleware,
+    but subclasses of this class can also report metrics, which are included
+    in ``OssapiV2.metrics``.
+    """
+    def __call__(self, request, next_):
+        return next_(request)
+
+    def metrics(self):
+        """
+        A dict of metrics to include in ``OssapiV2.metrics``.
+        """
+        return {}
+
+
+class BandwidthCounter(Middleware):
+    """
+    Counts the responses received per endpoint, and the bytes they took up both
+    over the wire and after decompressing.
+    """
+    def __init__(self):
+        # endpoint to ``[responses, wire bytes, decompressed bytes]``
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request, next_):
+        response = next_(request)
+        with self._lock:
+            counts = self._counts.setdefault(request.endpoint, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += response.wire_size
+            counts[2] += len(response.content)
+        return response
+
+    def metrics(self):
+        with self._lock:
+            return {"bytes": {endpoint: {"responses": responses,
+                "wire_bytes": wire, "decompressed_bytes": decompressed} for
+                endpoint, (responses, wire, decompressed) in
+                self._counts.items()}}
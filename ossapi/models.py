@@ -2,6 +2,7 @@
 # https://docs.python.org/3.7/whatsnew/3.7.html#pep-563-postponed-evaluation-of-annotations
 from __future__ import annotations
 from typing import Optional, TypeVar, Generic, Any, List, Union
+from dataclasses import FrozenInstanceError
 
 from ossapi.mod import Mod
 from ossapi.enums import (UserAccountHistory, ProfileBanner, UserBadge, Country,
@@ -14,7 +15,7 @@ from ossapi.enums import (UserAccountHistory, ProfileBanner, UserBadge, Country,
     BeatmapsetEventType, UserRelationType, UserLevel, UserGradeCounts,
     GithubUser, ChangelogSearch, ForumTopicType, ForumPostBody, ForumTopicSort,
     ChannelType, ReviewsConfig, NewsSearch)
-from ossapi.utils import Datetime, Model, BaseModel, Field
+from ossapi.utils import Datetime, Model, BaseModel, Field, freeze
 
 T = TypeVar("T")
 S = TypeVar("S")
@@ -104,8 +105,8 @@ class UserCompact(Model):
     # deprecated, replaced by rank_history
     rankHistory: Optional[RankHistory]
 
-    def expand(self) -> User:
-        return self._fk_user(self.id)
+    def expand(self, *, refresh=False) -> User:
+        return self._fk_user(self.id, refresh=refresh)
 
 class User(UserCompact):
     comments_count: int
@@ -128,9 +129,11 @@ class User(UserCompact):
     twitter: Optional[str]
     website: Optional[str]
 
-    def expand(self) -> User:
+    def expand(self, *, refresh=False) -> User:
         # we're already expanded, no need to waste an api call
-        return self
+        if not refresh:
+            return self
+        return self._fk_user(self.id, refresh=True)
 
 
 class BeatmapCompact(Model):
@@ -152,15 +155,17 @@ class BeatmapCompact(Model):
     failtimes: Optional[Failtimes]
     max_combo: Optional[int]
 
-    def expand(self) -> Beatmap:
-        return self._fk_beatmap(self.id)
+    def expand(self, *, refresh=False) -> Beatmap:
+        return self._fk_beatmap(self.id, refresh=refresh)
 
-    def user(self) -> User:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> User:
+        return self._fk_user(self.user_id, refresh=refresh)
 
-    def beatmapset(self) -> Union[Beatmapset, BeatmapsetCompact]:
+    def beatmapset(self, *,
+        refresh=False
+    ) -> Union[Beatmapset, BeatmapsetCompact]:
         return self._fk_beatmapset(self.beatmapset_id,
-            existing=self._beatmapset)
+            existing=self._beatmapset, refresh=refresh)
 
 class Beatmap(BeatmapCompact):
     total_length: int
@@ -188,12 +193,14 @@ class Beatmap(BeatmapCompact):
     # -----------------
     _beatmapset: Optional[Beatmapset] = Field(name="beatmapset")
 
-    def expand(self) -> Beatmap:
-        return self
+    def expand(self, *, refresh=False) -> Beatmap:
+        if not refresh:
+            return self
+        return self._fk_beatmap(self.id, refresh=True)
 
-    def beatmapset(self) -> Beatmapset:
+    def beatmapset(self, *, refresh=False) -> Beatmapset:
         return self._fk_beatmapset(self.beatmapset_id,
-            existing=self._beatmapset)
+            existing=self._beatmapset, refresh=refresh)
 
 
 class BeatmapsetCompact(Model):
@@ -240,11 +247,11 @@ class BeatmapsetCompact(Model):
     # undocumented
     track_id: Optional[int]
 
-    def expand(self) -> Beatmapset:
-        return self._fk_beatmapset(self.id)
+    def expand(self, *, refresh=False) -> Beatmapset:
+        return self._fk_beatmapset(self.id, refresh=refresh)
 
-    def user(self) -> Union[UserCompact, User]:
-        return self._fk_user(self.user_id, existing=self._user)
+    def user(self, *, refresh=False) -> Union[UserCompact, User]:
+        return self._fk_user(self.user_id, existing=self._user, refresh=refresh)
 
 class Beatmapset(BeatmapsetCompact):
     availability: Availability
@@ -262,8 +269,10 @@ class Beatmapset(BeatmapsetCompact):
     submitted_date: Optional[Datetime]
     tags: str
 
-    def expand(self) -> Beatmapset:
-        return self
+    def expand(self, *, refresh=False) -> Beatmapset:
+        if not refresh:
+            return self
+        return self._fk_beatmapset(self.id, refresh=True)
 
 
 class Match(Model):
@@ -298,8 +307,8 @@ class Score(Model):
     _user: Optional[UserCompact] = Field(name="user")
     match: Optional[Match]
 
-    def user(self) -> Union[UserCompact, User]:
-        return self._fk_user(self.user_id, existing=self._user)
+    def user(self, *, refresh=False) -> Union[UserCompact, User]:
+        return self._fk_user(self.user_id, existing=self._user, refresh=refresh)
 
 class BeatmapUserScore(Model):
     position: int
@@ -340,11 +349,11 @@ class Comment(Model):
     user_id: int
     votes_count: int
 
-    def user(self) -> User:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> User:
+        return self._fk_user(self.user_id, refresh=refresh)
 
-    def edited_by(self) -> Optional[User]:
-        return self._fk_user(self.edited_by_id)
+    def edited_by(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.edited_by_id, refresh=refresh)
 
 # Cursors are an interesting case. As I understand it, they don't have a
 # predefined set of attributes across all endpoints, but instead differ per
@@ -359,6 +368,10 @@ class Comment(Model):
 # so make `_data` optional and also allow arbitrary `kwargs`.
 
 class Cursor(BaseModel):
+    # set by ``freeze``. Kept out of ``__dict__``, which holds only the
+    # cursor's values.
+    __slots__ = ["_frozen"]
+
     def __init__(self, _data=None, **kwargs):
         super().__init__()
         # allow Cursor to be instantiated with another cursor as a no-op
@@ -367,6 +380,23 @@ class Cursor(BaseModel):
         _data = _data or kwargs
         self.__dict__.update(_data)
 
+    def __setattr__(self, name, value):
+        if getattr(self, "_frozen", False):
+            raise FrozenInstanceError(f"cannot assign to attribute {name!r} "
+                f"of a frozen {type(self).__name__}")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if getattr(self, "_frozen", False):
+            raise FrozenInstanceError(f"cannot delete attribute {name!r} of a "
+                f"frozen {type(self).__name__}")
+        super().__delattr__(name)
+
+    def _freeze(self):
+        for name, value in self.__dict__.items():
+            self.__dict__[name] = freeze(value)
+        object.__setattr__(self, "_frozen", True)
+
     def __repr__(self):
         keys = sorted(self.__dict__)
         items = (f"{k}={self.__dict__[k]!r}" for k in keys)
@@ -402,11 +432,11 @@ class ForumPost(Model):
     user_id: int
     body: ForumPostBody
 
-    def user(self) -> User:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> User:
+        return self._fk_user(self.user_id, refresh=refresh)
 
-    def edited_by(self) -> Optional[User]:
-        return self._fk_user(self.edited_by_id)
+    def edited_by(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.edited_by_id, refresh=refresh)
 
 class ForumTopic(Model):
     created_at: Datetime
@@ -422,8 +452,8 @@ class ForumTopic(Model):
     updated_at: Datetime
     user_id: int
 
-    def user(self) -> User:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> User:
+        return self._fk_user(self.user_id, refresh=refresh)
 
 class ForumTopicAndPosts(Model):
     cursor: CursorT
@@ -486,14 +516,14 @@ class BeatmapsetDiscussionPost(Model):
     updated_at: Datetime
     deleted_at: Optional[Datetime]
 
-    def user(self) -> user:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> user:
+        return self._fk_user(self.user_id, refresh=refresh)
 
-    def last_editor(self) -> Optional[User]:
-        return self._fk_user(self.last_editor_id)
+    def last_editor(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.last_editor_id, refresh=refresh)
 
-    def deleted_by(self) -> Optional[User]:
-        return self._fk_user(self.deleted_by_id)
+    def deleted_by(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.deleted_by_id, refresh=refresh)
 
 class BeatmapsetDiscussion(Model):
     id: int
@@ -523,18 +553,23 @@ class BeatmapsetDiscussion(Model):
     _beatmap: Optional[BeatmapCompact] = Field(name="beatmap")
     _beatmapset: Optional[BeatmapsetCompact] = Field(name="beatmapset")
 
-    def user(self) -> User:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> User:
+        return self._fk_user(self.user_id, refresh=refresh)
 
-    def deleted_by(self) -> Optional[User]:
-        return self._fk_user(self.deleted_by_id)
+    def deleted_by(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.deleted_by_id, refresh=refresh)
 
-    def beatmapset(self) -> Union[Beatmapset, BeatmapsetCompact]:
+    def beatmapset(self, *,
+        refresh=False
+    ) -> Union[Beatmapset, BeatmapsetCompact]:
         return self._fk_beatmapset(self.beatmapset_id,
-            existing=self._beatmapset)
+            existing=self._beatmapset, refresh=refresh)
 
-    def beatmap(self) -> Union[Optional[Beatmap], BeatmapCompact]:
-        return self._fk_beatmap(self.beatmap_id, existing=self._beatmap)
+    def beatmap(self, *,
+        refresh=False
+    ) -> Union[Optional[Beatmap], BeatmapCompact]:
+        return self._fk_beatmap(self.beatmap_id, existing=self._beatmap,
+            refresh=refresh)
 
 class BeatmapsetDiscussionVote(Model):
     id: int
@@ -544,8 +579,8 @@ class BeatmapsetDiscussionVote(Model):
     created_at: Datetime
     updated_at: Datetime
 
-    def user(self):
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False):
+        return self._fk_user(self.user_id, refresh=refresh)
 
 class KudosuHistory(Model):
     id: int
@@ -566,8 +601,9 @@ class BeatmapPlaycount(Model):
     beatmapset: Optional[BeatmapsetCompact]
     count: int
 
-    def beatmap(self) -> Union[Beatmap, BeatmapCompact]:
-        return self._fk_beatmap(self.beatmap_id, existing=self._beatmap)
+    def beatmap(self, *, refresh=False) -> Union[Beatmap, BeatmapCompact]:
+        return self._fk_beatmap(self.beatmap_id, existing=self._beatmap,
+            refresh=refresh)
 
 
 # we use this class to determine which event dataclass to instantiate and
@@ -716,8 +752,8 @@ class MultiplayerScore(Model):
     scores_around: Optional[MultiplayerScoresAround]
     user: User
 
-    def beatmap(self):
-        return self._fk_beatmap(self.beatmap_id)
+    def beatmap(self, *, refresh=False):
+        return self._fk_beatmap(self.beatmap_id, refresh=refresh)
 
 class MultiplayerScoresAround(Model):
     higher: List[MultiplayerScore]
@@ -898,8 +934,8 @@ class BeatmapsetEvent(Model):
         type_ = BeatmapsetEventType(self.type)
         return {"comment": mapping[type_]}
 
-    def user(self) -> Optional[User]:
-        return self._fk_user(self.user_id)
+    def user(self, *, refresh=False) -> Optional[User]:
+        return self._fk_user(self.user_id, refresh=refresh)
 
 class ChatChannel(Model):
     channel_id: int
@@ -954,8 +990,9 @@ class UserRelation(Model):
     # ---------------
     target: Optional[UserCompact]
 
-    def target(self) -> Union[User, UserCompact]:
-        return self._fk_user(self.target_id, existing=self.target)
+    def target(self, *, refresh=False) -> Union[User, UserCompact]:
+        return self._fk_user(self.target_id, existing=self.target,
+            refresh=refresh)
 
 
 class UserStatistics(Model):
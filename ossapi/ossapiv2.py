@@ -11,6 +11,10 @@ import inspect
 import json
 import hashlib
 import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import itertools
 
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2 import (BackendApplicationClient, TokenExpiredError,
@@ -33,9 +37,23 @@ from ossapi.enums import (GameMode, ScoreType, RankingFilter, RankingType,
     SearchMode, MultiplayerScoresSort, BeatmapsetDiscussionVote,
     BeatmapsetDiscussionVoteSort, BeatmapsetStatus, MessageType)
 from ossapi.utils import (is_compatible_type, is_primitive_type, is_optional,
-    is_base_model_type, is_model_type, is_high_model_type, Field)
+    is_base_model_type, is_model_type, is_high_model_type, Field, freeze)
 from ossapi.mod import Mod
 from ossapi.replay import Replay
+from ossapi.circuitbreaker import CircuitBreaker
+from ossapi.hedging import HedgingPolicy
+from ossapi.concurrency import AIMDLimiter
+from ossapi.coalescing import RequestCoalescer
+from ossapi.transport import Transport, SessionTransport
+from ossapi.middleware import Request, Middleware, BandwidthCounter
+from ossapi.cache import ResponseCache, CacheGate
+from ossapi.entities import EntityStore
+from ossapi.archive import ResponseArchive
+from ossapi.invalidation import EventInvalidator
+from ossapi.digests import DigestCache
+from ossapi.indexes import BeatmapIndex, UsernameIndex
+from ossapi.encoder import write_dump, read_dump
+from ossapi.binary import unpack_model, CONTENT_TYPE as PACKED_CONTENT_TYPE
 
 # our ``request`` function below relies on the ordering of these types. The
 # base type must come first, with any auxiliary types that the base type accepts
@@ -64,6 +82,10 @@ BeatmapsetDiscussionVoteSortT = Union[BeatmapsetDiscussionVoteSort, str]
 MessageTypeT = Union[MessageType, str]
 BeatmapsetStatusT = Union[BeatmapsetStatus, str]
 
+# keyword arguments every endpoint method accepts, which control whether (and
+# how) it may be answered from a cache instead of the api. See ``Request``.
+CACHE_CONTROL = ["max_age", "no_cache", "only_if_cached", "stale_ok"]
+
 BeatmapIdT = Union[int, BeatmapCompact]
 UserIdT = Union[int, UserCompact]
 BeatmapsetIdT = Union[int, BeatmapCompact, BeatmapsetCompact]
@@ -87,6 +109,8 @@ def request(scope, *, requires_login=False):
     * converts arguments of type ``BeatmapIdT`` or ``UserIdT`` into a beatmap or
       user id, if the passed argument was a ``BeatmapCompact`` or
       ``UserCompact`` respectively.
+    * strips the cache control arguments (see ``CACHE_CONTROL``) every endpoint
+      accepts, and applies them to every request made by the endpoint.
 
     Parameters
     ----------
@@ -105,7 +129,8 @@ def request(scope, *, requires_login=False):
             if origin is Union and is_base_model_type(args[0]):
                 instantiate[name] = args[0]
 
-        arg_names = list(inspect.signature(function).parameters)
+        signature = inspect.signature(function)
+        arg_names = list(signature.parameters)
 
         @functools.wraps(function)
         def wrapper(*args, **kwargs):
@@ -120,6 +145,17 @@ def request(scope, *, requires_login=False):
                     "authorized using the authorization code grant. You are "
                     "currently authorized with the client credentials grant")
 
+            cache_control = {name: kwargs.pop(name) for name in CACHE_CONTROL
+                if name in kwargs}
+            if (cache_control.get("no_cache") and
+                cache_control.get("only_if_cached")):
+                raise ValueError("`no_cache` and `only_if_cached` can't both "
+                    "be True")
+            if (cache_control.get("max_age") is not None and
+                cache_control["max_age"] < 0):
+                raise ValueError("`max_age` must be at least 0, got "
+                    f"{cache_control['max_age']}")
+
             # we may need to edit this later so convert from tuple
             args = list(args)
 
@@ -162,11 +198,47 @@ def request(scope, *, requires_login=False):
                 if id_:
                     kwargs[arg_name] = id_
 
-            return function(*args, **kwargs)
+            # remember which endpoint we're in and what it was called with, so
+            # per-endpoint behavior (like latency tracking) further down the
+            # stack can find it.
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments[arg_names[0]]
+
+            previous = (getattr(self._local, "endpoint", None),
+                getattr(self._local, "arguments", {}),
+                getattr(self._local, "cache_control", {}))
+            self._local.endpoint = function.__name__
+            self._local.arguments = arguments
+            # endpoints called by other endpoints inherit their cache control
+            self._local.cache_control = {**previous[2], **cache_control}
+            try:
+                return function(*args, **kwargs)
+            finally:
+                (self._local.endpoint, self._local.arguments,
+                    self._local.cache_control) = previous
         return wrapper
     return decorator
 
 
+class NotFoundError(ValueError):
+    """
+    Raised when the api responds with ``404 Not Found``, usually because the
+    user, beatmap, or score which was requested doesn't exist or is
+    restricted.
+    """
+    def __init__(self, endpoint, url, error=None):
+        self.endpoint = endpoint
+        self.url = url
+        # the error message returned by the api, if any
+        self.error = error
+        message = f"`{endpoint}` found nothing for a request to {url}"
+        if error:
+            message += f" (api returned an error of `{error}`)"
+        super().__init__(message)
+
+
 class Grant(Enum):
     CLIENT_CREDENTIALS = "client"
     AUTHORIZATION_CODE = "authorization"
@@ -226,6 +298,13 @@ class OssapiV2:
         |br|
         If you are not a developer, you are very unlikely to want to use this
         parameter.
+    frozen: bool
+        Whether to return frozen models, which can't be modified (raising
+        ``dataclasses.FrozenInstanceError`` instead) and hold tuples instead of
+        lists and read-only ``types.MappingProxyType``s instead of dicts.
+        Cursors are frozen too. Since nobody can modify them, ``cache`` and
+        ``entity_store`` hand out the models they hold as is, instead of
+        copying them for every caller.
     token_directory: str
         If passed, the given directory will be used to store and retrieve token
         files instead of locally wherever ossapi is installed. Useful if you
@@ -236,6 +315,74 @@ class OssapiV2:
         taking responsibility for making sure it is unique / unused, and also
         for remembering the key you passed if you wish to eg remove the token in
         the future, which requires the key.
+    circuit_breaker: CircuitBreaker
+        If passed, requests are made through this circuit breaker. When the api
+        is failing or responding very slowly for an endpoint family, further
+        requests to that family raise ``CircuitOpenError`` immediately instead
+        of waiting on the api. See ``CircuitBreaker`` for details.
+    hedging: HedgingPolicy
+        If passed, ``GET`` requests which take longer than is usual for their
+        endpoint are sent a second time, and whichever response arrives first
+        is used. See ``HedgingPolicy`` for details.
+    concurrency_limiter: AIMDLimiter
+        If passed, limits how many requests this client has in flight at once.
+        The limit adapts to the api's latency and ratelimiting. Most useful
+        together with ``map``, which fans calls out over several threads.
+    coalesce: bool
+        Whether to coalesce identical concurrent ``GET`` requests. If a request
+        is made while an identical request is already in flight, it waits for
+        and shares the response of the in-flight request instead of making its
+        own.
+    transport: Transport
+        What to send http requests with. Defaults to sending them through the
+        ``OAuth2Session`` used for authentication. Pass ``Urllib3Transport()``
+        to send them on a plain pooled connection instead, which has less
+        overhead per request, or ``HttpxTransport()`` to multiplex them over a
+        single http/2 connection.
+    cache: ResponseCache
+        If passed, ``GET`` responses are cached in (and served from) this
+        cache, for as long as the cache's policy for their endpoint allows.
+        Every endpoint method also accepts ``max_age``, ``no_cache``,
+        ``only_if_cached``, and ``stale_ok`` arguments, which override that
+        policy for a single call. See ``ResponseCache`` for details.
+    entity_store: EntityStore
+        If passed, every user, beatmap, and beatmapset found in any response is
+        kept in this store. Later requests for one of them by id (including
+        through ``expand``) are answered from it, if it was looked up before.
+        See ``EntityStore`` for details.
+    invalidate_on_events: bool
+        Whether to invalidate responses in ``cache`` and entities in
+        ``entity_store`` when the events returned by ``beatmapset_events`` and
+        ``user_recent_activity`` say they changed (for instance, when a
+        beatmapset is ranked or a user renames themselves). This lets you cache
+        beatmaps and beatmapsets for much longer. See ``EventInvalidator`` for
+        details.
+    beatmap_index: BeatmapIndex
+        If passed, every beatmap found in any response is indexed by its
+        checksum, and lookups by checksum (like ``Replay.beatmap``) of indexed
+        beatmaps become lookups by id, which ``entity_store`` or ``cache`` can
+        answer. See ``BeatmapIndex`` for details.
+    username_index: UsernameIndex
+        If passed, the current and previous usernames of every user found in
+        any response (and renames found in ``user_recent_activity``) are
+        indexed, and lookups by username (like ``Replay.user``) of indexed
+        usernames become lookups by id, which ``entity_store`` or ``cache``
+        can answer. See ``UsernameIndex`` for details.
+    digest_cache: DigestCache
+        If passed, ``GET`` responses whose body is exactly the same as the last
+        response to the same request return the model decoded from that
+        response again, instead of being decoded again. Useful for polling, see
+        ``poll``. See ``DigestCache`` for details.
+    archive: ResponseArchive
+        If passed, every successful ``GET`` response received from the api is
+        archived in it, compressed, and can be replayed later as of any point
+        in time. See ``ResponseArchive`` for details.
+    middleware: List[Middleware]
+        Extra middleware to pass every request through, outermost first. These
+        run before any of the built in behavior (like caching or coalescing)
+        configured by the parameters above. The full chain is available (and
+        may be modified) as ``OssapiV2.middleware``. See ``Middleware`` for
+        details.
     """
     TOKEN_URL = "https://osu.ppy.sh/oauth/token"
     AUTH_CODE_URL = "https://osu.ppy.sh/oauth/authorize"
@@ -249,8 +396,22 @@ class OssapiV2:
         *,
         grant: Optional[Union[Grant, str]] = None,
         strict: bool = False,
+        frozen: bool = False,
         token_directory: Optional[str] = None,
         token_key: Optional[str] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedging: Optional[HedgingPolicy] = None,
+        concurrency_limiter: Optional[AIMDLimiter] = None,
+        coalesce: bool = False,
+        transport: Optional[Transport] = None,
+        cache: Optional[ResponseCache] = None,
+        entity_store: Optional[EntityStore] = None,
+        invalidate_on_events: bool = False,
+        beatmap_index: Optional[BeatmapIndex] = None,
+        username_index: Optional[UsernameIndex] = None,
+        digest_cache: Optional[DigestCache] = None,
+        archive: Optional[ResponseArchive] = None,
+        middleware: List[Middleware] = [],
     ):
         if not grant:
             grant = (Grant.AUTHORIZATION_CODE if redirect_uri else
@@ -263,6 +424,40 @@ class OssapiV2:
         self.redirect_uri = redirect_uri
         self.scopes = [Scope(scope) for scope in scopes]
         self.strict = strict
+        self.frozen = frozen
+        self.circuit_breaker = circuit_breaker
+        self.hedging = hedging
+        self.concurrency_limiter = concurrency_limiter
+        self.coalescer = RequestCoalescer() if coalesce else None
+        self.transport = transport or SessionTransport()
+        self.cache = cache
+        self.entity_store = entity_store
+        self.invalidator = (EventInvalidator(cache, entity_store) if
+            invalidate_on_events else None)
+        self.beatmap_index = beatmap_index
+        self.username_index = username_index
+        self.digest_cache = digest_cache
+        self.archive = archive
+        self._local = threading.local()
+
+        # every request passes through this chain, outermost first, before
+        # being sent by ``self.transport``. The indexes come first so the
+        # lookups by id they make can be answered by the entity store or cache.
+        # The entity store, cache, and coalescer come before the circuit
+        # breaker and concurrency limiter so requests they answer don't count
+        # towards either. Hedging comes after the circuit breaker, so a hedged
+        # request only counts once towards it, but before the concurrency
+        # limiter, so a hedge waits for a slot of its own. Requests which must
+        # be answered from a cache stop at the cache gate. The invalidator,
+        # digest cache, and archive only see responses which come from the api,
+        # and only once per request.
+        builtin = [self.beatmap_index, self.username_index, self.entity_store,
+            self.cache, CacheGate(), self.coalescer, self.invalidator,
+            self.digest_cache,
+            self.archive, self.circuit_breaker, self.hedging,
+            self.concurrency_limiter]
+        self.middleware = [*middleware,
+            *(mw for mw in builtin if mw is not None), BandwidthCounter()]
 
         self.log = logging.getLogger(__name__)
         self.token_key = token_key or self.gen_token_key(self.grant,
@@ -283,6 +478,12 @@ class OssapiV2:
                 "authorization code grant is used.")
 
         self.session = self.authenticate()
+        self.transport.authorize(self.session)
+
+    def __deepcopy__(self, memo):
+        # models keep a reference to the api which loaded them. Copying a model
+        # should not copy the api (and its session, transport, etc) with it.
+        return self
 
     @staticmethod
     def gen_token_key(grant, client_id, client_secret, scopes):
@@ -417,27 +618,72 @@ class OssapiV2:
     def _save_token(self, token):
         pass
 
-    def _request(self, type_, method, url, params={}, data={}):
-        params = self._format_params(params)
+    @contextmanager
+    def _refreshing(self):
+        """
+        Marks every request made (in this thread) inside the ``with`` block as
+        wanting a fresh copy from the api, so middleware like the entity store
+        and cache don't answer it with a copy they already have.
+        """
+        previous = getattr(self._local, "refresh", False)
+        self._local.refresh = True
         try:
-            r = self.session.request(method, f"{self.BASE_URL}{url}",
-                params=params, data=data)
-        except TokenExpiredError:
-            # provide "auto refreshing" for client credentials grant. The client
-            # grant doesn't actually provide a refresh token, so we can't hook
-            # onto OAuth2Session's auto_refresh functionality like we do for the
-            # authorization code grant. But we can do something effectively
-            # equivalent: whenever we make a request with an expired client
-            # grant token, just request a new one.
-            if self.grant is not Grant.CLIENT_CREDENTIALS:
-                raise
-            self.session = self._new_client_grant(self.client_id,
-                self.client_secret)
-            # redo the request now that we have a valid token
-            r = self.session.request(method, f"{self.BASE_URL}{url}",
-                params=params, data=data)
+            yield
+        finally:
+            self._local.refresh = previous
 
-        self.log.info(f"made {method} request to {r.request.url}")
+    def _request(self, type_, method, url, params={}, data={}):
+        params = self._format_params(params)
+        endpoint = getattr(self._local, "endpoint", None)
+        arguments = getattr(self._local, "arguments", {})
+        request = Request(method, url, params, data, type_, endpoint,
+            arguments)
+        cache_control = getattr(self._local, "cache_control", {})
+        request.refresh = (getattr(self._local, "refresh", False) or
+            cache_control.get("no_cache", False))
+        request.max_age = cache_control.get("max_age")
+        request.only_if_cached = cache_control.get("only_if_cached", False)
+        request.stale_ok = cache_control.get("stale_ok", False)
+        if self.archive is not None and self.archive.replaying:
+            # replayed requests skip the middleware chain, so the cache and
+            # entity store neither answer them nor keep what they return
+            r = self.archive.replay(request)
+            r.decoder = functools.partial(self._decode, request)
+        else:
+            r = self._handle(request)
+        return r.decode()
+
+    def _handle(self, request, index=0):
+        """
+        Passes ``request`` through the middleware chain, starting at
+        ``index``, and returns the response.
+        """
+        if index == len(self.middleware):
+            r = self._send(request.method, request.url, request.params,
+                request.data, request.headers)
+            r.decoder = functools.partial(self._decode, request)
+            return r
+
+        def next_(request):
+            return self._handle(request, index + 1)
+        r = self.middleware[index](request, next_)
+        # middleware may answer a request with a response of its own (eg from
+        # a persistent cache), which doesn't know how to decode itself yet.
+        if r.decoder is None:
+            r.decoder = functools.partial(self._decode, request)
+        return r
+
+    def _decode(self, request, r):
+        self.log.info(f"made {request.method} request to {r.url}")
+        if r.status_code == 404:
+            try:
+                error = r.json().get("error")
+            except ValueError:
+                error = None
+            raise NotFoundError(request.endpoint, unquote(request.url), error)
+        # cached responses may hold a packed model instead of json
+        if r.headers.get("Content-Type") == PACKED_CONTENT_TYPE:
+            return unpack_model(r.content, self)
         json_ = r.json()
         self.log.debug(f"received json: \n{json.dumps(json_, indent=4)}")
         # TODO this should just be ``if "error" in json``, but for some reason
@@ -445,8 +691,130 @@ class OssapiV2:
         # open an issue on osu-web?
         if len(json_) == 1 and "error" in json_:
             raise ValueError(f"api returned an error of `{json_['error']}` for "
-                f"a request to {unquote(url)}")
-        return self._instantiate_type(type_, json_)
+                f"a request to {unquote(request.url)}")
+        model = self._instantiate_type(request.type_, json_)
+        if self.frozen:
+            model = freeze(model)
+        return model
+
+    def _send(self, method, url, params, data, headers=None):
+        try:
+            return self.transport.request(method, f"{self.BASE_URL}{url}",
+                params=params, data=data, headers=headers)
+        except TokenExpiredError:
+            self._refresh_token()
+            # redo the request now that we have a valid token
+            return self.transport.request(method, f"{self.BASE_URL}{url}",
+                params=params, data=data, headers=headers)
+
+    def _refresh_token(self):
+        # provide "auto refreshing" for client credentials grant. The client
+        # grant doesn't actually provide a refresh token, so we can't hook onto
+        # OAuth2Session's auto_refresh functionality like we do for the
+        # authorization code grant. But we can do something effectively
+        # equivalent: whenever we make a request with an expired client grant
+        # token, just request a new one.
+        if self.grant is Grant.CLIENT_CREDENTIALS:
+            self.session = self._new_client_grant(self.client_id,
+                self.client_secret)
+        else:
+            # when requests go through the OAuth2Session, it refreshes
+            # authorization code grant tokens on its own. Other transports
+            # only find out the token expired when they next use it.
+            token = self.session.refresh_token(self.TOKEN_URL)
+            self._save_token(token)
+        self.transport.authorize(self.session)
+
+    def map(self, function, iterable, *, max_workers=None):
+        """
+        Calls ``function`` on each item of ``iterable`` from several threads at
+        once, and returns a list of the results in the same order as
+        ``iterable``. Useful for fanning out many api calls, eg
+        ``api.map(api.user, user_ids)``.
+
+        If this client has a ``concurrency_limiter``, the number of requests in
+        flight at once is governed by it, regardless of how many threads are
+        used.
+
+        Parameters
+        ----------
+        max_workers: int
+            How many threads to use. Defaults to the concurrency limiter's
+            ``max_limit`` if there is one, and 8 otherwise.
+        """
+        if max_workers is None:
+            max_workers = (self.concurrency_limiter.max_limit if
+                self.concurrency_limiter else 8)
+        with ThreadPoolExecutor(max_workers,
+            thread_name_prefix="ossapi-map") as executor:
+            return list(executor.map(function, iterable))
+
+    def poll(self, function, *args, **kwargs):
+        """
+        Calls ``function(*args, **kwargs)`` (usually an endpoint method, eg
+        ``api.poll(api.beatmap_scores, 221777)``) and returns ``(result,
+        changed)``, where ``changed`` is whether the response to any request
+        it made was different from the last response to the same request.
+        Requires a ``digest_cache``.
+
+        Responses answered by ``cache`` (or ``entity_store``) count as
+        unchanged, since they were already returned before. Poll less often
+        than their ttl, or don't cache the endpoints you poll, to see every
+        change.
+        """
+        if self.digest_cache is None:
+            raise ValueError("`poll` requires a `digest_cache`")
+        with self.digest_cache.track() as changes:
+            result = function(*args, **kwargs)
+        return (result, any(changes))
+
+    def metrics(self):
+        """
+        A snapshot of this client's internal counters and gauges, as a dict,
+        collected from each middleware in ``self.middleware``. Apart from the
+        bandwidth used per endpoint (under ``bytes``), only the features this
+        client was configured with are included.
+        """
+        metrics = {}
+        for middleware in self.middleware:
+            if isinstance(middleware, Middleware):
+                metrics.update(middleware.metrics())
+        return metrics
+
+    def dump_caches(self, path):
+        """
+        Writes every response in ``cache`` and every entity in
+        ``entity_store`` to a dump file at ``path``, which ``load_caches`` can
+        load into another client, eg to start a new worker with the cache of a
+        running one. If ``path`` ends in ``.gz``, the file is gzipped. Returns
+        how many records were written.
+        """
+        records = []
+        if self.cache is not None:
+            records.append(self.cache.export())
+        if self.entity_store is not None:
+            records.append(self.entity_store.export())
+        return write_dump(path, itertools.chain(*records))
+
+    def load_caches(self, path):
+        """
+        Loads a dump file written by ``dump_caches`` into ``cache`` and
+        ``entity_store``. Records for a cache this client doesn't have are
+        skipped. The file is read lazily, and models are only decoded once
+        they're requested.
+
+        Returns a dict with how many ``responses`` and ``entities`` were
+        loaded.
+        """
+        loaded = {"responses": 0, "entities": 0}
+        # ``dump_caches`` writes the records of each cache together
+        for cache, records in itertools.groupby(read_dump(path),
+            key=lambda record: record["cache"]):
+            if cache == "response" and self.cache is not None:
+                loaded["responses"] += self.cache.load(records)
+            if cache == "entity" and self.entity_store is not None:
+                loaded["entities"] += self.entity_store.load(records, self)
+        return loaded
 
     def _get(self, type_, url, params={}):
         return self._request(type_, "GET", url, params=params)
@@ -456,7 +824,8 @@ class OssapiV2:
 
     def _format_params(self, params):
         for key, value in params.copy().items():
-            if isinstance(value, list):
+            # frozen models hold tuples instead of lists
+            if isinstance(value, (list, tuple)):
                 # we need to pass multiple values for this key, so make its
                 # value a list https://stackoverflow.com/a/62042144
                 params[f"{key}[]"] = []
@@ -464,7 +833,9 @@ class OssapiV2:
                     params[f"{key}[]"].append(self._format_value(v))
                 del params[key]
             elif isinstance(value, Cursor):
-                new_params = self._format_params(value.__dict__)
+                # the cursor may be shared (eg if it's frozen), so don't format
+                # its values in place
+                new_params = self._format_params(dict(value.__dict__))
                 for k, v in new_params.items():
                     params[f"cursor[{k}]"] = v
                 del params[key]
@@ -1174,8 +1545,8 @@ class OssapiV2:
         mode: GameModeT,
         score_id: int
     ) -> Replay:
-        r = self.session.get(f"{self.BASE_URL}/scores/{mode.value}/"
-            f"{score_id}/download")
+        r = self._send("GET", f"/scores/{mode.value}/{score_id}/download",
+            {}, {})
         replay = osrparse.Replay.from_string(r.content)
         return Replay(replay, self)
 
@@ -1239,5 +1610,5 @@ class OssapiV2:
     # ------
 
     def revoke_token(self):
-        self.session.delete(f"{self.BASE_URL}/oauth/tokens/current")
+        self._send("DELETE", "/oauth/tokens/current", {}, {})
         self.remove_token(self.token_key, self.token_directory)
@@ -0,0 +1,337 @@
+from urllib.parse import urlencode
+import json
+import time
+import zlib
+
+import urllib3
+from urllib3.exceptions import (HTTPError, MaxRetryError, NewConnectionError,
+    TimeoutError as Urllib3TimeoutError)
+from requests import ConnectionError, Timeout
+from oauthlib.oauth2 import TokenExpiredError
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _decompress_gzip(content):
+    # ``16 + zlib.MAX_WBITS`` tells zlib to expect a gzip header and trailer
+    return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+
+def _decompress_deflate(content):
+    # the ``deflate`` content encoding is supposed to be zlib-wrapped, but some
+    # servers send a raw deflate stream instead.
+    try:
+        return zlib.decompress(content)
+    except zlib.error:
+        return zlib.decompress(content, -zlib.MAX_WBITS)
+
+def _decompress_zstd(content):
+    # zstd frames from a streaming compressor don't always declare their
+    # decompressed size, which ``ZstdDecompressor.decompress`` requires.
+    return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+
+# content encodings we can decode, in order of preference. brotli and zstd are
+# only available if their (optional) libraries are installed.
+DECOMPRESSORS = {}
+if zstandard is not None:
+    DECOMPRESSORS["zstd"] = _decompress_zstd
+if brotli is not None:
+    DECOMPRESSORS["br"] = brotli.decompress
+DECOMPRESSORS["gzip"] = _decompress_gzip
+DECOMPRESSORS["deflate"] = _decompress_deflate
+
+ACCEPT_ENCODING = ", ".join(DECOMPRESSORS)
+
+def decompress(content, content_encoding):
+    """
+    Decodes ``content`` according to the ``Content-Encoding`` header of the
+    response it came from.
+    """
+    if not content_encoding:
+        return content
+    # encodings are listed in the order they were applied, so undo them in
+    # reverse.
+    encodings = [e.strip().lower() for e in content_encoding.split(",")]
+    for encoding in reversed(encodings):
+        if encoding == "identity":
+            continue
+        if encoding not in DECOMPRESSORS:
+            raise ValueError(f"the api responded with an unsupported content "
+                f"encoding of `{encoding}`")
+        content = DECOMPRESSORS[encoding](content)
+    return content
+
+
+class Response:
+    """
+    A response from the api, independent of the transport which made the
+    request.
+
+    ``content`` is always the decompressed body. ``wire_size`` is the size of
+    the body as it was sent over the network, before decompressing.
+
+    ``received_at`` is when the response was received from the api, as a unix
+    timestamp, and defaults to now. Responses answered from a cache (or
+    anything else which keeps responses) keep the time the original response
+    was received.
+
+    Once the response has been decoded into a model by ``decode``, the model is
+    kept in ``model``.
+    """
+    def __init__(self, status_code, headers, content, url, wire_size=None,
+        received_at=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+        self.wire_size = len(content) if wire_size is None else wire_size
+        self.received_at = (time.time() if received_at is None else
+            received_at)
+        # set by ``OssapiV2`` to a function which decodes this response
+        self.decoder = None
+        self.model = None
+
+    @classmethod
+    def from_raw(cls, status_code, headers, raw, url):
+        """
+        A ``Response`` from a body which hasn't been decompressed yet.
+        """
+        content = decompress(raw, headers.get("Content-Encoding"))
+        return cls(status_code, headers, content, url, wire_size=len(raw))
+
+    def json(self):
+        return json.loads(self.content)
+
+    def decode(self):
+        """
+        Decodes this response into a model, or returns the model it was already
+        decoded into.
+        """
+        if self.model is None:
+            self.model = self.decoder(self)
+        return self.model
+
+    def copy(self):
+        """
+        A copy of this response which has not been decoded yet.
+        """
+        response = Response(self.status_code, self.headers, self.content,
+            self.url, self.wire_size, self.received_at)
+        response.decoder = self.decoder
+        return response
+
+
+class Transport:
+    """
+    Sends http requests to the api on behalf of ``OssapiV2``.
+
+    ``OssapiV2`` always authenticates with an ``OAuth2Session``. Whenever the
+    session's token changes (including right after authenticating),
+    ``authorize`` is called with the session, and the transport is responsible
+    for attaching the token to its requests from then on. If the token has
+    expired, ``request`` should raise ``TokenExpiredError`` so ``OssapiV2`` can
+    refresh it.
+
+    Transports should send ``ACCEPT_ENCODING`` as the ``Accept-Encoding`` header
+    and decompress responses themselves with ``Response.from_raw``, so we know
+    how many bytes actually went over the network.
+    """
+    def authorize(self, session):
+        raise NotImplementedError()
+
+    def request(self, method, url, *, params=None, data=None, headers=None):
+        """
+        Makes a request and returns a ``Response``. ``headers`` are extra
+        headers to send along with the request. Network errors should be
+        raised as a ``requests.RequestException``, regardless of the
+        underlying http library.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class SessionTransport(Transport):
+    """
+    Sends requests through the ``OAuth2Session`` itself. This is the default
+    transport.
+    """
+    def __init__(self):
+        self.session = None
+
+    def authorize(self, session):
+        self.session = session
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+    def request(self, method, url, *, params=None, data=None, headers=None):
+        r = self.session.request(method, url, params=params, data=data,
+            headers=headers, stream=True)
+        try:
+            raw = r.raw.read(decode_content=False)
+        finally:
+            r.close()
+        return Response.from_raw(r.status_code, r.headers, raw, r.url)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class BearerTransport(Transport):
+    """
+    Base class for transports which send the token as a precomputed
+    ``Authorization`` header instead of going through the ``OAuth2Session``.
+    """
+    # refresh tokens slightly before they expire, so a request never races
+    # its token's expiry.
+    EXPIRY_MARGIN = 10
+
+    def __init__(self):
+        self._headers = None
+        self._expires_at = None
+
+    def authorize(self, session):
+        token = session.token
+        self._headers = {
+            "Authorization": f"Bearer {token['access_token']}",
+            "Accept": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING
+        }
+        self._expires_at = token.get("expires_at")
+
+    @staticmethod
+    def _encode(values):
+        # match requests, which drops any value of ``None``
+        values = {k: v for k, v in values.items() if v is not None}
+        return urlencode(values, doseq=True)
+
+    def _prepare(self, url, params, data, extra_headers):
+        """
+        Returns the ``(url, headers, body)`` to send for a request, raising
+        ``TokenExpiredError`` if our token has expired.
+        """
+        if (self._expires_at is not None and
+            time.time() > self._expires_at - self.EXPIRY_MARGIN):
+            raise TokenExpiredError()
+
+        headers = self._headers
+        if extra_headers:
+            headers = {**headers, **extra_headers}
+        body = None
+        if params:
+            query = self._encode(params)
+            if query:
+                url = f"{url}?{query}"
+        if data:
+            body = self._encode(data)
+            headers = {**headers,
+                "Content-Type": "application/x-www-form-urlencoded"}
+        return (url, headers, body)
+
+
+class Urllib3Transport(BearerTransport):
+    """
+    A lean transport which sends requests on a plain pooled urllib3 connection,
+    with a precomputed ``Authorization`` header.
+
+    ``OAuth2Session.request`` runs oauthlib's token machinery, url checks, and
+    hook dispatch before requests' own (also fairly heavy) session logic, on
+    every request. This transport skips all of that; the ``OAuth2Session`` is
+    only involved when fetching or refreshing a token.
+
+    Parameters
+    ----------
+    maxsize: int
+        How many connections to the api to keep open at once. Set this to at
+        least the number of threads you make requests from.
+    timeout: float
+        How long in seconds to wait for the api to respond before raising
+        ``requests.Timeout``. If ``None``, wait forever.
+    """
+    def __init__(self, *, maxsize=10, timeout=None):
+        super().__init__()
+        retries = urllib3.Retry(total=None, connect=0, read=0, status=0,
+            other=0, redirect=5, raise_on_redirect=False)
+        self.pool = urllib3.PoolManager(maxsize=maxsize, retries=retries,
+            timeout=urllib3.Timeout(total=timeout))
+
+    def request(self, method, url, *, params=None, data=None, headers=None):
+        url, headers, body = self._prepare(url, params, data, headers)
+        try:
+            r = self.pool.request(method, url, body=body, headers=headers,
+                decode_content=False)
+        except HTTPError as e:
+            reason = e.reason if isinstance(e, MaxRetryError) else e
+            # urllib3 considers failing to connect at all a timeout, but
+            # requests (and we) don't.
+            if (isinstance(reason, Urllib3TimeoutError) and
+                not isinstance(reason, NewConnectionError)):
+                raise Timeout(e) from e
+            raise ConnectionError(e) from e
+        return Response.from_raw(r.status, r.headers, r.data, url)
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxTransport(BearerTransport):
+    """
+    Sends requests with httpx, over http/2 by default.
+
+    Over http/2, every concurrent request shares a single connection to the api
+    as a multiplexed stream, instead of opening one connection per request in
+    flight. This is a big improvement if you make many requests at once, eg
+    with ``OssapiV2.map``.
+
+    Requires httpx with http/2 support (``pip install ossapi[http2]``).
+
+    Parameters
+    ----------
+    http2: bool
+        Whether to use http/2. If ``False``, falls back to pooled http/1.1
+        connections, which is useful for comparing the two.
+    max_connections: int
+        The maximum number of connections to keep open at once. Over http/2
+        only a single connection is needed.
+    timeout: float
+        How long in seconds to wait for the api to respond before raising
+        ``requests.Timeout``. If ``None``, wait forever.
+    """
+    def __init__(self, *, http2=True, max_connections=10, timeout=None):
+        super().__init__()
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("HttpxTransport requires httpx. Install it with "
+                "`pip install ossapi[http2]`") from e
+        self._httpx = httpx
+        limits = httpx.Limits(max_connections=max_connections,
+            max_keepalive_connections=max_connections)
+        self.client = httpx.Client(http2=http2, limits=limits,
+            timeout=httpx.Timeout(timeout), follow_redirects=True)
+
+    def request(self, method, url, *, params=None, data=None, headers=None):
+        url, headers, body = self._prepare(url, params, data, headers)
+        try:
+            with self.client.stream(method, url, content=body,
+                headers=headers) as r:
+                raw = b"".join(r.iter_raw())
+        except self._httpx.TimeoutException as e:
+            raise Timeout(e) from e
+        except self._httpx.TransportError as e:
+            raise ConnectionError(e) from e
+        return Response.from_raw(r.status_code, r.headers, raw, url)
+
+    def close(self):
+        self.client.close()
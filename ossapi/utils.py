@@ -1,7 +1,9 @@
 from enum import EnumMeta, Enum, IntFlag
 from datetime import datetime, timezone
 from typing import Union, Any
-from dataclasses import dataclass
+from types import MappingProxyType
+from dataclasses import dataclass, FrozenInstanceError
+import copy
 
 from typing_utils import get_args, get_origin
 
@@ -97,25 +99,129 @@ class Model(_Model, metaclass=ModelMeta):
     # can't annotate with OssapiV2 or we get a circular import error, this is
     # good enough.
     _api: Any
-
-    def _foreign_key(self, fk, func, existing):
-        if existing:
+    # set by ``freeze``. Not a dataclass field.
+    _frozen = False
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise FrozenInstanceError(f"cannot assign to attribute {name!r} "
+                f"of a frozen {type(self).__name__}")
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if self._frozen:
+            raise FrozenInstanceError(f"cannot delete attribute {name!r} of a "
+                f"frozen {type(self).__name__}")
+        super().__delattr__(name)
+
+    def __deepcopy__(self, memo):
+        # the memoized foreign keys stay with the instance which followed them.
+        # Copies (like the ones caches hand out) start without them, instead
+        # of copying every model they refer to as well.
+        cls = type(self)
+        copied = cls.__new__(cls)
+        memo[id(self)] = copied
+        for name, value in self.__dict__.items():
+            if name != "_foreign_keys":
+                object.__setattr__(copied, name, copy.deepcopy(value, memo))
+        return copied
+
+    def _foreign_key(self, key, fk, func, existing, refresh):
+        """
+        Follows a foreign key of this model.
+
+        The result is memoized per instance under ``key``, so following the
+        same foreign key twice only makes one request. Pass an
+        ``EntityStore`` to the api to share results between instances as well.
+
+        Parameters
+        ----------
+        key: tuple
+            What to memoize the result under.
+        fk: int
+            The value of the foreign key. If ``None``, returns ``None``.
+        func: Callable
+            Retrieves the model the foreign key refers to.
+        existing: Model
+            The model the foreign key refers to, if it was already returned
+            with this model. Returned as is unless ``refresh`` is ``True``.
+        refresh: bool
+            Whether to retrieve the model from the api even if we already
+            have a copy of it, here or in the api's entity store or cache.
+        """
+        if existing and not refresh:
             return existing
         if fk is None:
             return None
-        return func()
-
-    def _fk_user(self, user_id, existing=None):
+        # not a dataclass field, so it isn't compared, serialized, packed, or
+        # passed to ``__init__``. It isn't copied or frozen either (see
+        # ``__deepcopy__`` and ``freeze``), so it can be filled in on frozen
+        # models too.
+        memo = self.__dict__.setdefault("_foreign_keys", {})
+        if key in memo and not refresh:
+            return memo[key]
+        if refresh:
+            with self._api._refreshing():
+                value = func()
+        else:
+            value = func()
+        memo[key] = value
+        return value
+
+    def _fk_user(self, user_id, existing=None, refresh=False):
         func = lambda: self._api.user(user_id)
-        return self._foreign_key(user_id, func, existing)
+        return self._foreign_key(("user", user_id), user_id, func, existing,
+            refresh)
 
-    def _fk_beatmap(self, beatmap_id, existing=None):
+    def _fk_beatmap(self, beatmap_id, existing=None, refresh=False):
         func = lambda: self._api.beatmap(beatmap_id)
-        return self._foreign_key(beatmap_id, func, existing)
+        return self._foreign_key(("beatmap", beatmap_id), beatmap_id, func,
+            existing, refresh)
 
-    def _fk_beatmapset(self, beatmapset_id, existing=None):
+    def _fk_beatmapset(self, beatmapset_id, existing=None, refresh=False):
         func = lambda: self._api.beatmapset(beatmapset_id)
-        return self._foreign_key(beatmapset_id, func, existing)
+        return self._foreign_key(("beatmapset", beatmapset_id), beatmapset_id,
+            func, existing, refresh)
+
+def freeze(value):
+    """
+    Makes ``value`` (a model, or a list of models) and every model nested
+    inside it immutable, and returns it. Lists are replaced by tuples and dicts
+    by read-only ``types.MappingProxyType``s, so the returned value may be a
+    different object than ``value``. Cursors are frozen too.
+
+    Frozen models can be shared between callers (and threads) without copying
+    them, since none of them can modify it. See ``OssapiV2``'s ``frozen``
+    parameter.
+    """
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in
+            value.items()})
+    # base models which can be frozen (like ``Cursor``) know how to do it
+    # themselves
+    if isinstance(value, BaseModel) and hasattr(value, "_freeze"):
+        if not getattr(value, "_frozen", False):
+            value._freeze()
+        return value
+    if not isinstance(value, Model) or value._frozen:
+        return value
+    for name, attribute in vars(value).items():
+        if name in ["_api", "_foreign_keys"]:
+            continue
+        frozen = freeze(attribute)
+        if frozen is not attribute:
+            object.__setattr__(value, name, frozen)
+    object.__setattr__(value, "_frozen", True)
+    return value
+
+def is_frozen(value):
+    """
+    Whether ``value`` was returned by ``freeze``, and so doesn't need to be
+    copied before sharing it.
+    """
+    return isinstance(value, tuple) or getattr(value, "_frozen", False)
 
 class BaseModel(_Model):
     """
@@ -176,6 +282,10 @@ class Datetime(datetime, BaseModel):
     def __new__(cls, value): # pylint: disable=signature-differs
         if value is None:
             raise ValueError("cannot instantiate a Datetime with a null value")
+        # ``ModelEncoder`` serializes datetimes as unix timestamps in
+        # milliseconds, like the api sometimes does.
+        if isinstance(value, int):
+            return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
         # the api returns a bunch of different timestamps: two ISO 8601
         # formats (eg "2018-09-11T08:45:49.000000Z" and
         # "2014-05-18T17:22:23+00:00"), a unix timestamp (eg
@@ -40,5 +40,9 @@ setup(
         "requests_oauthlib",
         "osrparse~=6.0",
         "typing_utils"
-    ]
+    ],
+    extras_require={
+        "http2": ["httpx[http2]"],
+        "compression": ["brotli", "zstandard"]
+    }
 )
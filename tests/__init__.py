@@ -2,16 +2,29 @@ from ossapi import OssapiV2, Ossapi, Grant
 
 import os
 
-client_id = os.environ.get("OSU_API_CLIENT_ID")
-client_secret = os.environ.get("OSU_API_CLIENT_SECRET")
-key = os.environ.get("OSU_API_KEY")
+# the apis are only created when a test first imports them, so tests which
+# don't talk to the real api (see ``tests.fakes``) can run without any
+# credentials.
+_apis = {}
 
-if not client_id:
-    client_id = input("Enter your api v2 client id: ")
-if not client_secret:
-    client_secret = input("Enter your api v2 client secret: ")
+def _create_apis():
+    client_id = os.environ.get("OSU_API_CLIENT_ID")
+    client_secret = os.environ.get("OSU_API_CLIENT_SECRET")
+    key = os.environ.get("OSU_API_KEY")
 
-client_id = int(client_id)
-api = OssapiV2(client_id, client_secret, strict=True,
-    grant=Grant.CLIENT_CREDENTIALS)
-apiv1 = Ossapi(key)
+    if not client_id:
+        client_id = input("Enter your api v2 client id: ")
+    if not client_secret:
+        client_secret = input("Enter your api v2 client secret: ")
+
+    client_id = int(client_id)
+    _apis["api"] = OssapiV2(client_id, client_secret, strict=True,
+        grant=Grant.CLIENT_CREDENTIALS)
+    _apis["apiv1"] = Ossapi(key)
+
+def __getattr__(name):
+    if name not in ["api", "apiv1"]:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not _apis:
+        _create_apis()
+    return _apis[name]
@@ -0,0 +1,163 @@
+"""
+An ``OssapiV2`` which talks to a fake api instead of osu!, so caching and the
+other middleware can be tested without credentials or a network connection.
+"""
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import threading
+import pickle
+import copy
+import json
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi import OssapiV2, Grant, Scope
+from ossapi.transport import Transport, Response
+
+USER_COMPACT = {
+    "avatar_url": "https://a.ppy.sh/2", "country_code": "AU",
+    "default_group": "default", "id": 2, "is_active": True, "is_bot": False,
+    "is_deleted": False, "is_online": False, "is_supporter": True,
+    "last_visit": "2020-01-01T00:00:00+00:00", "pm_friends_only": False,
+    "profile_colour": None, "username": "peppy"
+}
+
+USER = {
+    **USER_COMPACT, "cover_url": "https://assets.ppy.sh/cover.jpg",
+    "discord": None, "has_supported": True, "interests": None,
+    "join_date": "2007-08-28T03:09:12+00:00",
+    "kudosu": {"available": 0, "total": 0}, "location": None,
+    "max_blocks": 100, "max_friends": 500, "occupation": None,
+    "playmode": "osu", "playstyle": ["mouse", "keyboard"], "post_count": 0,
+    "profile_order": ["me"], "title": None, "title_url": None,
+    "twitter": None, "website": None
+}
+
+BEATMAP = {
+    "difficulty_rating": 5.5, "id": 221777, "mode": "osu", "status": "ranked",
+    "total_length": 100, "version": "Insane", "user_id": 2,
+    "beatmapset_id": 39804, "checksum": "1cf5b2c2edfafd055536d2cefcb89c0e",
+    "accuracy": 8, "ar": 9, "bpm": 180, "convert": False, "count_circles": 1,
+    "count_sliders": 1, "count_spinners": 0, "cs": 4, "deleted_at": None,
+    "drain": 5, "hit_length": 90, "is_scoreable": True,
+    "last_updated": "2020-01-01T00:00:00+00:00", "mode_int": 0,
+    "passcount": 1, "playcount": 2, "ranked": 1,
+    "url": "https://osu.ppy.sh/beatmaps/221777"
+}
+
+BEATMAPSET_COMPACT = {
+    "artist": "xi", "artist_unicode": "xi",
+    "covers": {"cover": "c", "cover@2x": "c", "card": "c", "card@2x": "c",
+        "list": "l", "list@2x": "l", "slimcover": "s", "slimcover@2x": "s"},
+    "creator": "peppy", "favourite_count": 1, "id": 39804, "play_count": 1,
+    "preview_url": "p", "source": "", "status": "ranked",
+    "title": "FREEDOM DiVE", "title_unicode": "FREEDOM DiVE", "user_id": 2,
+    "video": False, "nsfw": False
+}
+
+BEATMAPSET = {
+    **BEATMAPSET_COMPACT,
+    "availability": {"download_disabled": False, "more_information": None},
+    "bpm": 180, "can_be_hyped": False, "discussion_enabled": True,
+    "discussion_locked": False, "is_scoreable": True,
+    "last_updated": "2020-01-01T00:00:00+00:00", "legacy_thread_url": None,
+    "nominations_summary": {"current": 2, "required": 2}, "ranked": 1,
+    "ranked_date": "2020-01-01T00:00:00+00:00", "storyboard": False,
+    "submitted_date": "2020-01-01T00:00:00+00:00", "tags": ""
+}
+
+SCORE = {
+    "id": 1, "best_id": 1, "user_id": 2, "accuracy": 0.99, "mods": ["HD"],
+    "score": 1000, "max_combo": 100, "perfect": False,
+    "statistics": {"count_50": 0, "count_100": 1, "count_300": 99,
+        "count_geki": 0, "count_katu": 0, "count_miss": 0},
+    "pp": 100.5, "rank": "SH", "created_at": "2020-01-01T00:00:00+00:00",
+    "mode": "osu", "mode_int": 0, "replay": False, "passed": True,
+    "beatmap": BEATMAP, "beatmapset": BEATMAPSET_COMPACT,
+    "user": USER_COMPACT
+}
+
+WIKI_PAGE = {
+    "layout": "markdown_page", "locale": "en", "markdown": "# welcome",
+    "path": "Welcome", "subtitle": None, "tags": [], "title": "Welcome",
+    "available_locales": ["en"]
+}
+
+def beatmap(**kwargs):
+    """
+    A beatmap as returned by the ``beatmap`` endpoint, including its
+    beatmapset.
+    """
+    beatmapset = {**BEATMAPSET, "user": USER_COMPACT,
+        "beatmaps": [BEATMAP, {**BEATMAP, "id": 221778, "version": "Hard"}]}
+    return copy.deepcopy({**BEATMAP, "beatmapset": beatmapset, **kwargs})
+
+
+class FakeTransport(Transport):
+    """
+    Answers requests with ``handler(method, path, params, headers)``, which
+    returns a ``(status_code, body)`` or ``(status_code, body, headers)``
+    tuple. ``path`` is the url of the request without ``OssapiV2.BASE_URL``.
+    Bodies which aren't bytes are encoded as json.
+
+    Every request is recorded in ``requests``, as a
+    ``(method, path, params, headers)`` tuple.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def authorize(self, session):
+        pass
+
+    def request(self, method, url, *, params=None, data=None, headers=None):
+        path = url[len(OssapiV2.BASE_URL):]
+        headers = headers or {}
+        with self._lock:
+            self.requests.append((method, path, params, headers))
+        status_code, body, *response_headers = self.handler(method, path,
+            params, headers)
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        response_headers = CaseInsensitiveDict({
+            "Content-Type": "application/json",
+            **(response_headers[0] if response_headers else {})
+        })
+        return Response(status_code, response_headers, body, url)
+
+
+def routes(routes):
+    """
+    A ``FakeTransport`` handler which answers requests whose path is in
+    ``routes`` with its body, and every other request with a 404.
+    """
+    def handler(method, path, params, headers):
+        if path in routes:
+            return (200, routes[path])
+        return (404, {"error": None})
+    return handler
+
+
+# a token which doesn't expire during the tests, so ``OssapiV2`` loads it
+# instead of authenticating
+_token_directory = TemporaryDirectory()
+
+def make_api(handler, **kwargs):
+    """
+    An ``OssapiV2`` whose requests are answered by ``handler`` (see
+    ``FakeTransport``), along with its transport.
+    """
+    token_key = OssapiV2.gen_token_key(Grant.CLIENT_CREDENTIALS, 1, "secret",
+        [Scope.PUBLIC])
+    token_file = Path(_token_directory.name) / f"{token_key}.pickle"
+    token = {"access_token": "token", "token_type": "Bearer",
+        "expires_at": time.time() + 24 * 60 * 60}
+    with open(token_file, "wb") as f:
+        pickle.dump(token, f)
+
+    transport = FakeTransport(handler)
+    api = OssapiV2(1, "secret", token_directory=_token_directory.name,
+        transport=transport, **kwargs)
+    return api, transport
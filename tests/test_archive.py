@@ -0,0 +1,63 @@
+from unittest import TestCase, skipIf
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import threading
+import json
+
+from ossapi import ResponseArchive
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class SlowArchive(ResponseArchive):
+    """
+    An archive whose dictionaries only finish training once ``trained`` is
+    set.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trained = threading.Event()
+
+    def train(self, samples=None):
+        self.trained.wait(5)
+        return super().train(samples)
+
+
+@skipIf(zstandard is None, "requires zstandard")
+class TestResponseArchive(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = Path(self.directory.name) / "archive.db"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def content(self, i):
+        return json.dumps({"id": i, "username": f"user {i}", "country_code":
+            "AU", "is_active": True, "statistics": {"pp": i * 1.5,
+            "global_rank": i}}).encode()
+
+    def test_trains_in_background(self):
+        archive = SlowArchive(self.path, train_after=200,
+            dictionary_size=4096)
+        for i in range(200):
+            archive.add("user", f"/users/{i}", {}, self.content(i))
+        # the request which reached ``train_after`` didn't wait for training
+        self.assertTrue(archive._trainer.is_alive())
+        archive.add("user", "/users/200", {}, self.content(200))
+
+        archive.trained.set()
+        archive._trainer.join()
+        self.assertIsNotNone(archive._dictionary_id)
+        archive.add("user", "/users/201", {}, self.content(201))
+        dictionaries = [row[0] for row in archive._db.execute("SELECT "
+            "dictionary FROM responses WHERE url IN (?, ?) ORDER BY id",
+            ["/users/200", "/users/201"])]
+        self.assertEqual(dictionaries, [None, archive._dictionary_id])
+        for i in [0, 200, 201]:
+            self.assertEqual(archive.get(f"/users/{i}").content,
+                self.content(i))
+        archive.close()
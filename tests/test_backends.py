@@ -0,0 +1,286 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import socketserver
+import socket
+import sqlite3
+import threading
+import time
+import io
+
+from ossapi import MemoryBackend, SQLiteBackend, RedisBackend
+from ossapi.backends import _RedisConnection, RedisError
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """
+    A stand-in for a redis server which understands the handful of commands
+    ``RedisBackend`` sends.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), _RedisHandler)
+        self.password = password
+        # key to ``(value, expires_at)``
+        self.values = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*", line
+        command = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    @staticmethod
+    def bulk(value):
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        authenticated = self.server.password is None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            name = command[0].decode().upper()
+            with self.server.lock:
+                self.server.commands.append(name)
+                if name == "AUTH":
+                    authenticated = (command[1].decode() ==
+                        self.server.password)
+                    reply = (b"+OK\r\n" if authenticated else
+                        b"-WRONGPASS invalid password\r\n")
+                elif not authenticated:
+                    reply = b"-NOAUTH Authentication required.\r\n"
+                else:
+                    reply = self.execute(name, command[1:])
+            self.wfile.write(reply)
+
+    def execute(self, name, args):
+        values = self.server.values
+        now = time.time()
+        for key in [k for k, (_, expires_at) in values.items() if
+            expires_at <= now]:
+            del values[key]
+
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "SET":
+            key, value, _, ttl_ms = args
+            values[key] = (value, now + int(ttl_ms) / 1000)
+            return b"+OK\r\n"
+        if name == "MGET":
+            replies = [self.bulk(values.get(key, (None,))[0]) for key in args]
+            return b"*%d\r\n" % len(replies) + b"".join(replies)
+        if name == "DEL":
+            deleted = sum(values.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % deleted
+        if name == "SCAN":
+            prefix = args[2][:-1]
+            keys = [key for key in values if key.startswith(prefix)]
+            return (b"*2\r\n" + self.bulk(b"0") + b"*%d\r\n" % len(keys) +
+                b"".join(self.bulk(key) for key in keys))
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+class TestRESP(TestCase):
+    def test_encode(self):
+        encoded = _RedisConnection._encode(["SET", "key", b"\x00\xff", "PX",
+            1000])
+        self.assertEqual(encoded, b"*5\r\n$3\r\nSET\r\n$3\r\nkey\r\n"
+            b"$2\r\n\x00\xff\r\n$2\r\nPX\r\n$4\r\n1000\r\n")
+
+    def read(self, data):
+        connection = object.__new__(_RedisConnection)
+        connection.file = io.BytesIO(data)
+        return connection._read()
+
+    def test_parse(self):
+        self.assertEqual(self.read(b"+OK\r\n"), "OK")
+        self.assertEqual(self.read(b":42\r\n"), 42)
+        self.assertEqual(self.read(b"$5\r\na\r\nbc\r\n"), b"a\r\nbc")
+        self.assertIsNone(self.read(b"$-1\r\n"))
+        self.assertIsNone(self.read(b"*-1\r\n"))
+        self.assertEqual(self.read(b"*3\r\n$1\r\na\r\n$-1\r\n*1\r\n:1\r\n"),
+            [b"a", None, [1]])
+
+    def test_parse_error(self):
+        with self.assertRaisesRegex(RedisError, "WRONGTYPE"):
+            self.read(b"-WRONGTYPE wrong kind of value\r\n")
+        with self.assertRaises(ConnectionError):
+            self.read(b"")
+
+
+class TestRedisBackend(TestCase):
+    def setUp(self):
+        self.server = RedisStandIn(password="hunter2")
+        self.backend = RedisBackend("127.0.0.1", self.server.port, db=1,
+            password="hunter2")
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.stop()
+
+    def test_get_set(self):
+        self.assertIsNone(self.backend.get("a"))
+        self.backend.set("a", b"\x00value", 60)
+        self.assertEqual(self.backend.get("a"), b"\x00value")
+        self.assertEqual(self.server.commands[:2], ["AUTH", "SELECT"])
+        self.assertIn(b"ossapi:a", self.server.values)
+
+    def test_many(self):
+        self.backend.set_many({"a": b"1", "b": b"2"}, 60)
+        self.assertEqual(self.backend.get_many(["a", "c", "b"]),
+            [b"1", None, b"2"])
+        self.assertEqual(sorted(self.backend.keys()), ["a", "b"])
+
+    def test_ttl(self):
+        self.backend.set("a", b"1", 0.01)
+        time.sleep(0.05)
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_delete_and_clear(self):
+        self.server.values[b"other:a"] = (b"1", time.time() + 60)
+        self.backend.set_many({"a": b"1", "b": b"2"}, 60)
+        self.backend.delete("a")
+        self.assertEqual(self.backend.keys(), ["b"])
+        self.backend.clear()
+        self.assertEqual(self.backend.keys(), [])
+        # keys without our prefix are left alone
+        self.assertIn(b"other:a", self.server.values)
+
+    def test_unreachable(self):
+        # a port nothing is listening on
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        backend = RedisBackend("127.0.0.1", port, timeout=0.1)
+        with self.assertLogs("ossapi", "WARNING") as logs:
+            backend.set("a", b"1", 60)
+            backend.delete("a")
+            self.assertEqual(backend.get_many(["a", "b"]), [None, None])
+        self.assertEqual(len(logs.output), 3)
+
+    def test_wrong_password(self):
+        backend = RedisBackend("127.0.0.1", self.server.port,
+            password="wrong")
+        with self.assertRaises(RedisError):
+            backend.get("a")
+
+
+class TestMemoryBackend(TestCase):
+    def test_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_size=10)
+        backend.set("a", b"12345", 60)
+        backend.set("b", b"12345", 60)
+        backend.get("a")
+        backend.set("c", b"12345", 60)
+        self.assertEqual(backend.get_many(["a", "b", "c"]),
+            [b"12345", None, b"12345"])
+        self.assertEqual(backend.size, 10)
+        self.assertEqual(backend.evictions, 1)
+
+
+class TestSQLiteBackend(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = Path(self.directory.name) / "cache.db"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_set(self):
+        backend = SQLiteBackend(self.path)
+        backend.set_many({"a": b"1", "b": b"2"}, 60)
+        backend.set("c", b"3", -1)
+        self.assertEqual(backend.get_many(["a", "b", "c"]), [b"1", b"2", None])
+        self.assertEqual(sorted(backend.keys()), ["a", "b"])
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+        backend.close()
+
+    def test_shared_between_instances(self):
+        SQLiteBackend(self.path).set("a", b"1", 60)
+        self.assertEqual(SQLiteBackend(self.path).get("a"), b"1")
+
+    def test_evicts_least_recently_used(self):
+        backend = SQLiteBackend(self.path, max_size=10)
+        backend.set("a", b"12345", 60)
+        backend.set("b", b"12345", 60)
+        backend.get("a")
+        backend.set("c", b"12345", 60)
+        self.assertEqual(backend.get_many(["a", "b", "c"]),
+            [b"12345", None, b"12345"])
+        self.assertEqual(backend.size, 10)
+        self.assertEqual(backend.evictions, 1)
+
+    def test_reads_dont_lock(self):
+        backend = SQLiteBackend(self.path)
+        backend.set("a", b"1", 60)
+        # another process is in the middle of writing
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        # fail right away instead of waiting if a read does need a lock
+        backend._db().execute("PRAGMA busy_timeout = 0")
+        try:
+            for _ in range(backend.TOUCH_BATCH - 1):
+                self.assertEqual(backend.get("a"), b"1")
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+
+    def test_size(self):
+        backend = SQLiteBackend(self.path)
+        backend.set_many({"a": b"12345", "b": b"123"}, 60)
+        backend.set("a", b"12", 60)
+        self.assertEqual(backend.size, 5)
+        backend.delete("b")
+        self.assertEqual(backend.size, 2)
+        self.assertEqual(SQLiteBackend(self.path).size, 2)
+        backend.clear()
+        self.assertEqual(backend.size, 0)
+
+    def test_locked(self):
+        backend = SQLiteBackend(self.path)
+        backend.set("a", b"1", 60)
+        backend._db().execute("PRAGMA busy_timeout = 0")
+        # another process is holding the lock for too long
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            with self.assertLogs("ossapi", "WARNING"):
+                backend.set("b", b"2", 60)
+                backend.delete("a")
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+        self.assertEqual(backend.get_many(["a", "b"]), [b"1", None])
+
+    def test_unreadable(self):
+        backend = SQLiteBackend(self.path)
+        backend.set("a", b"1", 60)
+        writer = sqlite3.connect(self.path, isolation_level=None)
+        writer.execute("DROP TABLE cache")
+        writer.close()
+        with self.assertLogs("ossapi", "WARNING"):
+            self.assertIsNone(backend.get("a"))
@@ -0,0 +1,65 @@
+from unittest import TestCase
+from datetime import datetime, timezone
+
+from ossapi import (pack_model, unpack_model, Beatmap, User, Cursor, Mod,
+    GameMode)
+from ossapi.binary import is_compatible
+from ossapi.utils import freeze
+
+from tests.fakes import make_api, beatmap, USER
+
+
+class TestPackModel(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api, _ = make_api(lambda *args: (404, {"error": None}))
+
+    def test_model(self):
+        model = self.api._instantiate_type(Beatmap, beatmap())
+        packed = pack_model(model)
+        self.assertTrue(is_compatible(packed))
+
+        unpacked = unpack_model(packed, self.api)
+        self.assertEqual(unpacked, model)
+        self.assertIsInstance(unpacked.beatmapset().beatmaps[1], type(
+            model.beatmapset().beatmaps[1]))
+        self.assertIs(unpacked._api, self.api)
+
+    def test_values(self):
+        user = self.api._instantiate_type(User, USER)
+        unpacked = unpack_model(pack_model(user))
+        self.assertEqual(unpacked.playstyle, user.playstyle)
+        self.assertEqual(unpacked.last_visit, user.last_visit)
+        self.assertIs(unpacked.last_visit.tzinfo, timezone.utc)
+
+        values = [None, True, False, 0, -5, 2**80, -2**70, 1.5, "",
+            "héllo\U0001F600", b"\x00\xff", [1, [2]], (1, (2, 3)),
+            {"a": [1, (2, 3)]}, datetime(2020, 1, 2, 3, 4, 5, 6),
+            GameMode.TAIKO, Mod("HDDT"), Cursor(page=3, x="a")]
+        for value in values:
+            with self.subTest(value=value):
+                unpacked = unpack_model(pack_model(value))
+                self.assertEqual(unpacked, value)
+                self.assertIs(type(unpacked), type(value))
+
+    def test_frozen(self):
+        model = freeze(self.api._instantiate_type(Beatmap, beatmap()))
+        unpacked = unpack_model(pack_model(model))
+        self.assertTrue(unpacked._frozen)
+        self.assertTrue(unpacked._beatmapset._frozen)
+        self.assertIsInstance(unpacked._beatmapset.beatmaps, tuple)
+
+    def test_incompatible(self):
+        packed = bytearray(pack_model(1))
+        packed[5] ^= 0xff
+        self.assertFalse(is_compatible(bytes(packed)))
+        with self.assertRaises(ValueError):
+            unpack_model(bytes(packed))
+        with self.assertRaises(ValueError):
+            unpack_model(b"not packed")
+
+    def test_unpackable(self):
+        class Unknown:
+            pass
+        with self.assertRaises(TypeError):
+            pack_model(Unknown())
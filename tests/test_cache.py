@@ -0,0 +1,178 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from pathlib import Path
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi import (ResponseCache, SQLiteCache, NotFoundError,
+    CacheMissError, serialize_model)
+from ossapi.cache import CacheEntry
+from ossapi.transport import Response
+
+from tests.fakes import make_api, routes, USER, WIKI_PAGE
+
+
+def expire(cache):
+    """
+    Expires every response in ``cache``, which must keep its entries in
+    memory.
+    """
+    for key in cache.backend.keys():
+        cache.backend.get(key).expires_at = time.time() - 1
+
+
+class TestCacheEntry(TestCase):
+    def test_pack(self):
+        headers = CaseInsensitiveDict({"Content-Type": "application/json",
+            "ETag": '"abc"'})
+        response = Response(200, headers, b'{"id": 2}', "https://a/b", 5)
+        entry = CacheEntry(response, 100.5, 160.5)
+
+        unpacked = CacheEntry.unpack(entry.pack())
+        self.assertEqual(unpacked.stored_at, 100.5)
+        self.assertEqual(unpacked.expires_at, 160.5)
+        r = unpacked.response
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, b'{"id": 2}')
+        self.assertEqual(r.url, "https://a/b")
+        self.assertEqual(r.wire_size, 5)
+        self.assertEqual(r.headers["etag"], '"abc"')
+        self.assertEqual(r.received_at, 100.5)
+
+    def test_validators(self):
+        headers = CaseInsensitiveDict({"ETag": '"abc"',
+            "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        entry = CacheEntry(Response(200, headers, b"", "u"), 0, 0)
+        self.assertEqual(entry.validators(), {"If-None-Match": '"abc"',
+            "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"})
+
+
+class TestResponseCache(TestCase):
+    def make_api(self, handler, **kwargs):
+        cache = ResponseCache(**kwargs)
+        api, transport = make_api(handler, cache=cache)
+        return api, cache, transport
+
+    def test_ttl(self):
+        api, cache, transport = self.make_api(routes({"/users/2/": USER}))
+        user = api.user(2)
+        self.assertEqual(api.user(2), user)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # every hit receives its own copy
+        user.username = "changed"
+        self.assertEqual(api.user(2).username, "peppy")
+
+        expire(cache)
+        api.user(2)
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_uncached_endpoint(self):
+        api, cache, transport = self.make_api(routes({"/users/2/": USER}),
+            ttls={"user": 0})
+        api.user(2)
+        api.user(2)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(cache.backend.keys(), [])
+
+    def test_packed(self):
+        api, cache, transport = self.make_api(routes({"/users/2/": USER}),
+            store="packed")
+        user = api.user(2)
+        self.assertEqual(api.user(2), user)
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_revalidate(self):
+        def handler(method, path, params, headers):
+            if headers.get("If-None-Match") == '"v1"':
+                return (304, b"", {"ETag": '"v2"'})
+            return (200, WIKI_PAGE, {"ETag": '"v1"'})
+        api, cache, transport = self.make_api(handler)
+
+        page = api.wiki_page("en", "Welcome")
+        expire(cache)
+        self.assertEqual(api.wiki_page("en", "Welcome"), page)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(transport.requests[1][3]["If-None-Match"], '"v1"')
+        self.assertEqual(cache.revalidations, 1)
+
+        # the revalidated response is cached again, with the new validators
+        self.assertEqual(api.wiki_page("en", "Welcome"), page)
+        self.assertEqual(len(transport.requests), 2)
+        expire(cache)
+        api.wiki_page("en", "Welcome")
+        self.assertEqual(transport.requests[2][3]["If-None-Match"], '"v2"')
+
+    def test_negative(self):
+        api, cache, transport = self.make_api(routes({}))
+        for _ in range(2):
+            with self.assertRaises(NotFoundError):
+                api.user(3)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(cache.negative_hits, 1)
+
+    def test_no_negative(self):
+        api, cache, transport = self.make_api(routes({}), negative_ttl=0)
+        for _ in range(2):
+            with self.assertRaises(NotFoundError):
+                api.user(3)
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_cache_control(self):
+        api, cache, transport = self.make_api(routes({"/users/2/": USER}))
+        with self.assertRaises(CacheMissError):
+            api.user(2, only_if_cached=True)
+        self.assertEqual(transport.requests, [])
+
+        api.user(2)
+        api.user(2, only_if_cached=True)
+        api.user(2, no_cache=True)
+        self.assertEqual(len(transport.requests), 2)
+
+        time.sleep(0.02)
+        api.user(2, max_age=0.01)
+        self.assertEqual(len(transport.requests), 3)
+
+        expire(cache)
+        api.user(2, stale_ok=True, only_if_cached=True)
+        self.assertEqual(len(transport.requests), 3)
+
+
+class TestDumpCaches(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_dump(self, make_cache):
+        handler = routes({"/users/2/": USER, "/wiki/en/Welcome": WIKI_PAGE})
+        api, transport = make_api(handler, cache=make_cache("a"))
+        user = api.user(2)
+        page = api.wiki_page("en", "Welcome")
+        dump = self.path / "caches.jsonl.gz"
+        self.assertEqual(api.dump_caches(dump), 2)
+
+        api2, transport2 = make_api(handler, cache=make_cache("b"))
+        self.assertEqual(api2.load_caches(dump), {"responses": 2,
+            "entities": 0})
+        # models of different apis never compare equal
+        self.assertEqual(serialize_model(api2.user(2)), serialize_model(user))
+        self.assertEqual(serialize_model(api2.wiki_page("en", "Welcome")),
+            serialize_model(page))
+        self.assertEqual(transport2.requests, [])
+
+    def test_model(self):
+        self.check_dump(lambda name: ResponseCache())
+
+    def test_packed(self):
+        self.check_dump(lambda name: ResponseCache(store="packed"))
+
+    def test_sqlite(self):
+        self.check_dump(lambda name: SQLiteCache(self.path / f"{name}.db"))
+
+    def test_raw(self):
+        self.check_dump(lambda name: ResponseCache(store="raw"))
@@ -0,0 +1,126 @@
+from unittest import TestCase
+import time
+
+from ossapi import (CircuitBreaker, CircuitState, CircuitOpenError,
+    ResponseCache)
+
+from tests.fakes import make_api, USER
+from tests.test_cache import expire
+
+
+class Handler:
+    """
+    A ``FakeTransport`` handler which answers every request with ``USER``, or
+    with a 500 while ``failing`` is set.
+    """
+    def __init__(self):
+        self.failing = False
+
+    def __call__(self, method, path, params, headers):
+        if self.failing:
+            return (500, {"error": "internal server error"})
+        return (200, USER)
+
+
+class TestCircuitBreaker(TestCase):
+    def make_api(self, *, cache=None, **kwargs):
+        handler = Handler()
+        breaker = CircuitBreaker(window=4, minimum_calls=4,
+            failure_threshold=0.5, **kwargs)
+        api, transport = make_api(handler, circuit_breaker=breaker,
+            cache=cache)
+        return api, breaker, handler, transport
+
+    def fail(self, api, times):
+        for _ in range(times):
+            with self.assertRaises(ValueError):
+                api.user(2)
+
+    def test_opens_after_failures(self):
+        api, breaker, handler, transport = self.make_api()
+        api.user(2)
+        api.user(2)
+        handler.failing = True
+        self.fail(api, 1)
+        self.assertEqual(breaker.state("users"), CircuitState.CLOSED)
+        self.fail(api, 1)
+        self.assertEqual(breaker.state("users"), CircuitState.OPEN)
+
+        with self.assertRaises(CircuitOpenError) as e:
+            api.user(2)
+        self.assertEqual(e.exception.family, "users")
+        self.assertGreater(e.exception.retry_after, 0)
+        self.assertEqual(len(transport.requests), 4)
+        # other endpoint families have circuits of their own
+        self.assertEqual(breaker.state("beatmaps"), CircuitState.CLOSED)
+        self.assertEqual(api.metrics()["circuit_states"]["users"], "open")
+
+    def test_half_open_closes(self):
+        api, breaker, handler, transport = self.make_api(recovery_time=0.05,
+            trial_calls=2)
+        handler.failing = True
+        self.fail(api, 4)
+        self.assertEqual(breaker.state("users"), CircuitState.OPEN)
+        time.sleep(0.1)
+        self.assertEqual(breaker.state("users"), CircuitState.HALF_OPEN)
+
+        handler.failing = False
+        api.user(2)
+        self.assertEqual(breaker.state("users"), CircuitState.HALF_OPEN)
+        api.user(2)
+        self.assertEqual(breaker.state("users"), CircuitState.CLOSED)
+
+    def test_half_open_reopens(self):
+        api, breaker, handler, transport = self.make_api(recovery_time=0.05)
+        handler.failing = True
+        self.fail(api, 4)
+        time.sleep(0.1)
+        # the trial request fails
+        self.fail(api, 1)
+        self.assertEqual(breaker.state("users"), CircuitState.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            api.user(2)
+        self.assertEqual(len(transport.requests), 5)
+
+    def test_half_open_limits_trials(self):
+        breaker = CircuitBreaker(window=1, minimum_calls=1, recovery_time=0,
+            trial_calls=1)
+        breaker.before_call("users")
+        breaker.record("users", success=False, latency=0)
+        # one trial may be in flight at a time
+        breaker.before_call("users")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call("users")
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(window=2, minimum_calls=2,
+            latency_threshold=1)
+        for _ in range(2):
+            breaker.before_call("users")
+            breaker.record("users", success=True, latency=2)
+        self.assertEqual(breaker.state("users"), CircuitState.OPEN)
+
+    def test_serves_stale_while_open(self):
+        cache = ResponseCache()
+        api, breaker, handler, transport = self.make_api(cache=cache)
+        user = api.user(2)
+        handler.failing = True
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                api.user(2, no_cache=True)
+        self.assertEqual(breaker.state("users"), CircuitState.OPEN)
+
+        # the expired response is better than nothing
+        expire(cache)
+        self.assertEqual(api.user(2), user)
+        self.assertEqual(api.user(2, no_cache=True), user)
+        self.assertEqual(len(transport.requests), 4)
+
+    def test_raises_while_open_without_cache_entry(self):
+        api, breaker, handler, transport = self.make_api(
+            cache=ResponseCache())
+        handler.failing = True
+        self.fail(api, 4)
+        with self.assertRaises(CircuitOpenError):
+            api.user(2)
+        self.assertEqual(len(transport.requests), 4)
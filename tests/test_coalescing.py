@@ -0,0 +1,114 @@
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from ossapi import RequestCoalescer
+from ossapi.middleware import Request
+from ossapi.transport import Response
+
+from tests.fakes import make_api, USER
+
+
+class TestRequestCoalescer(TestCase):
+    def test_do(self):
+        coalescer = RequestCoalescer()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "result"
+
+        with ThreadPoolExecutor(4) as executor:
+            leader = executor.submit(coalescer.do, "key", slow)
+            started.wait()
+            followers = [executor.submit(coalescer.do, "key", slow) for _ in
+                range(3)]
+            # wait for the followers to start waiting on the leader
+            while coalescer.coalesced < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [f.result() for f in [leader, *followers]]
+
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(len(calls), 1)
+        # the call is forgotten once it finishes
+        self.assertEqual(coalescer.do("key", lambda: "again"), "again")
+
+    def test_exception(self):
+        coalescer = RequestCoalescer()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(2) as executor:
+            leader = executor.submit(coalescer.do, "key", fail)
+            started.wait()
+            follower = executor.submit(coalescer.do, "key", fail)
+            while coalescer.coalesced < 1:
+                time.sleep(0.001)
+            release.set()
+            for future in [leader, follower]:
+                with self.assertRaisesRegex(ValueError, "failed"):
+                    future.result()
+
+    def test_middleware(self):
+        release = threading.Event()
+
+        def handler(method, path, params, headers):
+            release.wait()
+            return (200, USER)
+        api, transport = make_api(handler, coalesce=True)
+
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(api.user, 2) for _ in range(4)]
+            while len(transport.requests) + api.coalescer.coalesced < 4:
+                time.sleep(0.001)
+            release.set()
+            users = [f.result() for f in futures]
+
+        self.assertEqual(len(transport.requests), 1)
+        # every caller receives its own model
+        self.assertEqual(len({id(user) for user in users}), 4)
+        self.assertTrue(all(user.username == "peppy" for user in users))
+
+    def test_conditional(self):
+        coalescer = RequestCoalescer()
+        release = threading.Event()
+        sent = []
+
+        def next_(request):
+            sent.append(request)
+            release.wait()
+            if "If-None-Match" in request.headers:
+                return Response(304, {}, b"", request.url)
+            return Response(200, {}, b"{}", request.url)
+
+        def request(headers):
+            request = Request("GET", "/users/2", {}, None, dict)
+            request.headers.update(headers)
+            return request
+
+        requests = [request({}), request({"If-None-Match": '"a"'}),
+            request({"If-None-Match": '"a"'}), request({"If-None-Match": '"b"'})]
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(coalescer, request, next_)
+                for request in requests]
+            while len(sent) + coalescer.coalesced < 4:
+                time.sleep(0.001)
+            release.set()
+            responses = [f.result() for f in futures]
+
+        # only the requests with the same validators were coalesced
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(coalescer.coalesced, 1)
+        self.assertEqual([r.status_code for r in responses],
+            [200, 304, 304, 304])
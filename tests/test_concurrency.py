@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from ossapi import AIMDLimiter
+
+
+class TestAIMDLimiter(TestCase):
+    def test_grows_and_backs_off(self):
+        limiter = AIMDLimiter(initial_limit=4, max_limit=8)
+        for _ in range(20):
+            tokens = [limiter.acquire() for _ in range(limiter.limit)]
+            for token in tokens:
+                limiter.release(token, 0.1)
+        self.assertEqual(limiter.limit, 8)
+
+        token = limiter.acquire()
+        limiter.release(token, 0.1, dropped=True)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.backoffs, 1)
+
+    def test_one_backoff_per_burst(self):
+        limiter = AIMDLimiter(initial_limit=8)
+        tokens = [limiter.acquire() for _ in range(4)]
+        for token in tokens:
+            limiter.release(token, 0.1, dropped=True)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_baseline_per_endpoint(self):
+        limiter = AIMDLimiter(initial_limit=8)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), 0.05, endpoint="user")
+            limiter.release(limiter.acquire(), 1, endpoint="search_beatmapsets")
+        # a slow endpoint isn't a latency jump for a fast one, or the other way
+        # around
+        self.assertEqual(limiter.backoffs, 0)
+        self.assertEqual(limiter.baseline_latency("user"), 0.05)
+        self.assertEqual(limiter.baseline_latency("search_beatmapsets"), 1)
+        self.assertIsNone(limiter.baseline_latency("beatmap"))
+
+        limiter.release(limiter.acquire(), 0.5, endpoint="user")
+        self.assertEqual(limiter.backoffs, 1)
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from ossapi import DigestCache, ResponseCache, serialize_model
+
+from tests.fakes import make_api, USER
+
+
+class TestDigestCache(TestCase):
+    def make_api(self, **kwargs):
+        self.users = [USER]
+        api, transport = make_api(lambda *args: (200, self.users[0]),
+            digest_cache=DigestCache(), **kwargs)
+        return api, transport
+
+    def test_unchanged(self):
+        api, transport = self.make_api()
+        first, changed = api.poll(api.user, 2)
+        self.assertTrue(changed)
+        second, changed = api.poll(api.user, 2)
+        self.assertFalse(changed)
+        self.assertEqual(len(transport.requests), 2)
+        # every caller receives its own copy of a mutable model
+        self.assertIsNot(second, first)
+        self.assertEqual(serialize_model(second), serialize_model(first))
+        self.assertIs(second._api, api)
+        self.assertEqual(api.metrics()["digest_hits"], 1)
+
+    def test_unchanged_frozen(self):
+        api, transport = self.make_api(frozen=True)
+        first, _ = api.poll(api.user, 2)
+        second, changed = api.poll(api.user, 2)
+        self.assertFalse(changed)
+        self.assertIs(second, first)
+
+    def test_changed(self):
+        api, transport = self.make_api()
+        api.poll(api.user, 2)
+        self.users[0] = {**USER, "username": "renamed"}
+        user, changed = api.poll(api.user, 2)
+        self.assertTrue(changed)
+        self.assertEqual(user.username, "renamed")
+        user, changed = api.poll(api.user, 2)
+        self.assertFalse(changed)
+        self.assertEqual(user.username, "renamed")
+
+    def test_requests_are_tracked_separately(self):
+        api, transport = self.make_api()
+        api.poll(api.user, 2)
+        _, changed = api.poll(api.user, 3)
+        self.assertTrue(changed)
+
+    def test_cached_responses_are_unchanged(self):
+        api, transport = self.make_api(cache=ResponseCache())
+        api.poll(api.user, 2)
+        _, changed = api.poll(api.user, 2)
+        self.assertFalse(changed)
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_requires_digest_cache(self):
+        api, transport = make_api(lambda *args: (200, USER))
+        with self.assertRaises(ValueError):
+            api.poll(api.user, 2)
@@ -0,0 +1,138 @@
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+from pathlib import Path
+
+from ossapi import EntityStore, Beatmap, SQLiteBackend
+
+from tests.fakes import make_api, routes, beatmap, USER, SCORE
+
+
+class TestEntityStore(TestCase):
+    def make_api(self, routes_):
+        api, transport = make_api(routes(routes_), entity_store=EntityStore())
+        return api, api.entity_store, transport
+
+    def test_lookup(self):
+        api, store, transport = self.make_api({"/beatmaps/lookup": beatmap()})
+        first = api.beatmap(221777)
+        second = api.beatmap(221777)
+        self.assertEqual(second, first)
+        self.assertIsNot(second, first)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(store.metrics(), {"entity_hits": 1,
+            "entity_misses": 1})
+
+    def test_nested_entities_are_compact(self):
+        api, store, transport = self.make_api({
+            "/users/2/scores/best": [SCORE],
+            "/beatmaps/lookup": beatmap()
+        })
+        api.user_scores(2, "best")
+        # the beatmap of a score is a ``Beatmap``, but it's missing fields
+        # which only a lookup returns
+        nested = store.get("beatmap", 221777, full=False)
+        self.assertIsInstance(nested, Beatmap)
+        self.assertIsNone(store.get("beatmap", 221777))
+        self.assertEqual(store.get("user", 2, full=False).username, "peppy")
+
+        api.beatmap(221777)
+        self.assertEqual(len(transport.requests), 2)
+        # the looked up beatmap answers the next lookup, and isn't replaced by
+        # the compact beatmap of a score
+        api.user_scores(2, "best", no_cache=True)
+        api.beatmap(221777)
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_beatmaps_of_beatmapset_are_compact(self):
+        api, store, transport = self.make_api({"/beatmaps/lookup": beatmap()})
+        api.beatmap(221777)
+        self.assertIsNotNone(store.get("beatmap", 221777))
+        self.assertIsNone(store.get("beatmap", 221778))
+        self.assertIsNone(store.get("beatmapset", 39804))
+        self.assertIsNotNone(store.get("beatmap", 221778, full=False))
+        self.assertIsNotNone(store.get("beatmapset", 39804, full=False))
+
+    def test_user_with_mode(self):
+        api, store, transport = self.make_api({"/users/2/taiko": USER})
+        api.user(2, mode="taiko")
+        self.assertIsNone(store.get("user", 2, full=False))
+
+    def test_user_by_username(self):
+        api, store, transport = self.make_api({"/users/2/": USER})
+        api.user(2)
+        api.user(2, key="id")
+        self.assertEqual(len(transport.requests), 1)
+        # the user named "2", who isn't necessarily the user with id 2
+        api.user(2, key="username")
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(transport.requests[1][2]["key"], "username")
+
+    def test_dump_load(self):
+        api, store, transport = self.make_api({
+            "/users/2/scores/best": [SCORE],
+            "/beatmaps/lookup": beatmap(id=1, beatmapset_id=2)
+        })
+        api.user_scores(2, "best")
+        api.beatmap(1)
+
+        api2, store2, transport2 = self.make_api({})
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "caches.jsonl"
+            count = api.dump_caches(path)
+            self.assertEqual(api2.load_caches(path), {"responses": 0,
+                "entities": count})
+        self.assertIsInstance(store2.get("beatmap", 1), Beatmap)
+        self.assertIsNone(store2.get("beatmap", 221777))
+        # still decoded as the full model it was received as
+        self.assertIsInstance(store2.get("beatmap", 221777, full=False),
+            Beatmap)
+        api2.beatmap(1)
+        self.assertEqual(transport2.requests, [])
+
+
+class TestBytesBackend(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.path = Path(self.directory.name) / "entities.db"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_api(self, routes_):
+        store = EntityStore(backend=SQLiteBackend(self.path))
+        api, transport = make_api(routes(routes_), entity_store=store)
+        return api, store, transport
+
+    def test_shared_between_stores(self):
+        api, store, transport = self.make_api({
+            "/users/2/scores/best": [SCORE],
+            "/beatmaps/lookup": beatmap()
+        })
+        first = api.beatmap(221777)
+        api.user_scores(2, "best")
+
+        api2, store2, transport2 = self.make_api({})
+        second = api2.beatmap(221777)
+        self.assertEqual(transport2.requests, [])
+        self.assertIsInstance(second, Beatmap)
+        self.assertEqual(second.version, first.version)
+        # unpacked by the api, so it can make requests of its own
+        self.assertIs(second._api, api2)
+        self.assertIsNone(store2.get("user", 2))
+        self.assertEqual(store2.get("user", 2, full=False).username, "peppy")
+        self.assertEqual(store2.metrics(), {"entity_hits": 1,
+            "entity_misses": 0})
+
+    def test_dump_load(self):
+        api, store, transport = self.make_api({
+            "/beatmaps/lookup": beatmap()
+        })
+        api.beatmap(221777)
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "caches.jsonl"
+            count = api.dump_caches(path)
+            store.clear()
+            self.assertEqual(api.load_caches(path), {"responses": 0,
+                "entities": count})
+        api.beatmap(221777)
+        self.assertEqual(len(transport.requests), 1)
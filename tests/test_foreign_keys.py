@@ -0,0 +1,79 @@
+from unittest import TestCase
+import copy
+
+from ossapi import Beatmap, Beatmapset, EntityStore, ResponseCache, User
+from ossapi.utils import freeze
+
+from tests.fakes import make_api, routes, beatmap, USER, BEATMAPSET
+
+
+class TestForeignKeys(TestCase):
+    def make_api(self, **kwargs):
+        api, transport = make_api(routes({"/users/2/": USER,
+            "/beatmaps/lookup": beatmap(), "/beatmapsets/39804": BEATMAPSET}),
+            **kwargs)
+        return api, transport, api._instantiate_type(Beatmap, beatmap())
+
+    def test_memoized_per_instance(self):
+        api, transport, model = self.make_api()
+        user = model.user()
+        self.assertIsInstance(user, User)
+        self.assertIs(model.user(), user)
+        self.assertEqual(len(transport.requests), 1)
+
+        other = api._instantiate_type(Beatmap, beatmap())
+        other.user()
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_refresh(self):
+        api, transport, model = self.make_api()
+        user = model.user()
+        refreshed = model.user(refresh=True)
+        self.assertIsNot(refreshed, user)
+        self.assertEqual(len(transport.requests), 2)
+        # the refreshed model replaces the memoized one
+        self.assertIs(model.user(), refreshed)
+
+    def test_refresh_bypasses_caches(self):
+        api, transport, model = self.make_api(entity_store=EntityStore(),
+            cache=ResponseCache())
+        model.user()
+        model.user(refresh=True)
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_answered_by_entity_store(self):
+        api, transport, model = self.make_api(entity_store=EntityStore())
+        api.user(2)
+        self.assertEqual(model.user().username, "peppy")
+        api._instantiate_type(Beatmap, beatmap()).user()
+        # only the first lookup makes a request
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_existing(self):
+        api, transport, model = self.make_api()
+        # returned with the beatmap, so following it doesn't make a request
+        self.assertIs(model.beatmapset(), model._beatmapset)
+        self.assertEqual(transport.requests, [])
+
+    def test_memo_isnt_copied(self):
+        api, transport, model = self.make_api()
+        model.user()
+        copied = copy.deepcopy(model)
+        self.assertNotIn("_foreign_keys", vars(copied))
+        self.assertEqual(copied, model)
+        self.assertIs(copied._api, api)
+
+    def test_frozen(self):
+        api, transport, model = self.make_api(frozen=True)
+        model = api.beatmap(221777)
+        user = model.user()
+        self.assertIs(model.user(), user)
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_frozen_after_following(self):
+        api, transport, model = self.make_api()
+        model.user()
+        freeze(model)
+        self.assertIsInstance(model.beatmapset(refresh=True), Beatmapset)
+        self.assertIsInstance(model.user(), User)
+        self.assertEqual(len(transport.requests), 2)
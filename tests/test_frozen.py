@@ -0,0 +1,67 @@
+from unittest import TestCase
+from dataclasses import FrozenInstanceError
+from types import MappingProxyType
+
+from ossapi import Beatmap, Cursor, pack_model, unpack_model, serialize_model
+from ossapi.utils import freeze, is_frozen
+
+from tests.fakes import make_api, beatmap
+
+
+class TestFreeze(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api, _ = make_api(lambda *args: (404, {"error": None}))
+
+    def test_model(self):
+        model = freeze(self.api._instantiate_type(Beatmap, beatmap()))
+        self.assertTrue(is_frozen(model))
+        with self.assertRaises(FrozenInstanceError):
+            model.version = "Hard"
+        with self.assertRaises(FrozenInstanceError):
+            model._beatmapset.title = "title"
+        self.assertIsInstance(model._beatmapset.beatmaps, tuple)
+
+    def test_dict(self):
+        value = freeze({"a": [1, {"b": 2}]})
+        self.assertIsInstance(value, MappingProxyType)
+        self.assertIsInstance(value["a"][1], MappingProxyType)
+        with self.assertRaises(TypeError):
+            value["a"] = 1
+        self.assertEqual(value, {"a": (1, {"b": 2})})
+
+    def test_cursor(self):
+        cursor = freeze(Cursor(page=2, sort=[1, 2]))
+        with self.assertRaises(FrozenInstanceError):
+            cursor.page = 3
+        with self.assertRaises(FrozenInstanceError):
+            del cursor.page
+        self.assertEqual(cursor.sort, (1, 2))
+        self.assertEqual(cursor, Cursor(page=2, sort=(1, 2)))
+        # the flag isn't one of the cursor's values
+        self.assertEqual(vars(cursor), {"page": 2, "sort": (1, 2)})
+
+        unfrozen = Cursor(page=2)
+        unfrozen.page = 3
+        self.assertFalse(is_frozen(unfrozen))
+
+    def test_cursor_params(self):
+        cursor = freeze(Cursor(page=2, sort=[1, 2]))
+        params = self.api._format_params({"cursor": cursor})
+        unfrozen = Cursor(page=2, sort=[1, 2])
+        self.assertEqual(params, self.api._format_params({"cursor": unfrozen}))
+        # formatting doesn't modify the (possibly shared) cursor
+        self.assertEqual(vars(cursor), {"page": 2, "sort": (1, 2)})
+
+    def test_pack(self):
+        values = [freeze({"a": [1]}), freeze(Cursor(page=2, sort=[1]))]
+        for value in values:
+            with self.subTest(value=value):
+                unpacked = unpack_model(pack_model(value))
+                self.assertEqual(unpacked, value)
+                self.assertTrue(is_frozen(unpacked) or
+                    isinstance(unpacked, MappingProxyType))
+                self.assertIs(type(unpacked), type(value))
+
+    def test_serialize(self):
+        self.assertEqual(serialize_model(freeze({"a": [1]})), '{"a": [1]}')
@@ -0,0 +1,146 @@
+from unittest import TestCase
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from ossapi import HedgingPolicy, AIMDLimiter
+from ossapi.transport import Response
+
+from tests.fakes import make_api, USER
+
+
+def response(url="u"):
+    return Response(200, CaseInsensitiveDict(), b"{}", url)
+
+def is_hedge():
+    return threading.current_thread().name.startswith("ossapi-hedge")
+
+
+class TestHedgingPolicy(TestCase):
+    def test_unhedged_runs_inline(self):
+        policy = HedgingPolicy(min_samples=20)
+        threads = []
+
+        def send():
+            threads.append(threading.current_thread())
+            return response()
+
+        for _ in range(5):
+            policy.execute("user", send)
+        self.assertEqual(threads, [threading.current_thread()] * 5)
+        self.assertIsNone(policy._executor)
+        self.assertEqual(len(policy.latencies("user")), 5)
+
+    def test_hedge(self):
+        policy = HedgingPolicy(min_samples=2, budget=1)
+        for _ in range(2):
+            policy.execute("user", response)
+        release = threading.Event()
+
+        def send():
+            if is_hedge():
+                return response("hedge")
+            # the primary request hangs until the hedge wins
+            release.wait(5)
+            return response("primary")
+
+        self.assertEqual(policy.execute("user", send).url, "hedge")
+        release.set()
+        self.assertEqual(policy.metrics(), {"hedged_requests": 1,
+            "hedges_won": 1})
+
+    def test_hedges_dont_wait_on_primaries(self):
+        policy = HedgingPolicy(min_samples=2, budget=1, max_workers=3)
+        for _ in range(2):
+            policy.execute("user", response)
+        release = threading.Event()
+        results = []
+
+        def send():
+            if is_hedge():
+                return response("hedge")
+            release.wait(5)
+            return response("primary")
+
+        # three hanging primaries, which take up every primary worker. The
+        # hedges have workers of their own, so they still finish while every
+        # primary hangs.
+        def call():
+            results.append(policy.execute("user", send).url)
+        callers = [threading.Thread(target=call) for _ in range(3)]
+        start = time.monotonic()
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join(2)
+        release.set()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(sorted(results), ["hedge"] * 3)
+
+    def test_primary_wins(self):
+        policy = HedgingPolicy(min_samples=2, budget=1)
+        for _ in range(2):
+            policy.execute("user", response)
+
+        def send():
+            if is_hedge():
+                time.sleep(1)
+                return response("hedge")
+            time.sleep(0.05)
+            return response("primary")
+
+        self.assertEqual(policy.execute("user", send).url, "primary")
+        self.assertEqual(policy.hedges_won, 0)
+
+    def test_busy_primaries_run_inline(self):
+        policy = HedgingPolicy(min_samples=2, budget=0, max_workers=1)
+        for _ in range(2):
+            policy.execute("user", response)
+        release = threading.Event()
+        started = threading.Event()
+        threads = []
+
+        def send():
+            threads.append(threading.current_thread())
+            started.set()
+            release.wait(5)
+            return response()
+
+        caller = threading.Thread(target=policy.execute, args=("user", send))
+        caller.start()
+        started.wait(5)
+        # the only primary worker is busy, so this is sent from the calling
+        # thread instead of waiting for it
+        release.set()
+        policy.execute("user", send)
+        caller.join(5)
+        self.assertEqual(threads[1], threading.current_thread())
+        self.assertTrue(threads[0].name.startswith("ossapi-request"))
+
+    def test_hedges_take_a_concurrency_slot(self):
+        lock = threading.Lock()
+        in_flight = []
+        most_in_flight = []
+
+        def handler(method, path, params, headers):
+            with lock:
+                in_flight.append(None)
+                most_in_flight.append(len(in_flight))
+            # the first request after warming up hangs for a while
+            time.sleep(0.2 if len(most_in_flight) == 3 else 0)
+            with lock:
+                in_flight.pop()
+            return (200, USER)
+
+        policy = HedgingPolicy(min_samples=2, budget=1)
+        limiter = AIMDLimiter(initial_limit=1, min_limit=1, max_limit=1)
+        api, transport = make_api(handler, hedging=policy,
+            concurrency_limiter=limiter)
+        for _ in range(3):
+            api.user(2)
+        self.assertEqual(policy.hedged, 1)
+        # wait for the hedge, which had to wait for the primary's slot
+        while len(transport.requests) < 4:
+            time.sleep(0.01)
+        self.assertEqual(max(most_in_flight), 1)
@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from ossapi import (BeatmapIndex, IndexedBeatmap, EntityStore, Beatmap,
+    UsernameIndex, ResponseCache, User)
+
+from tests.fakes import make_api, routes, beatmap, BEATMAP, USER
+
+
+class TestBeatmapIndex(TestCase):
+    def test_add(self):
+        index = BeatmapIndex()
+        index.add([IndexedBeatmap("a", 1, 2, "osu", "Insane", 1, 0),
+            IndexedBeatmap("b", 3, None, None, None, None, 0)])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.get("a").beatmap_id, 1)
+        self.assertIsNone(index.get("c"))
+
+    def test_unchanged_rows_are_skipped(self):
+        index = BeatmapIndex()
+        index.add([IndexedBeatmap("a", 1, 2, "osu", "Insane", 1, 0)])
+        updated_at = index.get("a").updated_at
+
+        index.add([IndexedBeatmap("a", 1, 2, "osu", "Insane", 1, 0)])
+        self.assertEqual(index.get("a").updated_at, updated_at)
+
+        index.add([IndexedBeatmap("a", 1, 2, "osu", "Insane", 4, 0)])
+        self.assertEqual(index.get("a").status, 4)
+        self.assertGreaterEqual(index.get("a").updated_at, updated_at)
+
+    def test_lookup_by_checksum(self):
+        checksum = BEATMAP["checksum"]
+
+        def handler(method, path, params, headers):
+            if params.get("id") == 221777 or params.get("checksum") == checksum:
+                return (200, beatmap())
+            return (404, {"error": None})
+        api, transport = make_api(handler, entity_store=EntityStore(),
+            beatmap_index=BeatmapIndex())
+
+        self.assertIsInstance(api.beatmap(checksum=checksum), Beatmap)
+        self.assertEqual(api.beatmap_index.get(checksum).beatmap_id, 221777)
+        # looked up by id, and answered by the entity store
+        api.beatmap(checksum=checksum)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(api.beatmap_index.hits, 1)
+
+
+class TestUsernameIndex(TestCase):
+    def user(self, username, previous_usernames=None):
+        api, _ = make_api(routes({}))
+        return api._instantiate_type(User, {**USER, "username": username,
+            "previous_usernames": previous_usernames})
+
+    def current(self, index, username):
+        row = index._db.execute("SELECT current FROM usernames WHERE "
+            "username = ?", [username]).fetchone()
+        return None if row is None else bool(row[0])
+
+    def test_add(self):
+        index = UsernameIndex()
+        index.add([self.user("peppy2", ["peppy"])])
+        self.assertEqual(index.get("PEPPY2"), 2)
+        self.assertEqual(index.get("peppy"), 2)
+        self.assertTrue(self.current(index, "peppy2"))
+        self.assertFalse(self.current(index, "peppy"))
+        self.assertIsNone(index.get("someone"))
+
+    def test_older_information_is_ignored(self):
+        index = UsernameIndex()
+        index.add([self.user("peppy2", ["peppy"])], at=20)
+        index.add([self.user("peppy")], at=10)
+        self.assertTrue(self.current(index, "peppy2"))
+        self.assertFalse(self.current(index, "peppy"))
+
+    def test_unchanged_rows_are_skipped(self):
+        index = UsernameIndex()
+        index.add([self.user("peppy2", ["peppy"])], at=10)
+        writes = []
+        index._write = writes.append
+        index.add([self.user("peppy2", ["peppy"])], at=20)
+        self.assertEqual(writes, [])
+
+        index.add([self.user("peppy3", ["peppy", "peppy2"])], at=30)
+        self.assertEqual(len(writes), 1)
+
+    def test_lookup_by_username(self):
+        api, transport = make_api(routes({"/users/2/": USER,
+            "/users/peppy/": USER}), entity_store=EntityStore(),
+            username_index=UsernameIndex())
+        api.user(2)
+        # looked up by id, and answered by the entity store
+        self.assertEqual(api.user("peppy", key="username").id, 2)
+        self.assertEqual(len(transport.requests), 1)
+        self.assertEqual(api.username_index.hits, 1)
+
+    def test_cached_responses_dont_undo_renames(self):
+        renamed = {**USER, "username": "peppy2", "previous_usernames":
+            ["peppy"]}
+        users = [USER]
+        api, transport = make_api(lambda *args: (200, users[0]),
+            cache=ResponseCache(), username_index=UsernameIndex())
+        api.user(2)
+        users[0] = renamed
+        api.user(2, mode="osu")
+        # answered by the cache with the response from before the rename
+        api.user(2)
+        self.assertEqual(len(transport.requests), 2)
+        index = api.username_index
+        self.assertTrue(self.current(index, "peppy2"))
+        self.assertFalse(self.current(index, "peppy"))
@@ -0,0 +1,113 @@
+from unittest import TestCase
+from datetime import datetime, timezone, timedelta
+
+from ossapi import ResponseCache, EntityStore
+
+from tests.fakes import (make_api, routes, beatmap, USER, SCORE,
+    BEATMAPSET_COMPACT)
+
+
+def timestamp(ago=0):
+    at = datetime.now(timezone.utc) - timedelta(seconds=ago)
+    return at.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+def beatmapset_event(type_, ago=0, comment=None):
+    return {"id": 1, "type": type_, "comment": comment,
+        "created_at": timestamp(ago), "user_id": None,
+        "beatmapset": BEATMAPSET_COMPACT, "discussion": None}
+
+def user_event(type_, ago=0, **kwargs):
+    user = {"username": "peppy", "url": "/users/2", "previousUsername": None}
+    return {"id": 1, "type": type_, "created_at": timestamp(ago),
+        "createdAt": timestamp(ago), "user": user, **kwargs}
+
+
+class TestEventInvalidator(TestCase):
+    def make_api(self, *, beatmapset_events=(), user_events=()):
+        routes_ = {
+            "/users/2/": USER,
+            "/users/2/scores/best": [SCORE],
+            "/beatmaps/lookup": beatmap(),
+            "/beatmapsets/events": {"events": list(beatmapset_events),
+                "reviewsConfig": {"max_blocks": 10}, "users": []},
+            "/users/2/recent_activity/": list(user_events)
+        }
+        # scores aren't cached by default
+        self.cache = ResponseCache(default_ttl=60)
+        self.store = EntityStore()
+        api, transport = make_api(routes(routes_), cache=self.cache,
+            entity_store=self.store, invalidate_on_events=True)
+        return api, transport
+
+    def requests(self, transport, path):
+        return len([r for r in transport.requests if r[1] == path])
+
+    def fetch(self, api):
+        api.user(2)
+        api.beatmap(221777)
+        api.user_scores(2, "best")
+
+    def test_rank(self):
+        api, transport = self.make_api(
+            beatmapset_events=[beatmapset_event("rank")])
+        self.fetch(api)
+        self.assertIsNotNone(self.store.get("beatmap", 221777))
+
+        api.beatmapset_events()
+        self.assertIsNone(self.store.get("beatmap", 221777, full=False))
+        self.assertIsNone(self.store.get("beatmap", 221778, full=False))
+        # the user wasn't affected
+        self.assertIsNotNone(self.store.get("user", 2))
+
+        self.fetch(api)
+        self.assertEqual(self.requests(transport, "/beatmaps/lookup"), 2)
+        # the scores contain the beatmap
+        self.assertEqual(self.requests(transport, "/users/2/scores/best"), 2)
+        self.assertEqual(self.requests(transport, "/users/2/"), 1)
+        self.assertGreater(api.metrics()["invalidated_responses"], 0)
+
+    def test_other_events_are_ignored(self):
+        api, transport = self.make_api(
+            beatmapset_events=[beatmapset_event("kudosu_allow", comment={
+                "beatmap_discussion_id": 1,
+                "beatmap_discussion_post_id": None})])
+        self.fetch(api)
+        api.beatmapset_events()
+        self.fetch(api)
+        self.assertEqual(len(transport.requests), 4)
+
+    def test_rename(self):
+        api, transport = self.make_api(user_events=[user_event(
+            "usernameChange")])
+        self.fetch(api)
+        api.user_recent_activity(2)
+        self.assertIsNone(self.store.get("user", 2, full=False))
+        self.assertIsNotNone(self.store.get("beatmap", 221777))
+
+        self.fetch(api)
+        self.assertEqual(self.requests(transport, "/users/2/"), 2)
+        self.assertEqual(self.requests(transport, "/users/2/scores/best"), 2)
+        self.assertEqual(self.requests(transport, "/beatmaps/lookup"), 1)
+
+    def test_rank_activity(self):
+        beatmap_ = {"title": "xi - FREEDOM DiVE [Insane]",
+            "url": "/b/221777?m=0"}
+        api, transport = self.make_api(user_events=[user_event("rank",
+            scoreRank="S", rank=1, mode="osu", beatmap=beatmap_)])
+        self.fetch(api)
+        api.user_recent_activity(2)
+        self.assertIsNone(self.store.get("beatmap", 221777, full=False))
+        self.assertIsNone(self.store.get("user", 2, full=False))
+        self.fetch(api)
+        self.assertEqual(self.requests(transport, "/beatmaps/lookup"), 2)
+        self.assertEqual(self.requests(transport, "/users/2/"), 2)
+
+    def test_older_events(self):
+        # the event happened before we fetched anything
+        api, transport = self.make_api(
+            beatmapset_events=[beatmapset_event("rank", ago=60 * 60)])
+        self.fetch(api)
+        api.beatmapset_events()
+        self.assertIsNotNone(self.store.get("beatmap", 221777))
+        self.fetch(api)
+        self.assertEqual(len(transport.requests), 4)
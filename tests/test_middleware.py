@@ -0,0 +1,98 @@
+from unittest import TestCase
+import json
+
+from ossapi import Middleware, BandwidthCounter, ResponseCache, User
+from ossapi.transport import Response
+
+from tests.fakes import make_api, routes, USER
+
+
+class Recorder(Middleware):
+    """
+    Records every request which passes through it.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request, next_):
+        self.requests.append(request)
+        return next_(request)
+
+    def metrics(self):
+        return {"recorded": len(self.requests)}
+
+
+class TestMiddleware(TestCase):
+    def test_runs_outermost(self):
+        recorder = Recorder()
+        cache = ResponseCache()
+        api, transport = make_api(routes({"/users/2/": USER}),
+            middleware=[recorder], cache=cache)
+        self.assertIs(api.middleware[0], recorder)
+        self.assertIs(api.middleware[1], cache)
+        self.assertIsInstance(api.middleware[-1], BandwidthCounter)
+
+        api.user(2)
+        api.user(2)
+        # the second call is answered by the cache, which comes after us
+        self.assertEqual(len(recorder.requests), 2)
+        self.assertEqual(len(transport.requests), 1)
+        request = recorder.requests[0]
+        self.assertEqual((request.method, request.url, request.endpoint,
+            request.family), ("GET", "/users/2/", "user", "users"))
+        self.assertEqual(request.arguments, {"user": 2, "mode": None,
+            "key": None})
+        self.assertEqual(api.metrics()["recorded"], 2)
+
+    def test_short_circuit(self):
+        def answer(request, next_):
+            return Response(200, {}, json.dumps(USER).encode(), request.url)
+        api, transport = make_api(routes({}), middleware=[answer])
+        user = api.user(2)
+        # decoded like any other response
+        self.assertIsInstance(user, User)
+        self.assertEqual(user.username, "peppy")
+        self.assertEqual(transport.requests, [])
+
+    def test_change_request(self):
+        def change(request, next_):
+            request.headers["X-Extra"] = "1"
+            request.params = {**request.params, "mode": "osu"}
+            return next_(request)
+        api, transport = make_api(routes({"/users/2/": USER}),
+            middleware=[change])
+        api.user(2)
+        _, _, params, headers = transport.requests[0]
+        self.assertEqual(params["mode"], "osu")
+        self.assertEqual(headers["X-Extra"], "1")
+
+    def test_change_response(self):
+        def rename(request, next_):
+            response = next_(request)
+            response.decode().username = "renamed"
+            return response
+        api, transport = make_api(routes({"/users/2/": USER}),
+            middleware=[rename])
+        self.assertEqual(api.user(2).username, "renamed")
+
+    def test_order(self):
+        calls = []
+
+        def outer(request, next_):
+            calls.append("outer")
+            return next_(request)
+
+        def inner(request, next_):
+            calls.append("inner")
+            return next_(request)
+        api, transport = make_api(routes({"/users/2/": USER}),
+            middleware=[outer, inner])
+        api.user(2)
+        self.assertEqual(calls, ["outer", "inner"])
+
+    def test_bandwidth(self):
+        api, transport = make_api(routes({"/users/2/": USER}))
+        api.user(2)
+        size = len(json.dumps(USER))
+        self.assertEqual(api.metrics()["bytes"], {"user": {"responses": 1,
+            "wire_bytes": size, "decompressed_bytes": size}})
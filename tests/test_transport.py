@@ -0,0 +1,223 @@
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+import threading
+import time
+import gzip
+import json
+import zlib
+
+from requests import ConnectionError
+from oauthlib.oauth2 import TokenExpiredError
+
+from ossapi import Urllib3Transport, HttpxTransport
+from ossapi.transport import Response, ACCEPT_ENCODING
+
+from tests.fakes import make_api, USER
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+BODY = json.dumps([{"id": 2, "username": "peppy"}] * 20).encode()
+
+
+class TestFromRaw(TestCase):
+    def check(self, encoding, raw):
+        response = Response.from_raw(200, {"Content-Encoding": encoding}, raw,
+            "u")
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(response.wire_size, len(raw))
+
+    def test_identity(self):
+        response = Response.from_raw(200, {}, BODY, "u")
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(response.wire_size, len(BODY))
+        self.check("identity", BODY)
+
+    def test_gzip(self):
+        raw = gzip.compress(BODY)
+        self.check("gzip", raw)
+        self.assertLess(len(raw), len(BODY))
+
+    def test_deflate(self):
+        self.check("deflate", zlib.compress(BODY))
+        # some servers send a raw deflate stream instead
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.check("deflate", compressor.compress(BODY) + compressor.flush())
+
+    @skipIf(brotli is None, "requires brotli")
+    def test_brotli(self):
+        self.check("br", brotli.compress(BODY))
+
+    @skipIf(zstandard is None, "requires zstandard")
+    def test_zstd(self):
+        self.check("zstd", zstandard.ZstdCompressor().compress(BODY))
+        # streamed frames don't declare their decompressed size
+        compressor = zstandard.ZstdCompressor().compressobj()
+        self.check("zstd", compressor.compress(BODY) + compressor.flush())
+
+    def test_several_encodings(self):
+        # applied in the order they're listed
+        raw = gzip.compress(zlib.compress(BODY))
+        self.check("deflate, gzip", raw)
+
+    def test_unknown_encoding(self):
+        with self.assertRaisesRegex(ValueError, "unsupported content encoding"):
+            Response.from_raw(200, {"Content-Encoding": "compress"}, BODY, "u")
+
+
+class Server(ThreadingHTTPServer):
+    """
+    A local http server which answers every request with ``response``, a
+    ``(status_code, headers, body)`` tuple, and records every request in
+    ``requests`` as a ``(method, path, headers, body)`` tuple.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.response = (200, {"Content-Type": "application/json",
+            "Content-Encoding": "gzip"}, gzip.compress(BODY))
+        self.requests = []
+        threading.Thread(target=self.serve_forever, args=[0.01],
+            daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self.server.requests.append((self.command, self.path, self.headers,
+            body))
+        status_code, headers, body = self.server.response
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+def token(access_token, expires_in=3600):
+    return {"access_token": access_token, "token_type": "Bearer",
+        "expires_at": time.time() + expires_in}
+
+
+class TransportTests:
+    """
+    Tests every ``BearerTransport`` should pass. Subclasses set
+    ``make_transport``.
+    """
+    def setUp(self):
+        self.server = Server()
+        self.transport = self.make_transport()
+        self.transport.authorize(SimpleNamespace(token=token("first")))
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_get(self):
+        r = self.transport.request("GET", f"{self.server.url}/users/2",
+            params={"mode": "osu", "key": None, "ids[]": [1, 2]})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, BODY)
+        self.assertEqual(r.wire_size, len(self.server.response[2]))
+        self.assertEqual(r.json()[0]["id"], 2)
+
+        method, path, headers, _ = self.server.requests[0]
+        self.assertEqual(method, "GET")
+        # ``None`` values are dropped, like requests does
+        self.assertEqual(path, "/users/2?mode=osu&ids%5B%5D=1&ids%5B%5D=2")
+        self.assertEqual(headers["Authorization"], "Bearer first")
+        self.assertEqual(headers["Accept-Encoding"], ACCEPT_ENCODING)
+
+    def test_post(self):
+        self.transport.request("POST", f"{self.server.url}/chat/new",
+            data={"target_id": 2, "message": "hi there"},
+            headers={"X-Extra": "1"})
+        method, _, headers, body = self.server.requests[0]
+        self.assertEqual(method, "POST")
+        self.assertEqual(body, b"target_id=2&message=hi+there")
+        self.assertEqual(headers["Content-Type"],
+            "application/x-www-form-urlencoded")
+        self.assertEqual(headers["X-Extra"], "1")
+
+    def test_error_status(self):
+        self.server.response = (404, {}, b'{"error": null}')
+        r = self.transport.request("GET", f"{self.server.url}/users/3")
+        self.assertEqual(r.status_code, 404)
+
+    def test_connection_error(self):
+        url = self.server.url
+        self.server.stop()
+        with self.assertRaises(ConnectionError):
+            self.transport.request("GET", f"{url}/users/2")
+
+    def test_expired_token(self):
+        self.transport.authorize(SimpleNamespace(token=token("old", -1)))
+        with self.assertRaises(TokenExpiredError):
+            self.transport.request("GET", f"{self.server.url}/users/2")
+        self.assertEqual(self.server.requests, [])
+
+        self.transport.authorize(SimpleNamespace(token=token("new")))
+        self.transport.request("GET", f"{self.server.url}/users/2")
+        self.assertEqual(self.server.requests[0][2]["Authorization"],
+            "Bearer new")
+
+    def test_refresh(self):
+        self.server.response = (200, {"Content-Type": "application/json"},
+            b'{"id": 2}')
+        api, _ = make_api(lambda *args: (200, USER))
+        api.transport = self.transport
+        api.BASE_URL = self.server.url
+        # the token runs out just before the request
+        self.transport.authorize(SimpleNamespace(token=token("old", 5)))
+        new_session = SimpleNamespace(token=token("new"))
+        with patch.object(api, "_new_client_grant",
+            return_value=new_session):
+            api._send("GET", "/users/2", {}, {})
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0][2]["Authorization"],
+            "Bearer new")
+        self.assertIs(api.session, new_session)
+
+
+class TestUrllib3Transport(TransportTests, TestCase):
+    def make_transport(self):
+        return Urllib3Transport(timeout=5)
+
+
+@skipIf(httpx is None, "requires httpx")
+class TestHttpxTransport(TransportTests, TestCase):
+    def make_transport(self):
+        # http/2 is only negotiated over tls
+        return HttpxTransport(http2=False, timeout=5)